@@ -1,12 +1,14 @@
 import os
 import logging
-import time
-import gc
-import torch
-from dataclasses import dataclass
+import threading
+from dataclasses import asdict, dataclass
 from functools import wraps
-from typing import Optional, Union, List, Dict
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from typing import Optional, Union, List, Dict, Iterator
+from ..backends import create_backend
+from ..backends.base import to_messages
+from ..modules.cancellation import CancelToken, PipelineCancelled
+from ..modules.response_cache import ResponseCache, response_key
+from ..modules.stopping import StopSpec
 
 logging.basicConfig(
     level=logging.INFO,
@@ -23,10 +25,59 @@ class SPARConfig:
     temperature: float = 0.3
     do_sample: bool = True
     top_p: float = 0.8
-    test_timeout: int = 10
+    test_timeout: int = 10  # ceiling for one test; the adaptive timeout is usually much shorter
+    test_round_budget: float = 30.0  # wall-clock seconds for one run_tests round across all its tests
+    test_fail_fast: bool = True  # stop a round at its first failing test; the rest are reported as skipped
+    test_memory_mb: int = 1024  # address-space limit for a sandbox worker while it runs candidate code; 0 disables
+    test_cpu_seconds: int = 10  # CPU seconds one test may use; 0 disables
+    test_file_mb: int = 16  # largest file a test may write; 0 disables
+    test_allow_subprocesses: bool = False  # whether candidate code may start processes or threads
+    static_check: bool = True  # reject code with forbidden calls, undefined names, unbounded recursion or too-deep loops before testing
+    complexity_check: bool = True  # profile passing solutions against the prompt's stated complexity and size bound
+    profile_time_limit: float = 2.0  # seconds a solution may take at the stated size bound
+    profile_max_size: int = 100000  # largest input actually run; larger bounds are extrapolated
+    profile_budget: float = 20.0  # wall-clock seconds for one profiling run
     max_test_cases: int = 5
     similarity_threshold: float = 0.8
     reuse_similar_code: bool = True
+    max_batch_size: int = 4  # 1 disables the batching engine
+    batch_wait_ms: int = 10
+    batch_bucket_width: int = 64
+    executor_workers: int = 4
+    executor_queue_depth: int = 16
+    sandbox_workers: int = 4
+    sandbox_queue_depth: int = 32
+    sandbox_pool_size: int = 0  # pre-started test workers shared by all requests; 0 uses one per core, -1 starts a fresh process per run
+    sandbox_worker_max_jobs: int = 50  # jobs a test worker serves before it is replaced
+    test_cache_size: int = 4096  # (code, test) outcomes remembered across requests; 0 disables the test result cache
+    retry_after_seconds: int = 5
+    prefix_cache_mb: int = 1024  # 0 disables the system-prompt KV cache
+    model_roles: str = ""  # e.g. "chat=Qwen/Qwen1.5-7B-Chat"; unlisted roles use model_name
+    model_memory_budget_gb: float = 0.0  # 0 means unlimited
+    precision: str = "auto"  # auto (fp16 on GPU, fp32 on CPU), fp32, bf16 or int8 (dynamic, CPU)
+    load_report_tokens: int = 16  # tokens decoded for the load-time throughput report; 0 skips it
+    backend: str = "local"  # local (in-process HF model), replicas (pinned worker processes), ipc (model-server process), openai (OpenAI-compatible HTTP server) or mock
+    api_base: str = "http://localhost:8001/v1"
+    api_key: str = ""
+    api_model: str = ""  # empty uses the role's model name
+    api_timeout: float = 120.0
+    api_max_connections: int = 16
+    api_max_retries: int = 3
+    mock_latency_ms: int = 0  # synthetic per-request delay of the mock backend
+    mock_tokens_per_sec: float = 0.0  # synthetic decode rate of the mock backend; 0 is instantaneous
+    seed: int = -1  # pins sampling when >= 0; unseeded sampled generations skip the response cache
+    response_cache_size: int = 256  # in-memory entries; 0 disables the response cache
+    response_cache_dir: str = ""  # optional directory that persists cached responses across restarts
+    warmup_tokens: int = 0  # >0 runs one uncached generation of this many tokens per role at startup
+    snapshot_dir: str = ""  # cache of materialized safetensors snapshots loaded via mmap; empty disables
+    swap_drain_timeout: float = 300.0  # seconds a hot swap waits for in-flight requests on the old model
+    replicas: int = 2  # worker processes of the replicas backend
+    replica_threads: int = 0  # cores (and torch threads) per replica; 0 splits the available cores evenly
+    replica_interop_threads: int = 1
+    model_server_socket: str = "/tmp/spar-model-server.sock"  # Unix socket shared by the model server and ipc clients
+    model_server_backend: str = "local"  # backend the model server process runs
+    model_server_authkey: str = ""  # optional shared secret for the socket handshake
+    pipeline_timeout: float = 0.0  # default deadline in seconds for a full-pipeline request; 0 means none
 
     @classmethod
     def from_env(cls):
@@ -35,15 +86,76 @@ class SPARConfig:
             model_name=os.getenv("MODEL_NAME", cls.model_name),
             device=os.getenv("DEVICE", cls.device),
             test_timeout=int(os.getenv("TEST_TIMEOUT", str(cls.test_timeout))),
-            similarity_threshold=float(os.getenv("SIMILARITY_THRESHOLD", str(cls.similarity_threshold)))
+            test_round_budget=float(os.getenv("TEST_ROUND_BUDGET", str(cls.test_round_budget))),
+            test_fail_fast=os.getenv("TEST_FAIL_FAST", str(cls.test_fail_fast)).lower() in ("1", "true", "yes"),
+            test_memory_mb=int(os.getenv("TEST_MEMORY_MB", str(cls.test_memory_mb))),
+            test_cpu_seconds=int(os.getenv("TEST_CPU_SECONDS", str(cls.test_cpu_seconds))),
+            test_file_mb=int(os.getenv("TEST_FILE_MB", str(cls.test_file_mb))),
+            test_allow_subprocesses=os.getenv("TEST_ALLOW_SUBPROCESSES", str(cls.test_allow_subprocesses)).lower() in ("1", "true", "yes"),
+            static_check=os.getenv("STATIC_CHECK", str(cls.static_check)).lower() in ("1", "true", "yes"),
+            complexity_check=os.getenv("COMPLEXITY_CHECK", str(cls.complexity_check)).lower() in ("1", "true", "yes"),
+            profile_time_limit=float(os.getenv("PROFILE_TIME_LIMIT", str(cls.profile_time_limit))),
+            profile_max_size=int(os.getenv("PROFILE_MAX_SIZE", str(cls.profile_max_size))),
+            profile_budget=float(os.getenv("PROFILE_BUDGET", str(cls.profile_budget))),
+            similarity_threshold=float(os.getenv("SIMILARITY_THRESHOLD", str(cls.similarity_threshold))),
+            max_batch_size=int(os.getenv("MAX_BATCH_SIZE", str(cls.max_batch_size))),
+            batch_wait_ms=int(os.getenv("BATCH_WAIT_MS", str(cls.batch_wait_ms))),
+            batch_bucket_width=int(os.getenv("BATCH_BUCKET_WIDTH", str(cls.batch_bucket_width))),
+            executor_workers=int(os.getenv("EXECUTOR_WORKERS", str(cls.executor_workers))),
+            executor_queue_depth=int(os.getenv("EXECUTOR_QUEUE_DEPTH", str(cls.executor_queue_depth))),
+            sandbox_workers=int(os.getenv("SANDBOX_WORKERS", str(cls.sandbox_workers))),
+            sandbox_queue_depth=int(os.getenv("SANDBOX_QUEUE_DEPTH", str(cls.sandbox_queue_depth))),
+            sandbox_pool_size=int(os.getenv("SANDBOX_POOL_SIZE", str(cls.sandbox_pool_size))),
+            sandbox_worker_max_jobs=int(os.getenv("SANDBOX_WORKER_MAX_JOBS", str(cls.sandbox_worker_max_jobs))),
+            test_cache_size=int(os.getenv("TEST_CACHE_SIZE", str(cls.test_cache_size))),
+            retry_after_seconds=int(os.getenv("RETRY_AFTER_SECONDS", str(cls.retry_after_seconds))),
+            prefix_cache_mb=int(os.getenv("PREFIX_CACHE_MB", str(cls.prefix_cache_mb))),
+            model_roles=os.getenv("MODEL_ROLES", cls.model_roles),
+            model_memory_budget_gb=float(os.getenv("MODEL_MEMORY_BUDGET_GB", str(cls.model_memory_budget_gb))),
+            precision=os.getenv("PRECISION", cls.precision),
+            load_report_tokens=int(os.getenv("LOAD_REPORT_TOKENS", str(cls.load_report_tokens))),
+            # LLM_MODE=mock (see input_handler.LLMMode) also selects the mock backend
+            backend=os.getenv("SPAR_BACKEND") or ("mock" if os.getenv("LLM_MODE") == "mock" else cls.backend),
+            api_base=os.getenv("API_BASE", cls.api_base),
+            api_key=os.getenv("API_KEY", cls.api_key),
+            api_model=os.getenv("API_MODEL", cls.api_model),
+            api_timeout=float(os.getenv("API_TIMEOUT", str(cls.api_timeout))),
+            api_max_connections=int(os.getenv("API_MAX_CONNECTIONS", str(cls.api_max_connections))),
+            api_max_retries=int(os.getenv("API_MAX_RETRIES", str(cls.api_max_retries))),
+            mock_latency_ms=int(os.getenv("MOCK_LATENCY_MS", str(cls.mock_latency_ms))),
+            mock_tokens_per_sec=float(os.getenv("MOCK_TOKENS_PER_SEC", str(cls.mock_tokens_per_sec))),
+            seed=int(os.getenv("GENERATION_SEED", str(cls.seed))),
+            response_cache_size=int(os.getenv("RESPONSE_CACHE_SIZE", str(cls.response_cache_size))),
+            response_cache_dir=os.getenv("RESPONSE_CACHE_DIR", cls.response_cache_dir),
+            warmup_tokens=int(os.getenv("WARMUP_TOKENS", str(cls.warmup_tokens))),
+            snapshot_dir=os.getenv("MODEL_SNAPSHOT_DIR", cls.snapshot_dir),
+            swap_drain_timeout=float(os.getenv("SWAP_DRAIN_TIMEOUT", str(cls.swap_drain_timeout))),
+            replicas=int(os.getenv("REPLICAS", str(cls.replicas))),
+            replica_threads=int(os.getenv("REPLICA_THREADS", str(cls.replica_threads))),
+            replica_interop_threads=int(os.getenv("REPLICA_INTEROP_THREADS", str(cls.replica_interop_threads))),
+            model_server_socket=os.getenv("MODEL_SERVER_SOCKET", cls.model_server_socket),
+            model_server_backend=os.getenv("MODEL_SERVER_BACKEND", cls.model_server_backend),
+            model_server_authkey=os.getenv("MODEL_SERVER_AUTHKEY", cls.model_server_authkey),
+            pipeline_timeout=float(os.getenv("PIPELINE_TIMEOUT", str(cls.pipeline_timeout)))
         )
 
+    def model_for_role(self, role: str) -> str:
+        """Resolve a role name to a model name using model_roles, defaulting to model_name"""
+        for entry in self.model_roles.split(","):
+            key, _, value = entry.partition("=")
+            if key.strip() == role and value.strip():
+                return value.strip()
+        return self.model_name
+
 def handle_errors(func):
     """Error handling decorator"""
     @wraps(func)
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
+        except PipelineCancelled:
+            # Expected when a client goes away; not an error worth logging
+            raise
         except Exception as e:
             logger.error(f"Error in {func.__name__}: {str(e)}")
             raise
@@ -51,153 +163,167 @@ def handle_errors(func):
 
 class BaseAgent:
     """Lightweight wrapper to maintain compatibility with new agents"""
+    role = "code"
+
     def __init__(self, config):
         self.manager = LocalModelManager()
         self.config = config
-        self.manager.initialize(config)
+        self.manager.initialize(config, role=self.role)
 
-    def generate_content(self, prompt: Union[str, List[Dict[str, str]]], max_tokens: Optional[int] = None) -> str:
-        return self.manager.generate_content(prompt, max_tokens)
+    def generate_content(self, prompt: Union[str, List[Dict[str, str]]], max_tokens: Optional[int] = None, agent: Optional[str] = None, stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> str:
+        return self.manager.generate_content(prompt, max_tokens, agent=agent, role=self.role, stop=stop, cancel=cancel)
 
 class LocalModelManager:
-    """Singleton manager for local model (original implementation)"""
+    """
+    Singleton front-end for generation used by every agent.
+    The actual work is delegated to the backend selected by SPARConfig.backend
+    (in-process Hugging Face model or an OpenAI-compatible HTTP server).
+    """
     _instance = None
-    _model = None
-    _tokenizer = None
     _config = None
+    _backend = None
+    _response_cache = None
     _initialized = False
     _lock = None
 
+    DEFAULT_ROLE = "code"
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super().__new__(cls)
-            import threading
             cls._lock = threading.Lock()
         return cls._instance
 
     @handle_errors
-    def initialize(self, config: SPARConfig):
-        """Initialize the local model"""
+    def initialize(self, config: SPARConfig, role: Optional[str] = None):
+        """Create the configured backend once and prepare it for role"""
         with self._lock:
             if not self._initialized:
-                logger.info(f"Loading model: {config.model_name}")
-                
                 # Set memory optimization environment variables
                 os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
-                
-                # Clear any existing model from memory
-                if self._model is not None:
-                    del self._model
-                    self._model = None
-                if self._tokenizer is not None:
-                    del self._tokenizer
-                    self._tokenizer = None
-                
-                if torch.cuda.is_available() and config.device != "cpu":
-                    torch.cuda.empty_cache()
-                    gc.collect()
-                
-                self._tokenizer = AutoTokenizer.from_pretrained(
-                    config.model_name,
-                    trust_remote_code=True
-                )
-                
-                device_map = "auto" if config.device == "auto" and torch.cuda.is_available() else None
-                torch_dtype = torch.float16 if torch.cuda.is_available() and config.device != "cpu" else torch.float32
-                
-                # Add memory optimization settings with CPU offloading
-                if config.device == "cpu":
-                    max_memory = None
-                    device_map = None
-                else:
-                    if torch.cuda.is_available():
-                        gpu_total_mem = torch.cuda.get_device_properties(0).total_memory
-                        gpu_mem_gb = int(gpu_total_mem / 1024**3 * 0.9)
-                        max_memory = {0: f"{gpu_mem_gb}GB", "cpu": "32GB"}
-                        device_map = "auto"
-                    else:
-                        max_memory = None
-                        device_map = None
-
-                self._model = AutoModelForCausalLM.from_pretrained(
-                    config.model_name,
-                    torch_dtype=torch_dtype,
-                    device_map=device_map,
-                    trust_remote_code=True,
-                    low_cpu_mem_usage=True,
-                    max_memory=max_memory,
-                    offload_folder="offload"
-                )
-                
+                logger.info(f"Using generation backend: {config.backend}")
+                self._backend = create_backend(config)
+                if config.response_cache_size > 0:
+                    self._response_cache = ResponseCache(config.response_cache_size, config.response_cache_dir)
                 self._config = config
                 self._initialized = True
-                logger.info("Model loaded successfully")
-            
-            return self._model, self._tokenizer
+        self._backend.initialize(role or self.DEFAULT_ROLE)
 
     @handle_errors
-    def generate_content(self, prompt: Union[str, List[Dict[str, str]]], max_tokens: Optional[int] = None) -> str:
-        """Generate content using the local model"""
-        if self._model is None or self._tokenizer is None:
-            logger.error("Model or tokenizer not initialized")
+    def generate_content(self, prompt: Union[str, List[Dict[str, str]]], max_tokens: Optional[int] = None, agent: Optional[str] = None, role: Optional[str] = None, stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> str:
+        """
+        Generate content with the model serving role.
+        agent names the caller; the local backend uses it to key its system-prefix KV cache.
+        stop ends decoding once the caller's useful output is complete.
+        cancel is checked between tokens; once it fires PipelineCancelled is raised.
+        """
+        if not self._initialized:
+            logger.error("Model manager not initialized")
             raise RuntimeError("Model not initialized")
         
+        if cancel is not None:
+            cancel.raise_if_cancelled()
         max_tokens = max_tokens or self._config.max_new_tokens
+        role = role or self.DEFAULT_ROLE
+        key = self._cache_key(prompt, max_tokens, role, stop)
+        if key is not None:
+            cached = self._response_cache.get(key)
+            if cached is not None:
+                logger.info(f"Response cache hit for {agent or role}")
+                return cached
+
         logger.info(f"Generating content with prompt length: {len(prompt)}")
-        
-        # Handle string or list of messages
-        if isinstance(prompt, list):
-            text = self._tokenizer.apply_chat_template(
-                prompt,
-                tokenize=False,
-                add_generation_prompt=True
-            )
-        else:
-            messages = [{"role": "user", "content": prompt}]
-            text = self._tokenizer.apply_chat_template(
-                messages,
-                tokenize=False,
-                add_generation_prompt=True
-            )
-        
-        model_inputs = self._tokenizer([text], return_tensors="pt").to(self._model.device)
-        
-        with torch.no_grad():
-            generated_ids = self._model.generate(
-                input_ids=model_inputs.input_ids,
-                attention_mask=model_inputs.attention_mask,
-                max_new_tokens=max_tokens,
-                temperature=self._config.temperature,
-                do_sample=self._config.do_sample,
-                top_p=self._config.top_p,
-                pad_token_id=self._tokenizer.eos_token_id
-            )
-        
-        generated_ids = [
-            output_ids[len(input_ids):] for input_ids, output_ids in zip(model_inputs.input_ids, generated_ids)
-        ]
-        
-        response = self._tokenizer.batch_decode(generated_ids, skip_special_tokens=True)[0]
-        
-        if torch.cuda.is_available() and self._config.device != "cpu":
-            torch.cuda.empty_cache()
-            gc.collect()
-            for _ in range(3):
-                gc.collect()
-        
+        response = self._backend.generate(prompt, max_tokens, agent=agent, role=role, stop=stop, cancel=cancel)
+        if cancel is not None:
+            # A cancelled backend returns whatever it had decoded; never use or cache that
+            cancel.raise_if_cancelled()
+        if stop is not None:
+            response = stop.trim(response)
+        response = response.strip()
         logger.info(f"Generated response length: {len(response)}")
-        return response.strip()
+        if key is not None:
+            self._response_cache.put(key, response)
+        return response
+
+    def stream_content(self, prompt: Union[str, List[Dict[str, str]]], max_tokens: Optional[int] = None, agent: Optional[str] = None, role: Optional[str] = None, stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        """Generate content incrementally, yielding decoded text chunks as they are produced"""
+        if not self._initialized:
+            logger.error("Model manager not initialized")
+            raise RuntimeError("Model not initialized")
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        
+        max_tokens = max_tokens or self._config.max_new_tokens
+        role = role or self.DEFAULT_ROLE
+        key = self._cache_key(prompt, max_tokens, role, stop)
+        if key is not None:
+            cached = self._response_cache.get(key)
+            if cached is not None:
+                logger.info(f"Response cache hit for {agent or role}")
+                yield cached
+                return
+
+        logger.info(f"Streaming content with prompt length: {len(prompt)}")
+        text = ""
+        chunks = self._backend.stream(prompt, max_tokens, agent=agent, role=role, stop=stop, cancel=cancel)
+        try:
+            for chunk in chunks:
+                if cancel is not None:
+                    cancel.raise_if_cancelled()
+                end = stop.find_end(text + chunk) if stop is not None else None
+                if end is not None:
+                    # Hand out the remainder up to the cut, then abandon the backend stream
+                    if end > len(text):
+                        yield (text + chunk)[len(text):end]
+                    text = (text + chunk)[:end]
+                    break
+                text += chunk
+                yield chunk
+        finally:
+            chunks.close()
+        if cancel is not None:
+            cancel.raise_if_cancelled()
+        # Only a stream consumed to its end is a complete response worth caching
+        if key is not None:
+            self._response_cache.put(key, (stop.trim(text) if stop is not None else text).strip())
+
+    def _cache_key(self, prompt: Union[str, List[Dict[str, str]]], max_tokens: int, role: str, stop: Optional[StopSpec]) -> Optional[str]:
+        """Content address of a request, or None when the response cache must not serve it"""
+        if self._response_cache is None:
+            return None
+        config = self._config
+        if config.do_sample and config.seed < 0:
+            # Unseeded sampling is meant to vary between calls
+            self._response_cache.record_bypass()
+            return None
+        return response_key(
+            backend=self._backend.name,
+            model=self._backend.model_name(role),
+            messages=to_messages(prompt),
+            max_tokens=max_tokens,
+            temperature=config.temperature,
+            top_p=config.top_p,
+            do_sample=config.do_sample,
+            seed=config.seed if config.do_sample else None,
+            stop=asdict(stop) if stop is not None else None
+        )
+
+    def warmup(self, roles: List[str], max_tokens: int):
+        """Run one short generation per role, bypassing the response cache, so the first real request is not the slow one"""
+        if not self._initialized:
+            raise RuntimeError("Model not initialized")
+        for role in roles:
+            self._backend.generate("Hello", max_tokens, agent="warmup", role=role)
 
     def is_initialized(self) -> bool:
-        """Check if model is initialized"""
-        return self._model is not None and self._tokenizer is not None
-
-    def clear_cache(self):
-        """Clear GPU cache and memory"""
-        if torch.cuda.is_available() and self._config.device != "cpu":
-            torch.cuda.empty_cache()
-        gc.collect()
-        for _ in range(5):
-            gc.collect()
-        if hasattr(torch, 'cuda') and torch.cuda.is_available() and self._config.device != "cpu":
-            torch.cuda.synchronize()
\ No newline at end of file
+        """Check if the manager has a backend that can serve requests"""
+        return self._initialized and self._backend.is_ready()
+
+    def backend_stats(self) -> Dict[str, object]:
+        """Return the active backend's counters"""
+        if not self._initialized:
+            return {}
+        stats = {"backend": self._backend.name, **self._backend.stats()}
+        if self._response_cache is not None:
+            stats["response_cache"] = self._response_cache.stats()
+        return stats
@@ -1,23 +1,28 @@
 import re
 import ast
 import logging
-from typing import Optional
+from typing import Callable, Optional
 from .base_agent import LocalModelManager, handle_errors, SPARConfig
+from ..modules.cancellation import CancelToken, PipelineCancelled
+from ..modules.stopping import StopSpec
 
 logger = logging.getLogger(__name__)
 
 class CodeAgent:
     """Agent responsible for generating Python code solutions"""
+    role = "code"
+    # Only the first fenced block is extracted, so decoding ends at its closing fence
+    stop_spec = StopSpec(stop_on_fence=True)
     
     def __init__(self, config: SPARConfig):
         self.config = config
         self.model_manager = LocalModelManager()
-        self.model_manager.initialize(config)
+        self.model_manager.initialize(config, role=self.role)
         logger.info("CodeAgent initialized")
 
     @handle_errors
-    def generate_code(self, problem: str, signature: Optional[str] = None) -> str:
-        """Generate code solution for the given problem"""
+    def generate_code(self, problem: str, signature: Optional[str] = None, on_token: Optional[Callable[[str], None]] = None, cancel: Optional[CancelToken] = None) -> str:
+        """Generate code solution for the given problem; on_token receives streamed text chunks"""
         # Use provided signature or default one
         if not signature:
             signature = "def solution(*args, **kwargs):\n    pass"
@@ -55,12 +60,21 @@ Example format:
         ]
 
         try:
-            response = self.model_manager.generate_content(prompt)
+            if on_token:
+                chunks = []
+                for chunk in self.model_manager.stream_content(prompt, agent="code_agent", role=self.role, stop=self.stop_spec, cancel=cancel):
+                    chunks.append(chunk)
+                    on_token(chunk)
+                response = "".join(chunks).strip()
+            else:
+                response = self.model_manager.generate_content(prompt, agent="code_agent", role=self.role, stop=self.stop_spec, cancel=cancel)
             code = self._extract_code_from_response(response)
             if not code:
                 logger.warning("No valid code extracted from response")
                 return ""
             return code
+        except PipelineCancelled:
+            raise
         except Exception as e:
             logger.error(f"Code generation failed: {e}")
             return ""
@@ -1,11 +1,13 @@
 import logging
 import time
 import re
-from typing import Dict
+from typing import Any, Callable, Dict, List, Optional
 from .code_agent import CodeAgent
 from .tester_agent import TesterAgent
 from .self_debugger import SelfDebugger
 from .prompt_refiner import PromptRefinerAgent
+from ..modules.cancellation import CancelToken, PipelineCancelled
+from ..sandbox import combine_usage
 
 logger = logging.getLogger(__name__)
 
@@ -19,7 +21,8 @@ class MainSolutionSystem:
     def _is_valid_signature(self, signature: str) -> bool:
         return bool(signature and re.match(r"def\s+\w+\s*\(.*\)\s*->\s*\w+:", signature))
 
-    def _prepare_result(self, problem: str, code: str, code_source: str, code_time: float, test_time: float, test_results: Dict, start_time: float) -> Dict[str, any]:
+    def _prepare_result(self, problem: str, code: str, code_source: str, code_time: float, test_time: float, test_results: Dict, start_time: float, test_rounds: Optional[List[Dict]] = None) -> Dict[str, any]:
+        """test_rounds are the results of every run_tests call, rolled up into resource_usage"""
         return {
             "problem": problem,
             "code": code,
@@ -28,11 +31,19 @@ class MainSolutionSystem:
             "code_time": code_time,
             "test_time": test_time,
             "total_time": time.time() - start_time,
+            "resource_usage": combine_usage([r["resource_usage"] for r in test_rounds or [] if "resource_usage" in r]),
             "similar_solutions_found": 0,
             "best_similarity": 0.0
         }
 
-    def solve_problem(self, problem: str, refined_prompt: str = None, signature: str = None, edge_cases: str = None) -> Dict[str, any]:
+    def solve_problem(self, problem: str, refined_prompt: str = None, signature: str = None, edge_cases: str = None, on_event: Optional[Callable[[str, Dict[str, Any]], None]] = None, cancel: Optional[CancelToken] = None) -> Dict[str, any]:
+        """
+        Run code generation, testing and the debug loop for a problem.
+        on_event(event, data) is called as each stage makes progress (used for streaming).
+        Raises PipelineCancelled at the next checkpoint once cancel fires.
+        """
+        emit = on_event or (lambda event, data: None)
+        checkpoint = cancel.raise_if_cancelled if cancel is not None else (lambda: None)
         print(f"\n{'='*80}")
         print(f"Problem: {problem}")
         print('='*80)
@@ -59,9 +70,13 @@ class MainSolutionSystem:
             logger.info(f"Prompt received by TUA: {problem}")
             from .task_understanding_agent import generate_structured_prompt
             tua_result = generate_structured_prompt({"original_prompt": problem, "language": "python"})
+            emit("tua", tua_result)
             from .subtask_distributor import run_subtask_distributor
-            std_result = run_subtask_distributor(tua_result["structured_prompt"])
-            refined_prompts = self.prompt_refiner.refine(tua_result, std_result)["refined_prompts"]
+            std_result = run_subtask_distributor(tua_result["structured_prompt"], cancel=cancel)
+            emit("std", std_result)
+            checkpoint()
+            refined_prompts = self.prompt_refiner.refine(tua_result, std_result, cancel=cancel)["refined_prompts"]
+            emit("pra", {"refined_prompts": refined_prompts})
             if not refined_prompts or not refined_prompts[0]["refined_prompt"].strip():
                 logger.error("No valid refined prompt generated, falling back to default")
                 fallback_sig = signature or tua_result.get("signature", "def solution(*args, **kwargs):")
@@ -92,12 +107,20 @@ class MainSolutionSystem:
         
         generation_start = time.time()
         try:
-            code = self.code_agent.generate_code(code_prompt, signature=signature)
+            code = self.code_agent.generate_code(
+                code_prompt,
+                signature=signature,
+                on_token=(lambda chunk: emit("code_token", {"text": chunk})) if on_event else None,
+                cancel=cancel
+            )
             logger.info(f"Generated code: {code}")
+        except PipelineCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error in code generation: {str(e)}")
             code = f"# Fallback: Error generating code - {str(e)}\npass"
         code_time = time.time() - generation_start
+        emit("code", {"code": code, "code_time": code_time})
         
         if not code.strip():
             logger.error("No valid code generated")
@@ -110,15 +133,26 @@ class MainSolutionSystem:
         
         print("\n--- Generated Test Cases ---")
         test_start = time.time()
-        test_cases = self.tester.generate_tests(problem, code, edge_cases, tua_result.get("constraints", "Not specified"))
+        test_cases = self.tester.generate_tests(problem, code, edge_cases, tua_result.get("constraints", "Not specified"), cancel=cancel)
         for i, test in enumerate(test_cases, 1):
             print(f"{i}. {test}")
+        emit("tests", {"test_cases": test_cases})
         
         if not test_cases:
             print("\n--- Test Generation Failed ---")
             test_results = {"status": "error", "error": "No tests generated", "passed": 0, "total": 0}
             return self._prepare_result(problem, code, "generated", code_time, 0, test_results, start_time)
         
+        constraints = tua_result.get("constraints", "Not specified")
+        if constraints == "Not specified":
+            from ..modules.input_handler import extract_constraints
+            constraints = extract_constraints(problem)
+
+        # Parsed once; every debug attempt re-runs the same records
+        test_ir = self.tester.parse_tests(test_cases)
+        test_rounds = []
+        test_results = None
+
         # Iterative debug loop (max 3 attempts)
         max_attempts = 3
         attempt = 0
@@ -126,17 +160,43 @@ class MainSolutionSystem:
         previous_error = ""
         repeat_count = 0
         while attempt < max_attempts:
-            test_results = self.tester.run_tests(current_code, test_cases)
+            checkpoint()
+            test_results = self.tester.run_tests(
+                current_code,
+                test_ir,
+                on_result=lambda result: emit("test_result", {"attempt": attempt + 1, **result}),
+                cancel=cancel,
+                constraints=constraints,
+                # Fixed code re-runs the previous round's failures first
+                previous=test_results
+            )
+            test_rounds.append(test_results)
             test_time = time.time() - test_start
             
             # Add attempts to test_results for UI tracking
             test_results["attempts"] = attempt + 1
+            emit("test_round", {
+                "attempt": attempt + 1,
+                "status": test_results["status"],
+                "passed": test_results["passed"],
+                "total": test_results["total"],
+                "executed": len(test_results.get("executed_tests", [])),
+                "skipped": len(test_results.get("skipped_tests", []))
+            })
             
             if test_results['status'] == 'pass':
                 print("\n--- Test Results ---")
                 print(f"Status: {test_results['status']}")
                 print(f"Tests Passed: {test_results['passed']}/{test_results['total']}")
-                return self._prepare_result(problem, current_code, "generated", code_time, test_time, test_results, start_time)
+                checkpoint()
+                complexity = self.tester.check_complexity(current_code, signature, constraints, cancel=cancel)
+                test_results["complexity"] = complexity
+                emit("complexity", complexity)
+                print(f"Complexity: {complexity['verdict']} ({complexity['reason']})")
+                if complexity["verdict"] != "fail" or attempt + 1 >= max_attempts:
+                    return self._prepare_result(problem, current_code, "generated", code_time, test_time, test_results, start_time, test_rounds)
+                # Correct but too slow: debug it like a failing test
+                test_results["error"] = f"Performance requirement not met: {complexity['reason']}"
             
             print("\n--- Test Results ---")
             print(f"Status: {test_results['status']}")
@@ -154,14 +214,21 @@ class MainSolutionSystem:
                 repeat_count = 0
             previous_error = current_error
             
+            checkpoint()
             print(f"\n--- Attempting Debug (Attempt {attempt + 1}/{max_attempts}) ---")
             debug_result = self.debugger({
                 "problem": f"{problem}. Always return the integer sum of two numbers a and b as the result. Handle invalid inputs (e.g., None or non-integer) by raising ValueError only. Do not return boolean values.",
                 "code": current_code,
                 "error": current_error,
                 "test_results": test_results
-            })
+            }, cancel=cancel)
             
+            emit("debug_attempt", {
+                "attempt": attempt + 1,
+                "success": debug_result["success"],
+                "explanation": debug_result.get("debug_explanation", ""),
+                "fixed_code": debug_result.get("fixed_code", "")
+            })
             if debug_result['success']:
                 print(f"\n--- Debug Successful (Attempt {attempt + 1}) ---")
                 print(f"Explanation: {debug_result['debug_explanation']}")
@@ -193,10 +260,19 @@ class MainSolutionSystem:
             )
             print("\n--- Refined Prompt ---")
             print(refined_prompt)
+            emit("refinement", {"refined_prompt": refined_prompt})
             print("\n--- Generating Code with Refined Prompt ---")
-            refined_code = self.code_agent.generate_code(refined_prompt, signature="def solution(a, b):")
-            refined_test_cases = self.tester.generate_tests(problem, refined_code, edge_cases, tua_result.get("constraints", "Not specified"))
-            refined_test_results = self.tester.run_tests(refined_code, refined_test_cases)
+            checkpoint()
+            refined_code = self.code_agent.generate_code(refined_prompt, signature="def solution(a, b):", cancel=cancel)
+            refined_test_cases = self.tester.generate_tests(problem, refined_code, edge_cases, tua_result.get("constraints", "Not specified"), cancel=cancel)
+            refined_test_results = self.tester.run_tests(
+                refined_code,
+                refined_test_cases,
+                on_result=lambda result: emit("test_result", {"attempt": "refined", **result}),
+                cancel=cancel,
+                constraints=constraints
+            )
+            test_rounds.append(refined_test_results)
             return self._prepare_result(
                 problem,
                 refined_code,
@@ -204,7 +280,8 @@ class MainSolutionSystem:
                 code_time + (time.time() - test_start),
                 time.time() - test_start,
                 refined_test_results,
-                start_time
+                start_time,
+                test_rounds
             )
         
         # Return with debug failure if no refinement needed
@@ -215,5 +292,6 @@ class MainSolutionSystem:
             code_time,
             test_time,
             test_results,
-            start_time
+            start_time,
+            test_rounds
         )
\ No newline at end of file
@@ -2,6 +2,7 @@ import os
 import logging
 from jinja2 import Template
 from .base_agent import SPARConfig, LocalModelManager
+from ..modules.cancellation import PipelineCancelled
 
 # Configure logging
 logging.basicConfig(
@@ -22,11 +23,13 @@ PROMPT_TEMPLATE = """
 """
 
 class PromptRefinerAgent:
+    role = "chat"
+
     def __init__(self, config: SPARConfig = None):
         self.config = config or SPARConfig.from_env()
         self.template = Template(PROMPT_TEMPLATE)
         self.model_manager = LocalModelManager()
-        self.model_manager.initialize(self.config)
+        self.model_manager.initialize(self.config, role=self.role)
 
     def _template_prompt(self, tua, std, subtask_desc=None):
         prompt = self.template.render(
@@ -46,7 +49,7 @@ class PromptRefinerAgent:
         return prompt
 
     # In prompt_refiner.py, update _llm_polish
-    def _llm_polish(self, prompt):
+    def _llm_polish(self, prompt, cancel=None):
         if not self.model_manager.is_initialized():
             logger.warning("Model not initialized, returning unpolished prompt")
             return prompt
@@ -59,19 +62,25 @@ class PromptRefinerAgent:
             "- Ready for a code LLM to generate a robust solution\n"
             "- Do NOT include the actual code implementation or test cases; only describe what the solution should do."
         )
-        full_prompt = f"{system_prompt}\n\n{prompt}"
+        # Keep the instructions in a system turn so their KV state is shared across calls
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
         try:
-            polished = self.model_manager.generate_content(full_prompt, max_tokens=512)
+            polished = self.model_manager.generate_content(messages, max_tokens=512, agent="prompt_refiner", role=self.role, cancel=cancel)
             logger.info(f"Polished prompt generated: {polished.strip()}")
             if not polished.strip():
                 logger.warning("Polished prompt is empty, using base prompt")
                 return prompt
             return polished.strip()
+        except PipelineCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error in LLM polish: {str(e)}")
             return prompt
 
-    def refine(self, tua, std):
+    def refine(self, tua, std, cancel=None):
         try:
             logger.info(f"TUA input: {tua}")
             logger.info(f"STD input: {std}")
@@ -100,7 +109,7 @@ class PromptRefinerAgent:
             # For SIMPLE or no subtasks, generate a single refined prompt
             if classification == "SIMPLE" or not std.get("subtasks"):
                 base_prompt = self._template_prompt(tua, std)
-                polished = self._llm_polish(base_prompt)
+                polished = self._llm_polish(base_prompt, cancel)
                 return {"refined_prompts": [{"subtask": "Complete Solution", "refined_prompt": polished}]}
 
             # For COMPLEX: generate prompts for each subtask
@@ -108,13 +117,15 @@ class PromptRefinerAgent:
             for i, sub in enumerate(std.get("subtasks", []), 1):
                 subtask_desc = sub.get("description", "")
                 base_prompt = self._template_prompt(tua, std, subtask_desc)
-                polished = self._llm_polish(base_prompt)
+                polished = self._llm_polish(base_prompt, cancel)
                 prompts.append({
                     "subtask": f"Step {i}: {subtask_desc}",
                     "refined_prompt": polished
                 })
             return {"refined_prompts": prompts}
 
+        except PipelineCancelled:
+            raise
         except Exception as e:
             logger.error(f"Error in PromptRefinerAgent.refine: {str(e)}")
             return {
@@ -2,13 +2,21 @@ import logging
 import re
 from typing import Dict, Any, Optional
 from .base_agent import LocalModelManager, SPARConfig
+from ..modules.cancellation import CancelToken, PipelineCancelled
+from ..modules.stopping import StopSpec
 import yaml
 
 class SelfDebugger:
+    role = "code"
+    # The fixed code block plus its one-line explanation, in either order
+    stop_spec = StopSpec(
+        end_pattern=r"```(?:python)?\n.*?```\s*Explanation:[^\n]*\n|Explanation:.*?```(?:python)?\n.*?```"
+    )
+
     def __init__(self, config: Optional[SPARConfig] = None):
         self.config = config or SPARConfig.from_env()
         self.model_manager = LocalModelManager()
-        self.model_manager.initialize(self.config)
+        self.model_manager.initialize(self.config, role=self.role)
         self.logger = logging.getLogger("SelfDebugger")
         if not self.logger.hasHandlers():
             handler = logging.StreamHandler()
@@ -35,7 +43,7 @@ class SelfDebugger:
         text = re.sub(r'\n\s*\n', '\n\n', text)
         return text.strip()
 
-    def _llm_prompt(self, code: str, error: str, test_results: Dict[str, Any]) -> str:
+    def _llm_prompt(self, code: str, error: str, test_results: Dict[str, Any], cancel: Optional[CancelToken] = None) -> str:
         """Generate a prompt for the LLM to debug the code based on test errors."""
         if not self.model_manager.is_initialized():
             self.logger.error("Model not initialized. Cannot generate LLM response.")
@@ -72,9 +80,11 @@ class SelfDebugger:
         self.logger.info("Prompting LLM for code debugging...")
         
         try:
-            result = self.model_manager.generate_content(prompt)
+            result = self.model_manager.generate_content(prompt, agent="self_debugger", role=self.role, stop=self.stop_spec, cancel=cancel)
             self.logger.info("LLM response received.")
             return self._clean_text(result)
+        except PipelineCancelled:
+            raise
         except Exception as e:
             self.logger.error(f"Error in LLM prompt: {e}")
             return f"Error generating response: {str(e)}"
@@ -106,7 +116,7 @@ class SelfDebugger:
         match = re.search(r'(?i)(TypeError|ValueError|TimeoutError|IndexError|KeyError|AttributeError)', error)
         return match.group(1) if match else "UnknownError"
 
-    def __call__(self, input_dict: Dict[str, Any]) -> Dict[str, Any]:
+    def __call__(self, input_dict: Dict[str, Any], cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
         """Debug the code based on test results and errors."""
         try:
             code = input_dict.get("code", "")
@@ -133,7 +143,7 @@ class SelfDebugger:
                     "success": True
                 }
             
-            llm_output = self._llm_prompt(code, error, test_results)
+            llm_output = self._llm_prompt(code, error, test_results, cancel)
             
             code_match = re.search(r'```python\n(.*?)```', llm_output, re.DOTALL)
             fixed_code = code_match.group(1).strip() if code_match else code
@@ -147,6 +157,8 @@ class SelfDebugger:
                 "success": bool(code_match)
             }
             
+        except PipelineCancelled:
+            raise
         except Exception as e:
             self.logger.error(f"Error in __call__: {e}")
             return {
@@ -1,12 +1,22 @@
 import logging
 import re
+import threading
 from .base_agent import LocalModelManager, SPARConfig
+from ..modules.cancellation import PipelineCancelled
+from ..modules.stopping import StopSpec
 
 class SubtaskDistributor:
+    role = "chat"
+    # SIMPLE ends with the Explanation paragraph; COMPLEX with the blank line after its steps
+    stop_spec = StopSpec(
+        end_pattern=r"Classification:\s*SIMPLE\b.*?Explanation:.*?\n[ \t]*\n|Subtasks:[ \t]*\n(?:[ \t]*Step\s+\d+:[^\n]*\n)+[ \t]*\n",
+        stop_strings=("\nDSA Problem:",)
+    )
+
     def __init__(self):
         self.config = SPARConfig.from_env()
         self.model_manager = LocalModelManager()
-        self.model_manager.initialize(self.config)
+        self.model_manager.initialize(self.config, role=self.role)
         self.logger = logging.getLogger("SubtaskDistributor")
         if not self.logger.hasHandlers():
             handler = logging.StreamHandler()
@@ -31,7 +41,7 @@ class SubtaskDistributor:
         text = re.sub(r'\n\s*\n', '\n\n', text)
         return text.strip()
 
-    def _llm_prompt(self, structured_prompt: str) -> str:
+    def _llm_prompt(self, structured_prompt: str, cancel=None) -> str:
         if not self.model_manager.is_initialized():
             self.logger.error("Model not initialized. Cannot generate LLM response.")
             return "Error: Model not initialized."
@@ -68,16 +78,18 @@ class SubtaskDistributor:
         self.logger.info("Prompting LLM for classification and decomposition...")
         
         try:
-            result = self.model_manager.generate_content(prompt)
+            result = self.model_manager.generate_content(prompt, agent="subtask_distributor", role=self.role, stop=self.stop_spec, cancel=cancel)
             self.logger.info("LLM response received.")
             clean_response = self._extract_assistant_response(result)
             self.logger.info(f"Cleaned response: {clean_response[:100]}...")
             return clean_response
+        except PipelineCancelled:
+            raise
         except Exception as e:
             self.logger.error(f"Error in LLM prompt: {e}")
             return f"Error generating response: {str(e)}"
 
-    def __call__(self, input_dict):
+    def __call__(self, input_dict, cancel=None):
         try:
             structured_prompt = input_dict.get("structured_prompt", "")
             if not structured_prompt:
@@ -90,7 +102,7 @@ class SubtaskDistributor:
                     "explanation": "Model not initialized. Cannot classify or decompose.",
                     "subtasks": None
                 }
-            llm_output = self._llm_prompt(structured_prompt)
+            llm_output = self._llm_prompt(structured_prompt, cancel)
             
             if not isinstance(llm_output, str):
                 llm_output = str(llm_output)
@@ -128,6 +140,8 @@ class SubtaskDistributor:
                 "explanation": explanation,
                 "subtasks": subtasks if subtasks else None
             }
+        except PipelineCancelled:
+            raise
         except Exception as e:
             self.logger.error(f"Error in __call__: {e}")
             return {
@@ -137,7 +151,16 @@ class SubtaskDistributor:
                 "subtasks": None
             }
 
-agent = SubtaskDistributor()
+_agent = None
+_agent_lock = threading.Lock()
+
+def get_agent() -> SubtaskDistributor:
+    """Shared SubtaskDistributor, created on first use so importing this module never loads a model"""
+    global _agent
+    with _agent_lock:
+        if _agent is None:
+            _agent = SubtaskDistributor()
+    return _agent
 
-def run_subtask_distributor(structured_prompt: str):
-    return {"std_result": agent({"structured_prompt": structured_prompt})}
\ No newline at end of file
+def run_subtask_distributor(structured_prompt: str, cancel=None):
+    return {"std_result": get_agent()({"structured_prompt": structured_prompt}, cancel=cancel)}
\ No newline at end of file
@@ -4,9 +4,7 @@ from typing import Dict
 import os
 import re
 import difflib
-import nltk
-from nltk.stem import WordNetLemmatizer
-nltk.download('wordnet', quiet=True)
+import threading
 import logging
 
 logging.basicConfig(level=logging.INFO)
@@ -14,14 +12,46 @@ logger = logging.getLogger(__name__)
 
 TEMPLATE_REGISTRY_PATH = os.path.join(os.path.dirname(__file__), '../templates/template_registry.yaml')
 
-lemmatizer = WordNetLemmatizer()
+_lemmatizer = None
+_lemmatizer_lock = threading.Lock()
+
+def _identity_lemmatize(word: str) -> str:
+    return word
+
+def get_lemmatizer():
+    """
+    Return the WordNet lemmatize function, importing nltk and fetching the corpus on first use.
+    main._startup() calls it, so the fetch happens before the service reports ready. Set
+    NLTK_DOWNLOAD=0 on offline hosts: a missing corpus then falls back to unlemmatized words
+    instead of stalling startup on the network.
+    """
+    global _lemmatizer
+    with _lemmatizer_lock:
+        if _lemmatizer is None:
+            try:
+                import nltk
+                from nltk.stem import WordNetLemmatizer
+                try:
+                    nltk.data.find('corpora/wordnet')
+                except LookupError:
+                    if os.getenv("NLTK_DOWNLOAD", "1") != "1":
+                        raise
+                    nltk.download('wordnet', quiet=True)
+                lemmatizer = WordNetLemmatizer()
+                lemmatizer.lemmatize("warmup")
+                _lemmatizer = lemmatizer.lemmatize
+            except Exception as e:
+                logger.warning(f"WordNet lemmatizer unavailable, matching unlemmatized keywords: {str(e)}")
+                _lemmatizer = _identity_lemmatize
+    return _lemmatizer
 
 def load_templates() -> dict:
     with open(TEMPLATE_REGISTRY_PATH, 'r', encoding='utf-8') as f:
         return yaml.safe_load(f)
 
 def _normalize(text: str) -> str:
-    return ' '.join([lemmatizer.lemmatize(w) for w in re.findall(r'\w+', text.lower())])
+    lemmatize = get_lemmatizer()
+    return ' '.join([lemmatize(w) for w in re.findall(r'\w+', text.lower())])
 
 def _count_keyword_hits(prompt: str, method_keywords: dict) -> dict:
     prompt_lower = prompt.lower()
@@ -1,18 +1,37 @@
 import logging
-import subprocess
-import tempfile
-import os
-from typing import List, Dict, Any
+import re
+from typing import List, Dict, Any, Callable, Optional, Union
 from .base_agent import BaseAgent
+from ..modules.cancellation import CancelToken
+from ..modules.stopping import StopSpec
+from ..sandbox import (
+    SKIPPED_AFTER_FAILURE,
+    ResourceLimits,
+    TestBudget,
+    TestCase,
+    check_code,
+    get_pool,
+    get_test_cache,
+    parse_tests,
+    profile_complexity,
+    resource_usage,
+    run_in_sandbox,
+    source_key
+)
 
 logger = logging.getLogger(__name__)
 
+REJECTED_BY_ANALYSIS = "Not run: code rejected by static analysis"
+
 class TesterAgent(BaseAgent):
+    # Only the first five assert lines are kept
+    stop_spec = StopSpec(line_pattern=r"\s*assert", max_lines=5)
+
     def __init__(self, config):
         super().__init__(config)
         self.config = config
 
-    def generate_tests(self, problem: str, code: str, edge_cases: str, constraints: str) -> List[str]:
+    def generate_tests(self, problem: str, code: str, edge_cases: str, constraints: str, cancel: Optional[CancelToken] = None) -> List[str]:
         prompt = (
             f"""Generate exactly 5 test cases for this Python function:\n\n"
             f"Problem: {problem or 'The problem description is provided above.'}\n\n"
@@ -27,89 +46,151 @@ class TesterAgent(BaseAgent):
             f"- Return only the assert statements, one per line\n\n"
             f"Test cases:"""
         )
-        response = self.generate_content(prompt)  # Use inherited generate_content
+        response = self.generate_content(prompt, agent="tester_agent", stop=self.stop_spec, cancel=cancel)  # Use inherited generate_content
         test_cases = [line.strip() for line in response.split("\n") if line.strip() and line.strip().startswith("assert")]
         return test_cases[:5]  # Ensure exactly 5 tests
 
     @staticmethod
-    def _is_valid_syntax(test_case: str) -> bool:
-        try:
-            compile(test_case, "<string>", "exec")
-            return True
-        except SyntaxError:
-            return False
-
-    def run_tests(self, code: str, test_cases: List[str]) -> Dict[str, Any]:
+    def parse_tests(test_cases: List[Union[str, Dict[str, Any], TestCase]]) -> List[TestCase]:
+        """Parse raw assert lines (or API records) into deduplicated TestCases; invalid lines are dropped"""
+        return parse_tests(test_cases)
+
+    def run_tests(self, code: str, test_cases: List[Union[str, Dict[str, Any], TestCase]], on_result: Optional[Callable[[Dict[str, Any]], None]] = None, cancel: Optional[CancelToken] = None, constraints: str = "", previous: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Run every test case against code, spread across the shared sandbox workers.
+        test_cases may be raw assert lines, TestCase records or their dict form; callers that run
+        the same tests repeatedly should parse them once with parse_tests.
+        previous is the last round's result for earlier code. When given, the tests it saw fail run
+        first and stop at the first failure; the rest only run once all of those pass. Every result
+        lists the tests it executed and skipped.
+        With STATIC_CHECK the code is analyzed first (see app.sandbox.analysis); rejected code is
+        never run, all tests come back "skipped" and the report is returned as "static_analysis".
+        Outcomes already recorded for the same code (by AST) and test come from the shared
+        result cache and are marked "cached"; only the remaining tests are executed.
+        The round shares one wall-clock budget (TEST_ROUND_BUDGET) and, with TEST_FAIL_FAST,
+        stops at the first failure; tests that never ran are reported as "skipped".
+        Each test runs under the configured rlimits; its CPU time, wall time and peak RSS are
+        reported per test and summed up in "resource_usage".
+        on_result is called with every per-test result as it finishes.
+        Raises PipelineCancelled, killing the sandbox workers, once cancel fires.
+        """
         if not test_cases:
             return {"status": "error", "error": "No test cases generated", "passed": 0, "total": 0, "detailed_test_results": [], "test_cases": []}
 
-        valid_tests = [test for test in test_cases if self._is_valid_syntax(test)]
-        if not valid_tests:
+        cases = parse_tests(test_cases)
+        if not cases:
             return {"status": "error", "error": "No valid test cases", "passed": 0, "total": 0, "detailed_test_results": [], "test_cases": []}
+        valid_tests = [case.source for case in cases]
+
+        def detail(index: int, result: Dict[str, Any]) -> Dict[str, Any]:
+            return {
+                "test": valid_tests[index],
+                "status": result["status"],
+                "error": result["error"] or "No error",
+                "time": result["time"],
+                "cpu_time": result.get("cpu_time"),
+                "peak_rss_kb": result.get("peak_rss_kb"),
+                "cached": result.get("cached", False)
+            }
+
+        cache = get_test_cache(self.config)
+        code_key = source_key(code)
+        results: Dict[int, Dict[str, Any]] = {}
+        analysis = check_code(code, constraints) if self.config.static_check else None
+        rejected = analysis is not None and not analysis["ok"]
+        if rejected:
+            for index in range(len(valid_tests)):
+                results[index] = {"status": "skipped", "error": REJECTED_BY_ANALYSIS, "time": 0.0}
+                if on_result:
+                    on_result(detail(index, results[index]))
+        elif cache is not None:
+            for index, test in enumerate(valid_tests):
+                hit = cache.get(code_key, test)
+                if hit is not None:
+                    results[index] = {**hit, "cached": True}
+                    if on_result:
+                        on_result(detail(index, results[index]))
 
-        detailed_results = []
-        passed = 0
-
-        for test_case in valid_tests:
-            status = "fail"
-            error = ""
-            with tempfile.NamedTemporaryFile(mode='w', suffix='.py', delete=False) as f:
-                f.write(code + "\n")
-                f.write("try:\n")
-                if 'assert_raises' in test_case:
-                    expected_exc = test_case.split('assert_raises(')[1].split(',')[0].strip()
-                    args = test_case.split('assert_raises(')[1].split(')')[0].split(',')[1:]
-                    f.write(f"    {test_case.split('assert_raises')[0]}assert_raises({expected_exc}, lambda: solution{''.join(args)})\n")
-                else:
-                    f.write(f"    {test_case}\n")
-                f.write("except AssertionError as ae:\n")
-                f.write("    print(f'ASSERTION_FAILED: {ae}')\n")
-                f.write("except Exception as e:\n")
-                f.write("    print(f'ERROR: {type(e).__name__}: {str(e)}')\n")
-                f.write("else:\n")
-                f.write("    print('PASS')\n")
-                temp_file = f.name
-
-            try:
-                result = subprocess.run(
-                    ['python', temp_file],
-                    capture_output=True,
-                    text=True,
-                    timeout=self.config.test_timeout
+        misses = [index for index in range(len(valid_tests)) if index not in results]
+        if self.config.test_fail_fast and any(r["status"] != "pass" for r in results.values()):
+            # The same code already failed one of these tests; running the rest cannot change the verdict
+            for index in misses:
+                results[index] = {"status": "skipped", "error": SKIPPED_AFTER_FAILURE, "time": 0.0}
+                if on_result:
+                    on_result(detail(index, results[index]))
+        elif misses:
+            budget = TestBudget(self.config.test_round_budget, self.config.test_timeout)
+
+            def run_phase(indices: List[int], fail_fast: bool) -> bool:
+                """Run the tests at indices; returns whether all of them passed"""
+                def record(position: int, result: Dict[str, Any]):
+                    if on_result:
+                        on_result(detail(indices[position], result))
+
+                fresh = run_in_sandbox(
+                    code,
+                    [cases[index].to_dict() for index in indices],
+                    budget,
+                    on_result=record,
+                    cancel=cancel,
+                    pool=get_pool(self.config),
+                    fail_fast=fail_fast,
+                    limits=ResourceLimits.from_config(self.config)
                 )
-                output = result.stdout + result.stderr
-                if 'PASS' in output:
-                    status = "pass"
-                    passed += 1
-                elif 'ASSERTION_FAILED' in output:
-                    status = "fail"
-                    error = output.split('ASSERTION_FAILED: ')[1].strip() if 'ASSERTION_FAILED: ' in output else "Assertion failed"
-                elif 'ERROR' in output:
-                    status = "error"
-                    error = output.split('ERROR: ')[1].strip() if 'ERROR: ' in output else "Unknown error"
-
-            except subprocess.TimeoutExpired:
-                status = "timeout"
-                error = "Test execution timed out"
-            finally:
-                if os.path.exists(temp_file):
-                    os.unlink(temp_file)
-        
-            detailed_results.append({
-                "test": test_case,
-                "status": status,
-                "error": "No error" if not error else error
-            })
+                for index, result in zip(indices, fresh):
+                    results[index] = result
+                    if cache is not None:
+                        cache.put(code_key, valid_tests[index], result)
+                return all(result["status"] == "pass" for result in fresh)
+
+            failed_before = {r["test"] for r in (previous or {}).get("detailed_test_results", []) if r["status"] in ("fail", "error", "timeout")}
+            retest = [index for index in misses if valid_tests[index] in failed_before]
+            rest = [index for index in misses if valid_tests[index] not in failed_before]
+            # A fix that still fails one of the tests it was meant to fix is settled by that one test
+            if not retest or run_phase(retest, fail_fast=True):
+                if rest:
+                    run_phase(rest, fail_fast=self.config.test_fail_fast)
+            else:
+                for index in rest:
+                    results[index] = {"status": "skipped", "error": SKIPPED_AFTER_FAILURE, "time": 0.0}
+                    if on_result:
+                        on_result(detail(index, results[index]))
+
+        detailed_results = [detail(index, results[index]) for index in range(len(valid_tests))]
+        # Cached outcomes cost nothing this round
+        usage = resource_usage([r for r in detailed_results if not r["cached"]])
+        passed = sum(1 for r in detailed_results if r["status"] == "pass")
+        cached = sum(1 for r in detailed_results if r["cached"])
+        skipped = sum(1 for r in detailed_results if r["status"] == "skipped")
 
         overall_status = "pass" if passed == len(valid_tests) else "fail"
-        overall_error = "All tests passed" if overall_status == "pass" else "\n".join([r["error"] for r in detailed_results if r["error"] != "No error"])
+        overall_error = "All tests passed" if overall_status == "pass" else "\n".join([r["error"] for r in detailed_results if r["error"] != "No error" and r["status"] != "skipped"])
+        if rejected:
+            overall_error = "Code rejected before testing: " + "; ".join(issue["message"] for issue in analysis["issues"])
 
         return {
             "status": overall_status,
             "error": overall_error,
             "passed": passed,
+            "skipped": skipped,
+            "cached": cached,
+            "resource_usage": usage,
             "total": len(valid_tests),
             "test_cases": valid_tests,
+            "test_ir": [case.to_dict() for case in cases],
             "detailed_test_results": detailed_results,
+            "executed_tests": [r["test"] for r in detailed_results if r["status"] != "skipped" and not r["cached"]],
+            "skipped_tests": [r["test"] for r in detailed_results if r["status"] == "skipped"],
+            "static_analysis": analysis,
             "attempts": 1
-        }
\ No newline at end of file
+        }
+
+    def check_complexity(self, code: str, signature: str, constraints: str, cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+        """
+        Profile the function named by signature against the stated constraints.
+        The report's "verdict" is pass, fail, inconclusive or skipped (nothing stated, or COMPLEXITY_CHECK off).
+        """
+        if not self.config.complexity_check:
+            return {"verdict": "skipped", "reason": "Complexity check disabled"}
+        match = re.match(r"\s*def\s+(\w+)", signature or "")
+        return profile_complexity(code, match.group(1) if match else "solution", constraints, self.config, cancel=cancel)
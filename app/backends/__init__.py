@@ -0,0 +1,24 @@
+from .base import GenerationBackend
+
+
+def create_backend(config) -> GenerationBackend:
+    """Instantiate the backend selected by config.backend; heavy imports stay lazy"""
+    if config.backend == "local":
+        from .local_hf import LocalHFBackend
+        return LocalHFBackend(config)
+    if config.backend == "replicas":
+        from .replica_pool import ReplicaPoolBackend
+        return ReplicaPoolBackend(config)
+    if config.backend == "ipc":
+        from .ipc import IPCClientBackend
+        return IPCClientBackend(config)
+    if config.backend == "openai":
+        from .openai_http import OpenAICompatibleBackend
+        return OpenAICompatibleBackend(config)
+    if config.backend == "mock":
+        from .mock import MockBackend
+        return MockBackend(config)
+    raise ValueError(f"Unknown generation backend '{config.backend}'")
+
+
+__all__ = ["GenerationBackend", "create_backend"]
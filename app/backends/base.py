@@ -0,0 +1,48 @@
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+from ..modules.cancellation import CancelToken
+from ..modules.stopping import StopSpec
+
+Prompt = Union[str, List[Dict[str, str]]]
+
+
+def to_messages(prompt: Prompt) -> List[Dict[str, str]]:
+    """Normalise a bare string prompt into a single user message"""
+    if isinstance(prompt, list):
+        return prompt
+    return [{"role": "user", "content": prompt}]
+
+
+class GenerationBackend:
+    """
+    Interface every generation backend implements.
+    LocalModelManager delegates to one backend chosen by SPARConfig.backend.
+    """
+    name = "base"
+
+    def __init__(self, config):
+        self.config = config
+
+    def initialize(self, role: str):
+        """Prepare whatever role needs (load weights, open connections); safe to call repeatedly"""
+
+    def model_name(self, role: str) -> str:
+        """Name of the model that serves role; part of the response cache key"""
+        return self.config.model_for_role(role)
+
+    def generate(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> str:
+        """
+        Return the completion; backends should stop decoding once stop.find_end() reports a cut.
+        Once cancel fires they may return early with partial text; the caller discards it.
+        """
+        raise NotImplementedError
+
+    def stream(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        """Yield text chunks; backends without native streaming return the whole completion at once"""
+        yield self.generate(prompt, max_tokens, agent=agent, role=role, stop=stop, cancel=cancel)
+
+    def is_ready(self) -> bool:
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {}
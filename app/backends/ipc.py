@@ -0,0 +1,131 @@
+import logging
+import queue
+import threading
+import time
+from multiprocessing.connection import Client
+from typing import Any, Dict, Iterator, Optional
+
+from ..modules.cancellation import CANCEL_POLL_SECONDS, CancelToken
+from ..modules.stopping import StopSpec
+from .base import GenerationBackend, Prompt
+from .model_server import authkey
+
+logger = logging.getLogger(__name__)
+
+
+class IPCClientBackend(GenerationBackend):
+    """
+    Thin client for app.backends.model_server over its Unix socket.
+    Keeps a pool of idle connections; each call holds one connection exclusively, so
+    concurrent calls from this process reach the server (and its batching engine) in parallel.
+    """
+    name = "ipc"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.address = config.model_server_socket
+        self._idle: "queue.LifoQueue" = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "failures": 0, "connections_opened": 0, "total_seconds": 0.0}
+
+    def _connect(self):
+        try:
+            conn = Client(self.address, family="AF_UNIX", authkey=authkey(self.config))
+        except (FileNotFoundError, ConnectionRefusedError) as e:
+            raise RuntimeError(f"Model server not reachable at {self.address}: {str(e)}")
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return conn
+
+    def _checkout(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._connect()
+
+    def _call(self, operation: str, *args) -> Any:
+        """Send one request and wait for its reply, retrying once on a stale pooled connection"""
+        started = time.time()
+        with self._lock:
+            self._stats["requests"] += 1
+        try:
+            for attempt in range(2):
+                conn = self._checkout()
+                try:
+                    conn.send((operation, args))
+                    status, value = conn.recv()
+                except (EOFError, OSError) as e:
+                    conn.close()
+                    if attempt == 1:
+                        raise RuntimeError(f"Lost connection to model server: {str(e)}")
+                    continue
+                self._idle.put(conn)
+                if status == "error":
+                    raise RuntimeError(f"Model server error: {value}")
+                return value
+        except Exception:
+            with self._lock:
+                self._stats["failures"] += 1
+            raise
+        finally:
+            with self._lock:
+                self._stats["total_seconds"] += time.time() - started
+
+    def initialize(self, role: str):
+        self._call("initialize", role)
+
+    def generate(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> str:
+        if cancel is not None:
+            # Only a stream can be abandoned mid-generation; hanging up stops the server's decode
+            return "".join(self.stream(prompt, max_tokens, agent=agent, role=role, stop=stop, cancel=cancel))
+        return self._call("generate", prompt, max_tokens, agent, role, stop)
+
+    def stream(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        """Relay chunks as the server produces them; abandoning the stream or cancelling drops its connection"""
+        conn = self._checkout()
+        finished = False
+        with self._lock:
+            self._stats["requests"] += 1
+        try:
+            conn.send(("stream", (prompt, max_tokens, agent, role, stop)))
+            while True:
+                if cancel is not None:
+                    # Wake up regularly while the server is busy so a cancel is noticed between chunks
+                    while not cancel.cancelled and not conn.poll(CANCEL_POLL_SECONDS):
+                        pass
+                    if cancel.cancelled:
+                        return
+                status, value = conn.recv()
+                if status == "chunk":
+                    yield value
+                    continue
+                finished = True
+                if status == "error":
+                    raise RuntimeError(f"Model server error: {value}")
+                return
+        except (EOFError, OSError) as e:
+            with self._lock:
+                self._stats["failures"] += 1
+            raise RuntimeError(f"Lost connection to model server: {str(e)}")
+        finally:
+            # A connection left mid-stream still has chunks in flight; it cannot be reused
+            if finished:
+                self._idle.put(conn)
+            else:
+                conn.close()
+
+    def is_ready(self) -> bool:
+        try:
+            return bool(self._call("ping"))
+        except RuntimeError:
+            return False
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["socket"] = self.address
+        try:
+            stats["server"] = self._call("stats")
+        except RuntimeError as e:
+            stats["server"] = {"error": str(e)}
+        return stats
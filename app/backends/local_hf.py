@@ -0,0 +1,327 @@
+import copy
+import functools
+import gc
+import logging
+import threading
+from typing import Any, Dict, Iterator, List, Optional
+
+import torch
+from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+from ..model_manager import ModelHandle, get_registry
+from ..modules.batching import BatchingEngine
+from ..modules.cancellation import CancelToken
+from ..modules.prefix_cache import PrefixCache
+from ..modules.stopping import StopSpec
+from .base import GenerationBackend, Prompt, to_messages
+
+logger = logging.getLogger(__name__)
+
+
+class StopSpecCriteria(StoppingCriteria):
+    """Finishes each batch row independently once its decoded completion reaches the StopSpec's cut"""
+
+    def __init__(self, tokenizer, stop: StopSpec, prompt_length: int, tokenizer_lock: threading.Lock):
+        self.tokenizer = tokenizer
+        self.stop = stop
+        self.prompt_length = prompt_length
+        self.tokenizer_lock = tokenizer_lock
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        with self.tokenizer_lock:
+            texts = self.tokenizer.batch_decode(input_ids[:, self.prompt_length:], skip_special_tokens=True)
+        done = [self.stop.find_end(text) is not None for text in texts]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class CancelCriteria(StoppingCriteria):
+    """Finishes the batch rows whose request was cancelled; the other rows keep decoding"""
+
+    def __init__(self, cancels: List[Optional[CancelToken]]):
+        self.cancels = cancels
+
+    def __call__(self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs) -> torch.BoolTensor:
+        done = [cancel is not None and cancel.cancelled for cancel in self.cancels]
+        return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+
+class LockedTextIteratorStreamer(TextIteratorStreamer):
+    """TextIteratorStreamer that decodes under the model's tokenizer lock"""
+
+    def __init__(self, tokenizer, tokenizer_lock: threading.Lock, **kwargs):
+        super().__init__(tokenizer, **kwargs)
+        self.tokenizer_lock = tokenizer_lock
+
+    def put(self, value):
+        with self.tokenizer_lock:
+            super().put(value)
+
+    def end(self):
+        with self.tokenizer_lock:
+            super().end()
+
+
+def stopping_criteria(handle: ModelHandle, stop: Optional[StopSpec], prompt_length: int, cancels: Optional[List[Optional[CancelToken]]] = None) -> Optional[StoppingCriteriaList]:
+    criteria = []
+    if stop is not None:
+        criteria.append(StopSpecCriteria(handle.tokenizer, stop, prompt_length, handle.tokenizer_lock))
+    if cancels and any(cancel is not None for cancel in cancels):
+        criteria.append(CancelCriteria(cancels))
+    return StoppingCriteriaList(criteria) if criteria else None
+
+
+class LocalHFBackend(GenerationBackend):
+    """
+    In-process Hugging Face generation.
+    Weights live in the shared ModelRegistry; the backend keeps one batching engine and
+    one system-prefix KV cache per resident model. Request threads, the batching engine and
+    stream threads share each model's tokenizer, so every call into it holds handle.tokenizer_lock.
+    """
+    name = "local"
+
+    # Stand-in user turn used to cut the chat-templated system prefix out of the full prompt
+    _PREFIX_SENTINEL = "<<SPAR_PREFIX_SPLIT>>"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._lock = threading.Lock()
+        self._engines: Dict[str, BatchingEngine] = {}
+        self._prefix_caches: Dict[str, PrefixCache] = {}
+        registry = get_registry()
+        registry.configure(config)
+        registry.add_eviction_listener(self._on_evict)
+
+    def initialize(self, role: str):
+        with get_registry().lease(role, self.config) as handle:
+            logger.info(f"Model ready for role {role}: {handle.name}")
+
+    def _on_evict(self, model_name: str):
+        """Drop per-model state when the registry unloads a model"""
+        with self._lock:
+            engine = self._engines.pop(model_name, None)
+            self._prefix_caches.pop(model_name, None)
+        if engine is not None:
+            engine.stop()
+
+    def _engine_for(self, handle: ModelHandle) -> Optional[BatchingEngine]:
+        if self.config.max_batch_size <= 1:
+            return None
+        with self._lock:
+            engine = self._engines.get(handle.name)
+            if engine is None:
+                engine = self._engines[handle.name] = BatchingEngine(
+                    functools.partial(self._generate_batch, handle),
+                    max_batch_size=self.config.max_batch_size,
+                    max_wait_ms=self.config.batch_wait_ms,
+                    bucket_width=self.config.batch_bucket_width
+                )
+            return engine
+
+    def _prefix_cache_for(self, handle: ModelHandle) -> Optional[PrefixCache]:
+        if self.config.prefix_cache_mb <= 0:
+            return None
+        with self._lock:
+            cache = self._prefix_caches.get(handle.name)
+            if cache is None:
+                cache = self._prefix_caches[handle.name] = PrefixCache(self.config.prefix_cache_mb * 1024**2)
+            return cache
+
+    def generate(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> str:
+        with get_registry().lease(role, self.config) as handle:
+            text = self._apply_chat_template(handle, prompt)
+            params = (max_tokens, self.config.temperature, self.config.do_sample, self.config.top_p, stop)
+            prefix = self._system_prefix(handle, prompt, text, agent)
+
+            engine = self._engine_for(handle)
+            if engine is not None:
+                with handle.tokenizer_lock:
+                    length = len(handle.tokenizer(text).input_ids)
+                return engine.generate(text, length, params, prefix, cancel)
+            # Degenerate case: a batch of one on the caller's thread
+            return self._generate_batch(handle, [text], params, [prefix], [cancel])[0]
+
+    def stream(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        """
+        Streams bypass the batching engine; the system prefix cache still applies.
+        Closing the generator early also stops the decode thread at its next token.
+        """
+        with get_registry().lease(role, self.config) as handle:
+            model, tokenizer = handle.model, handle.tokenizer
+            text = self._apply_chat_template(handle, prompt)
+            prefix = self._system_prefix(handle, prompt, text, agent)
+            with handle.tokenizer_lock:
+                model_inputs = tokenizer([text], return_tensors="pt")
+            model_inputs = model_inputs.to(model.device)
+            past_key_values = self._prefix_past(handle, prefix, model_inputs.input_ids[0].tolist()) if prefix else None
+
+            streamer = LockedTextIteratorStreamer(tokenizer, handle.tokenizer_lock, skip_prompt=True, skip_special_tokens=True)
+            abandoned = CancelToken()
+            criteria = stopping_criteria(handle, stop, model_inputs.input_ids.shape[1], [cancel, abandoned])
+            failure = []
+
+            def run():
+                try:
+                    self._seed(self.config.do_sample)
+                    model.generate(
+                        input_ids=model_inputs.input_ids,
+                        attention_mask=model_inputs.attention_mask,
+                        past_key_values=past_key_values,
+                        max_new_tokens=max_tokens,
+                        temperature=self.config.temperature,
+                        do_sample=self.config.do_sample,
+                        top_p=self.config.top_p,
+                        pad_token_id=tokenizer.pad_token_id,
+                        stopping_criteria=criteria,
+                        streamer=streamer
+                    )
+                except Exception as e:
+                    failure.append(e)
+                    # Unblock the consumer, which re-raises below
+                    streamer.end()
+
+            worker = threading.Thread(target=run, name="spar-stream", daemon=True)
+            worker.start()
+            try:
+                for chunk in streamer:
+                    if chunk:
+                        yield chunk
+            finally:
+                # Reached early when the consumer hangs up; without this the model keeps decoding to max_tokens
+                abandoned.cancel("stream closed")
+                worker.join()
+        if failure:
+            raise failure[0]
+
+    def _apply_chat_template(self, handle: ModelHandle, prompt: Prompt) -> str:
+        """Render a string or list of messages with the tokenizer's chat template"""
+        with handle.tokenizer_lock:
+            return handle.tokenizer.apply_chat_template(
+                to_messages(prompt),
+                tokenize=False,
+                add_generation_prompt=True
+            )
+
+    def _system_prefix(self, handle: ModelHandle, prompt: Prompt, text: str, agent: Optional[str]) -> Optional[tuple]:
+        """Return (agent, prefix_text) when the templated prompt starts with a cacheable system prefix"""
+        if self._prefix_cache_for(handle) is None or not agent or not isinstance(prompt, list):
+            return None
+        if not prompt or prompt[0].get("role") != "system":
+            return None
+        try:
+            with handle.tokenizer_lock:
+                templated = handle.tokenizer.apply_chat_template(
+                    [prompt[0], {"role": "user", "content": self._PREFIX_SENTINEL}],
+                    tokenize=False,
+                    add_generation_prompt=False
+                )
+        except Exception as e:
+            logger.warning(f"Could not template system prefix for {agent}: {str(e)}")
+            return None
+        cut = templated.find(self._PREFIX_SENTINEL)
+        if cut <= 0 or not text.startswith(templated[:cut]):
+            return None
+        return agent, templated[:cut]
+
+    def _prefix_past(self, handle: ModelHandle, prefix: tuple, input_ids: List[int]):
+        """Return a private copy of the cached KV state covering the shared prefix of input_ids"""
+        agent, prefix_text = prefix
+        cache = self._prefix_cache_for(handle)
+        entry = cache.get(agent, prefix_text)
+        if entry is None:
+            with handle.tokenizer_lock:
+                prefix_ids = handle.tokenizer(prefix_text, return_tensors="pt").input_ids
+            prefix_ids = prefix_ids.to(handle.model.device)
+            with torch.no_grad():
+                outputs = handle.model(input_ids=prefix_ids, use_cache=True)
+            entry = cache.put(agent, prefix_text, prefix_ids[0].tolist(), outputs.past_key_values)
+
+        # The last prefix token can merge with the start of the user turn; reuse only the aligned part
+        shared = 0
+        for a, b in zip(entry.prefix_ids, input_ids):
+            if a != b:
+                break
+            shared += 1
+        shared = min(shared, len(input_ids) - 1)
+        if shared == 0:
+            cache.record_bypass(agent)
+            return None
+
+        # generate() extends the cache in place, so never hand out the shared copy
+        past = copy.deepcopy(entry.past_key_values)
+        if shared < len(entry.prefix_ids):
+            if not hasattr(past, "crop"):
+                cache.record_bypass(agent)
+                return None
+            past.crop(shared)
+        cache.record_saved(agent, shared)
+        return past
+
+    def _seed(self, do_sample: bool):
+        """Re-seed before each sampled generate so a pinned seed reproduces its output"""
+        if do_sample and self.config.seed >= 0:
+            torch.manual_seed(self.config.seed)
+
+    def _generate_batch(self, handle: ModelHandle, texts: List[str], params: tuple, prefixes: Optional[List[Optional[tuple]]] = None, cancels: Optional[List[Optional[CancelToken]]] = None) -> List[str]:
+        """Run one left-padded batched generate call and return the decoded completions"""
+        max_tokens, temperature, do_sample, top_p, stop = params
+        model, tokenizer = handle.model, handle.tokenizer
+        with handle.tokenizer_lock:
+            model_inputs = tokenizer(texts, return_tensors="pt", padding=True)
+        model_inputs = model_inputs.to(model.device)
+
+        # A cached prefix only lines up with an unpadded batch of one; batched prompts prefill in full
+        past_key_values = None
+        if prefixes and len(texts) == 1:
+            if prefixes[0] is not None:
+                past_key_values = self._prefix_past(handle, prefixes[0], model_inputs.input_ids[0].tolist())
+        elif prefixes:
+            for prefix in prefixes:
+                if prefix is not None:
+                    self._prefix_cache_for(handle).record_bypass(prefix[0])
+
+        self._seed(do_sample)
+        with torch.no_grad():
+            generated_ids = model.generate(
+                input_ids=model_inputs.input_ids,
+                attention_mask=model_inputs.attention_mask,
+                past_key_values=past_key_values,
+                max_new_tokens=max_tokens,
+                temperature=temperature,
+                do_sample=do_sample,
+                top_p=top_p,
+                pad_token_id=tokenizer.pad_token_id,
+                stopping_criteria=stopping_criteria(handle, stop, model_inputs.input_ids.shape[1], cancels)
+            )
+
+        # With left padding every prompt ends at the same column
+        prompt_length = model_inputs.input_ids.shape[1]
+        with handle.tokenizer_lock:
+            responses = tokenizer.batch_decode(generated_ids[:, prompt_length:], skip_special_tokens=True)
+
+        if torch.cuda.is_available() and self.config.device != "cpu":
+            torch.cuda.empty_cache()
+            gc.collect()
+            for _ in range(3):
+                gc.collect()
+
+        return responses
+
+    def stats(self) -> Dict[str, Any]:
+        """Batching and prefix-cache counters per resident model"""
+        with self._lock:
+            engines = dict(self._engines)
+            caches = dict(self._prefix_caches)
+        return {
+            "batching": {name: engine.stats() for name, engine in engines.items()},
+            "prefix_cache": {name: cache.stats() for name, cache in caches.items()},
+        }
+
+    def clear_cache(self):
+        """Clear GPU cache and memory"""
+        if torch.cuda.is_available() and self.config.device != "cpu":
+            torch.cuda.empty_cache()
+        gc.collect()
+        for _ in range(5):
+            gc.collect()
+        if torch.cuda.is_available() and self.config.device != "cpu":
+            torch.cuda.synchronize()
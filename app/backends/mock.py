@@ -0,0 +1,154 @@
+"""
+Deterministic stand-in for a real model: every agent gets a canned but well-formed response
+after a synthetic prefill delay and decode rate. Useful for load-testing main.py and for
+profiling the pipeline's own overhead without loading any weights.
+
+    SPAR_BACKEND=mock MOCK_LATENCY_MS=50 MOCK_TOKENS_PER_SEC=40 python main.py
+    python -m app.backends.mock --runs 20   # cProfile MainSolutionSystem.solve_problem
+"""
+
+import argparse
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+from ..modules.cancellation import CancelToken
+from ..modules.stopping import StopSpec
+from .base import GenerationBackend, Prompt, to_messages
+
+MOCK_CODE = (
+    "def solution(a, b):\n"
+    "    if not isinstance(a, int) or not isinstance(b, int):\n"
+    "        raise ValueError(\"Inputs must be integers\")\n"
+    "    return a + b"
+)
+
+MOCK_RESPONSES = {
+    "subtask_distributor": (
+        "Classification: SIMPLE\n"
+        "Explanation: The problem is a single direct computation with no tricky edge cases."
+    ),
+    "prompt_refiner": None,  # echoes the base prompt back as the polished prompt
+    "code_agent": f"```python\n{MOCK_CODE}\n```",
+    "tester_agent": (
+        "assert solution(1, 2) == 3\n"
+        "assert solution(0, 0) == 0\n"
+        "assert solution(-1, 1) == 0\n"
+        "assert solution(100, 200) == 300\n"
+        "assert solution(-5, -7) == -12"
+    ),
+    "self_debugger": (
+        f"```python\n{MOCK_CODE}\n```\n"
+        "Explanation: Validate both inputs before adding them."
+    ),
+}
+
+
+class MockBackend(GenerationBackend):
+    """Canned per-agent responses with configurable latency; no model is ever loaded"""
+    name = "mock"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "tokens": 0, "total_seconds": 0.0}
+
+    def _response(self, prompt: Prompt, agent: Optional[str], stop: Optional[StopSpec]) -> str:
+        response = MOCK_RESPONSES.get(agent)
+        if response is None:
+            response = to_messages(prompt)[-1]["content"]
+        # Trimming first means synthetic decode time is only spent on tokens a real model would emit
+        return stop.trim(response) if stop is not None else response
+
+    def _tokens(self, text: str, max_tokens: int):
+        """Whitespace-delimited chunks stand in for tokens, capped at max_tokens"""
+        words = text.split(" ")
+        return ([word + " " for word in words[:-1]] + words[-1:])[:max_tokens]
+
+    def _token_delay(self) -> float:
+        rate = self.config.mock_tokens_per_sec
+        return 1.0 / rate if rate > 0 else 0.0
+
+    def _sleep(self, seconds: float, cancel: Optional[CancelToken]) -> bool:
+        """Sleep like a decode step would; returns True if cancel fired meanwhile"""
+        if cancel is None:
+            time.sleep(seconds)
+            return False
+        return cancel.wait(seconds)
+
+    def _record(self, tokens: int, started: float):
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["tokens"] += tokens
+            self._stats["total_seconds"] += time.time() - started
+
+    def generate(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> str:
+        started = time.time()
+        tokens = self._tokens(self._response(prompt, agent, stop), max_tokens)
+        if self._sleep(self.config.mock_latency_ms / 1000 + len(tokens) * self._token_delay(), cancel):
+            tokens = []
+        self._record(len(tokens), started)
+        return "".join(tokens)
+
+    def stream(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        started = time.time()
+        tokens = self._tokens(self._response(prompt, agent, stop), max_tokens)
+        if self._sleep(self.config.mock_latency_ms / 1000, cancel):
+            tokens = []
+        delay = self._token_delay()
+        try:
+            for token in tokens:
+                if delay and self._sleep(delay, cancel):
+                    break
+                yield token
+        finally:
+            self._record(len(tokens), started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["latency_ms"] = self.config.mock_latency_ms
+        stats["tokens_per_sec"] = self.config.mock_tokens_per_sec
+        return stats
+
+
+def main():
+    """Profile the non-model overhead of MainSolutionSystem.solve_problem against the mock backend"""
+    import cProfile
+    import pstats
+
+    from ..agents.base_agent import SPARConfig
+    from ..agents.main_ss import MainSolutionSystem
+
+    parser = argparse.ArgumentParser(description="Profile solve_problem with the mock backend")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--latency-ms", type=int, default=0)
+    parser.add_argument("--tokens-per-sec", type=float, default=0.0)
+    parser.add_argument("--top", type=int, default=25, help="number of functions to print")
+    args = parser.parse_args()
+
+    config = SPARConfig.from_env()
+    config.backend = "mock"
+    config.mock_latency_ms = args.latency_ms
+    config.mock_tokens_per_sec = args.tokens_per_sec
+    system = MainSolutionSystem(config)
+    problem = "Write a function that returns the sum of two integers."
+    refined_prompt = (
+        f"# Language: python\n"
+        f"# Task: {problem}\n"
+        f"# Signature: def solution(a, b):\n"
+    )
+
+    profiler = cProfile.Profile()
+    started = time.time()
+    profiler.enable()
+    for _ in range(args.runs):
+        system.solve_problem(problem, refined_prompt=refined_prompt, signature="def solution(a, b) -> int:")
+    profiler.disable()
+    elapsed = time.time() - started
+    print(f"{args.runs} runs in {elapsed:.2f}s ({elapsed / max(args.runs, 1) * 1000:.1f} ms/run)")
+    pstats.Stats(profiler).sort_stats("cumulative").print_stats(args.top)
+
+
+if __name__ == "__main__":
+    main()
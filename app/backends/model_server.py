@@ -0,0 +1,124 @@
+"""
+Dedicated model-server process. It owns the one copy of the weights and serves generations
+over a Unix socket to any number of thin FastAPI workers running SPAR_BACKEND=ipc.
+
+    python -m app.backends.model_server                         # MODEL_SERVER_BACKEND=local by default
+    SPAR_BACKEND=ipc uvicorn main:app --workers 8
+
+Messages are (operation, args) tuples framed and pickled by multiprocessing.connection.
+The socket is created mode 0600; set MODEL_SERVER_AUTHKEY to also require an HMAC handshake.
+"""
+
+import argparse
+import dataclasses
+import logging
+import os
+import threading
+from multiprocessing.connection import Listener
+
+from . import create_backend
+
+logger = logging.getLogger(__name__)
+
+
+def authkey(config):
+    return config.model_server_authkey.encode() if config.model_server_authkey else None
+
+
+class ModelServer:
+    """Serves one generation backend to many client processes, one thread per connection"""
+
+    def __init__(self, config):
+        if config.model_server_backend == "ipc":
+            raise ValueError("The model server cannot itself use the ipc backend")
+        self.config = config
+        self.address = config.model_server_socket
+        self.backend = create_backend(dataclasses.replace(config, backend=config.model_server_backend))
+        self._clients = 0
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        if os.path.exists(self.address):
+            # A stale socket from a previous run would make bind() fail
+            os.unlink(self.address)
+        listener = Listener(self.address, family="AF_UNIX", authkey=authkey(self.config))
+        os.chmod(self.address, 0o600)
+        logger.info(f"Model server ({self.backend.name} backend) listening on {self.address}")
+        try:
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # A failed handshake must not take the server down
+                    logger.warning(f"Rejected model server connection: {str(e)}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), name="model-server-conn", daemon=True).start()
+        finally:
+            listener.close()
+
+    def _handle(self, conn):
+        with self._lock:
+            self._clients += 1
+        try:
+            with conn:
+                while True:
+                    try:
+                        operation, args = conn.recv()
+                    except EOFError:
+                        return
+                    try:
+                        self._dispatch(conn, operation, args)
+                    except (BrokenPipeError, ConnectionResetError):
+                        # The client hung up, e.g. it abandoned a stream
+                        return
+                    except Exception as e:
+                        logger.error(f"Model server {operation} failed: {str(e)}")
+                        conn.send(("error", f"{type(e).__name__}: {str(e)}"))
+        finally:
+            with self._lock:
+                self._clients -= 1
+
+    def _dispatch(self, conn, operation: str, args: tuple):
+        if operation == "generate":
+            conn.send(("ok", self.backend.generate(*args)))
+        elif operation == "stream":
+            chunks = self.backend.stream(*args)
+            try:
+                for chunk in chunks:
+                    conn.send(("chunk", chunk))
+            finally:
+                # On a hang-up this stops the backend's decode instead of leaving it to run on
+                chunks.close()
+            conn.send(("ok", None))
+        elif operation == "initialize":
+            self.backend.initialize(*args)
+            conn.send(("ok", None))
+        elif operation == "stats":
+            with self._lock:
+                clients = self._clients
+            conn.send(("ok", {"backend": self.backend.name, "clients": clients, **self.backend.stats()}))
+        elif operation == "ping":
+            conn.send(("ok", self.backend.is_ready()))
+        else:
+            conn.send(("error", f"Unknown operation '{operation}'"))
+
+
+def main():
+    from ..agents.base_agent import SPARConfig
+
+    parser = argparse.ArgumentParser(description="SPAR model server")
+    parser.add_argument("--socket", help="Unix socket path (default MODEL_SERVER_SOCKET)")
+    parser.add_argument("--preload", action="append", default=[], help="role to load before serving; repeatable")
+    args = parser.parse_args()
+
+    config = SPARConfig.from_env()
+    if args.socket:
+        config.model_server_socket = args.socket
+    server = ModelServer(config)
+    for role in args.preload:
+        server.backend.initialize(role)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
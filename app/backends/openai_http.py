@@ -0,0 +1,164 @@
+import json
+import logging
+import random
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ..modules.cancellation import CancelToken
+from ..modules.stopping import MAX_SERVER_STOP_STRINGS, StopSpec
+from .base import GenerationBackend, Prompt, to_messages
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying: rate limits, timeouts and transient server errors
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+
+class RetryableHTTPError(Exception):
+    def __init__(self, status: int, retry_after: Optional[float] = None):
+        super().__init__(f"HTTP {status}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class OpenAICompatibleBackend(GenerationBackend):
+    """
+    Client for any server exposing the OpenAI /chat/completions API (vLLM, TGI, llama.cpp, ...).
+    One requests.Session with a keep-alive pool is shared by all threads; at most
+    api_max_connections requests are in flight, and failed calls retry with full-jitter backoff.
+    """
+    name = "openai"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self.base_url = config.api_base.rstrip("/")
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config.api_max_connections)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if config.api_key:
+            self.session.headers["Authorization"] = f"Bearer {config.api_key}"
+        # Never ask the pool for more connections than it keeps alive
+        self._slots = threading.BoundedSemaphore(config.api_max_connections)
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "failures": 0, "in_flight": 0, "total_seconds": 0.0}
+
+    def model_name(self, role: str) -> str:
+        return self.config.api_model or self.config.model_for_role(role)
+
+    def _payload(self, prompt: Prompt, max_tokens: int, role: str, stream: bool, stop: Optional[StopSpec] = None) -> Dict[str, Any]:
+        payload = {
+            "model": self.model_name(role),
+            "messages": to_messages(prompt),
+            "max_tokens": max_tokens,
+            "temperature": self.config.temperature if self.config.do_sample else 0.0,
+            "top_p": self.config.top_p,
+            "stream": stream,
+        }
+        if self.config.seed >= 0:
+            payload["seed"] = self.config.seed
+        if stop is not None and stop.stop_strings:
+            # Any beyond the limit make needs_client_side true, so the caller streams and cuts itself
+            payload["stop"] = list(stop.stop_strings[:MAX_SERVER_STOP_STRINGS])
+        return payload
+
+    def _backoff(self, attempt: int, retry_after: Optional[float]) -> float:
+        """Full-jitter exponential backoff, never shorter than a server-provided Retry-After"""
+        delay = random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+        return max(delay, retry_after or 0.0)
+
+    def _post(self, payload: Dict[str, Any]) -> requests.Response:
+        url = f"{self.base_url}/chat/completions"
+        last_error: Optional[Exception] = None
+        for attempt in range(self.config.api_max_retries + 1):
+            try:
+                response = self.session.post(
+                    url, json=payload, timeout=self.config.api_timeout, stream=payload["stream"]
+                )
+                if response.status_code in RETRYABLE_STATUS:
+                    retry_after = response.headers.get("Retry-After")
+                    response.close()
+                    raise RetryableHTTPError(
+                        response.status_code,
+                        float(retry_after) if retry_after and retry_after.isdigit() else None
+                    )
+                response.raise_for_status()
+                return response
+            except (requests.ConnectionError, requests.Timeout, RetryableHTTPError) as e:
+                last_error = e
+                if attempt == self.config.api_max_retries:
+                    break
+                delay = self._backoff(attempt, getattr(e, "retry_after", None))
+                logger.warning(f"Generation request failed ({e}), retrying in {delay:.2f}s")
+                with self._lock:
+                    self._stats["retries"] += 1
+                time.sleep(delay)
+        with self._lock:
+            self._stats["failures"] += 1
+        raise RuntimeError(f"Generation backend unavailable after {self.config.api_max_retries + 1} attempts: {last_error}")
+
+    def _begin(self):
+        self._slots.acquire()
+        with self._lock:
+            self._stats["requests"] += 1
+            self._stats["in_flight"] += 1
+        return time.time()
+
+    def _end(self, started: float):
+        with self._lock:
+            self._stats["in_flight"] -= 1
+            self._stats["total_seconds"] += time.time() - started
+        self._slots.release()
+
+    def generate(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> str:
+        if cancel is not None or (stop is not None and stop.needs_client_side):
+            # Fences, line counts and stop strings past the server's limit cannot be sent, and a cancel
+            # has to be able to interrupt decoding; stream instead and hang up at the cut so the
+            # server stops decoding
+            text = ""
+            chunks = self.stream(prompt, max_tokens, agent=agent, role=role, stop=stop, cancel=cancel)
+            try:
+                for chunk in chunks:
+                    text += chunk
+                    if stop is not None and stop.find_end(text) is not None:
+                        break
+            finally:
+                chunks.close()
+            return text
+        started = self._begin()
+        try:
+            response = self._post(self._payload(prompt, max_tokens, role, stream=False, stop=stop))
+            return response.json()["choices"][0]["message"]["content"] or ""
+        finally:
+            self._end(started)
+
+    def stream(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> Iterator[str]:
+        """Consume the server-sent event stream, yielding content deltas; closing the generator drops the connection"""
+        started = self._begin()
+        try:
+            response = self._post(self._payload(prompt, max_tokens, role, stream=True, stop=stop))
+            with response:
+                for line in response.iter_lines(decode_unicode=True):
+                    if cancel is not None and cancel.cancelled:
+                        break
+                    if not line or not line.startswith("data:"):
+                        continue
+                    data = line[len("data:"):].strip()
+                    if data == "[DONE]":
+                        break
+                    delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                    if delta:
+                        yield delta
+        finally:
+            self._end(started)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["base_url"] = self.base_url
+        stats["max_connections"] = self.config.api_max_connections
+        return stats
@@ -0,0 +1,305 @@
+"""
+Pool of model worker processes for many-core CPU hosts.
+Each replica is a separate process pinned to a disjoint set of cores with its own torch
+thread settings, so N generations run truly in parallel instead of contending for one
+interpreter and one intra-op pool. Requests go to the replica with the fewest in flight.
+
+Replicas load through the shared ModelRegistry; with MODEL_SNAPSHOT_DIR set they map the
+same safetensors snapshot, so read-only weight pages are shared between them.
+
+    SPAR_BACKEND=replicas REPLICAS=4 REPLICA_THREADS=8 python main.py
+    python -m app.backends.replica_pool --sweep   # find the best replicas x threads layout
+"""
+
+import argparse
+import dataclasses
+import itertools
+import logging
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Dict, List, Optional
+
+from ..modules.cancellation import CancelToken, wait_future
+from ..modules.stopping import StopSpec
+from .base import GenerationBackend, Prompt
+
+logger = logging.getLogger(__name__)
+
+# How often the result collector checks for replicas that died, busy or not
+REAP_INTERVAL_SECONDS = 1.0
+
+
+def core_layout(replicas: int, threads: int) -> List[List[int]]:
+    """Split the cores this process may use into one disjoint, contiguous set per replica"""
+    cores = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+    threads = threads or max(1, len(cores) // replicas)
+    if replicas * threads > len(cores):
+        raise ValueError(f"{replicas} replicas x {threads} threads needs more than the {len(cores)} available cores")
+    return [cores[i * threads:(i + 1) * threads] for i in range(replicas)]
+
+
+def _replica_main(index: int, config, cores: List[int], interop_threads: int, requests, results):
+    """Worker process: pin, configure torch threads, then serve requests until a None sentinel"""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import torch
+    torch.set_num_threads(len(cores))
+    torch.set_num_interop_threads(max(1, interop_threads))
+
+    from .local_hf import LocalHFBackend
+    # One request at a time per replica; parallelism comes from the pool
+    backend = LocalHFBackend(dataclasses.replace(config, backend="local", max_batch_size=1))
+    results.put(("ready", index, None, None))
+
+    while True:
+        message = requests.get()
+        if message is None:
+            break
+        request_id, kind, payload = message
+        try:
+            if kind == "init":
+                backend.initialize(payload)
+                output = None
+            else:
+                prompt, max_tokens, agent, role, stop = payload
+                output = backend.generate(prompt, max_tokens, agent=agent, role=role, stop=stop)
+            results.put(("done", index, request_id, output))
+        except Exception as e:
+            results.put(("error", index, request_id, f"{type(e).__name__}: {str(e)}"))
+
+
+class _Replica:
+    def __init__(self, index: int, cores: List[int], process, requests):
+        self.index = index
+        self.cores = cores
+        self.process = process
+        self.requests = requests
+        self.in_flight = 0
+        self.completed = 0
+        self.failed = 0
+        self.ready = threading.Event()
+        self.alive = True
+
+
+class ReplicaPoolBackend(GenerationBackend):
+    """Dispatches generations least-loaded-first across pinned worker processes"""
+    name = "replicas"
+
+    def __init__(self, config):
+        super().__init__(config)
+        self._lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._owner: Dict[int, tuple] = {}  # request id -> (replica, kind)
+        self._ids = itertools.count()
+        self._dispatch = itertools.count()
+        self._results = None
+        self._replicas: List[_Replica] = []
+        self._started = False
+        self._stopping = threading.Event()
+
+    def _start(self):
+        with self._lock:
+            if self._started:
+                return
+            # spawn: forking a process that already holds torch threads is unsafe
+            context = mp.get_context("spawn")
+            self._results = context.Queue()
+            for index, cores in enumerate(core_layout(self.config.replicas, self.config.replica_threads)):
+                requests = context.Queue()
+                process = context.Process(
+                    target=_replica_main,
+                    args=(index, self.config, cores, self.config.replica_interop_threads, requests, self._results),
+                    name=f"spar-replica-{index}",
+                    daemon=True
+                )
+                process.start()
+                self._replicas.append(_Replica(index, cores, process, requests))
+                logger.info(f"Started replica {index} (pid {process.pid}) on cores {cores}")
+            threading.Thread(target=self._collect, name="spar-replica-results", daemon=True).start()
+            self._started = True
+
+    def _collect(self):
+        """
+        Resolve futures from worker results and fail the requests of replicas that died.
+        Replicas are reaped every REAP_INTERVAL_SECONDS even while results keep arriving, so a
+        dead replica cannot hide behind busy ones. Exits once shutdown() is called.
+        """
+        reaped_at = time.time()
+        while not self._stopping.is_set():
+            try:
+                self._resolve(*self._results.get(timeout=REAP_INTERVAL_SECONDS))
+            except queue.Empty:
+                pass
+            if time.time() - reaped_at >= REAP_INTERVAL_SECONDS:
+                self._reap()
+                reaped_at = time.time()
+
+    def _resolve(self, kind: str, index: int, request_id: Optional[int], output: Any):
+        replica = self._replicas[index]
+        if kind == "ready":
+            replica.ready.set()
+            return
+        with self._lock:
+            future = self._pending.pop(request_id, None)
+            _, request_kind = self._owner.pop(request_id, (None, None))
+            replica.in_flight -= 1
+            if request_kind == "generate":
+                if kind == "done":
+                    replica.completed += 1
+                else:
+                    replica.failed += 1
+        if future is None:
+            return
+        if kind == "done":
+            future.set_result(output)
+        else:
+            future.set_exception(RuntimeError(f"Replica {index} failed: {output}"))
+
+    def _reap(self):
+        with self._lock:
+            if self._stopping.is_set():
+                # Replicas exiting after shutdown() are not failures
+                return
+            dead = [r for r in self._replicas if r.alive and not r.process.is_alive()]
+            orphaned = []
+            for replica in dead:
+                replica.alive = False
+                replica.ready.set()
+                logger.error(f"Replica {replica.index} exited with code {replica.process.exitcode}")
+                for request_id, (owner, _) in list(self._owner.items()):
+                    if owner is replica:
+                        del self._owner[request_id]
+                        orphaned.append(self._pending.pop(request_id))
+                        replica.in_flight -= 1
+                        replica.failed += 1
+        for future in orphaned:
+            future.set_exception(RuntimeError("Replica process died"))
+
+    def _submit(self, replica: _Replica, kind: str, payload) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if not replica.alive:
+                raise RuntimeError(f"Replica {replica.index} is not running")
+            request_id = next(self._ids)
+            self._pending[request_id] = future
+            self._owner[request_id] = (replica, kind)
+            replica.in_flight += 1
+        replica.requests.put((request_id, kind, payload))
+        return future
+
+    def _least_loaded(self) -> _Replica:
+        with self._lock:
+            alive = [r for r in self._replicas if r.alive]
+            if not alive:
+                raise RuntimeError("No replica processes are running")
+            # Rotate the starting point so ties spread evenly
+            offset = next(self._dispatch) % len(alive)
+            rotated = alive[offset:] + alive[:offset]
+            return min(rotated, key=lambda r: r.in_flight)
+
+    def initialize(self, role: str):
+        """Start the pool once and load role's model in every replica"""
+        self._start()
+        futures = []
+        for replica in self._replicas:
+            replica.ready.wait()
+            if replica.alive:
+                futures.append(self._submit(replica, "init", role))
+        for future in futures:
+            future.result()
+
+    def generate(self, prompt: Prompt, max_tokens: int, agent: Optional[str] = None, role: str = "code", stop: Optional[StopSpec] = None, cancel: Optional[CancelToken] = None) -> str:
+        """A cancelled caller returns at once; its replica still finishes the request it is decoding"""
+        self._start()
+        future = self._submit(self._least_loaded(), "generate", (prompt, max_tokens, agent, role, stop))
+        return wait_future(future, cancel)
+
+    def is_ready(self) -> bool:
+        return self._started and any(r.alive and r.ready.is_set() for r in self._replicas)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "replicas": [
+                    {
+                        "index": r.index,
+                        "pid": r.process.pid,
+                        "alive": r.alive,
+                        "cores": r.cores,
+                        "in_flight": r.in_flight,
+                        "completed": r.completed,
+                        "failed": r.failed,
+                    }
+                    for r in self._replicas
+                ],
+            }
+
+    def shutdown(self):
+        """Stop the replicas and the result collector"""
+        self._stopping.set()
+        for replica in self._replicas:
+            if replica.alive:
+                replica.requests.put(None)
+        for replica in self._replicas:
+            replica.process.join(timeout=10)
+
+
+def sweep(config, max_tokens: int, requests_per_replica: int) -> List[Dict[str, Any]]:
+    """Measure throughput for every replicas x threads layout that fits on this machine"""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
+    prompt = "Write a Python function that returns the n-th Fibonacci number."
+    results = []
+    for replicas in range(1, cores + 1):
+        if cores % replicas:
+            continue
+        threads = cores // replicas
+        backend = ReplicaPoolBackend(dataclasses.replace(config, replicas=replicas, replica_threads=threads))
+        try:
+            backend.initialize("code")
+            total = replicas * requests_per_replica
+            started = time.time()
+            futures = [
+                backend._submit(backend._least_loaded(), "generate", (prompt, max_tokens, None, "code", None))
+                for _ in range(total)
+            ]
+            for future in futures:
+                future.result()
+            elapsed = time.time() - started
+            results.append({
+                "replicas": replicas,
+                "threads": threads,
+                "requests": total,
+                "seconds": round(elapsed, 2),
+                "requests_per_second": round(total / elapsed, 3),
+            })
+            print(f"replicas={replicas:3d} threads={threads:3d} -> {total / elapsed:.3f} req/s")
+        finally:
+            backend.shutdown()
+    return results
+
+
+def main():
+    from ..agents.base_agent import SPARConfig
+
+    parser = argparse.ArgumentParser(description="Replica pool utilities")
+    parser.add_argument("--sweep", action="store_true", help="benchmark every replicas x threads layout")
+    parser.add_argument("--max-tokens", type=int, default=64)
+    parser.add_argument("--requests-per-replica", type=int, default=4)
+    args = parser.parse_args()
+    if not args.sweep:
+        parser.print_help()
+        return
+
+    results = sweep(SPARConfig.from_env(), args.max_tokens, args.requests_per_replica)
+    if results:
+        best = max(results, key=lambda r: r["requests_per_second"])
+        print(f"Best layout: REPLICAS={best['replicas']} REPLICA_THREADS={best['threads']} "
+              f"({best['requests_per_second']} req/s)")
+
+
+if __name__ == "__main__":
+    main()
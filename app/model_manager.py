@@ -1,16 +1,26 @@
 # app/model_manager.py
 """
-Global model pipeline manager (singleton + lazy load).
-This ensures a single shared pipeline instance per process, and avoids eager loading at import time.
+Process-wide model registry (singleton + lazy load).
+Agents request models by role ("code", "chat", ...); roles resolve to model names, and every
+role that resolves to the same name shares one tokenizer and one set of weights.
+A total memory budget is enforced by evicting idle models in least-recently-used order.
 """
 
+import gc
 import threading
 import logging
-from typing import Optional
+import resource
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Set
 
 import torch
 from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
 
+from .modules.snapshot import has_snapshot, load_snapshot, save_snapshot, snapshot_path
+
 logger = logging.getLogger("model_manager")
 if not logger.hasHandlers():
     h = logging.StreamHandler()
@@ -18,68 +28,554 @@ if not logger.hasHandlers():
     logger.addHandler(h)
 logger.setLevel(logging.INFO)
 
-_MODEL_NAME = "Qwen/Qwen1.5-7B-Chat"
-_max_new_tokens_default = 512
 
-_lock = threading.Lock()
-_pipeline = None  # shared pipeline instance
+PRECISIONS = ("auto", "fp32", "bf16", "int8")
+
+
+class ModelBudgetError(RuntimeError):
+    """Raised when a model cannot fit in the memory budget even after evicting idle models"""
+
+
+@dataclass
+class ModelHandle:
+    """A resident model and its tokenizer, shared by every role that maps to its name"""
+    name: str
+    model: Any
+    tokenizer: Any
+    nbytes: int
+    device: str
+    dtype: str
+    loaded_at: float = field(default_factory=time.time)
+    last_used: float = field(default_factory=time.time)
+    leases: int = 0
+    roles: Set[str] = field(default_factory=set)
+    load_report: Dict[str, Any] = field(default_factory=dict)
+    # Held around every tokenizer call: a fast tokenizer is one Rust object whose padding state
+    # changes per call, so concurrent calls fail with "Already borrowed" or pad a batch wrongly
+    tokenizer_lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+
+@dataclass
+class SwapStatus:
+    """Progress of one hot swap: loading -> warming -> switched -> draining -> done (or failed)"""
+    id: str
+    role: str
+    from_model: str
+    to_model: str
+    state: str = "loading"
+    started_at: float = field(default_factory=time.time)
+    switched_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    warmup_tokens_per_second: Optional[float] = None
+    draining_leases: int = 0
+    error: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def model_nbytes(model) -> int:
+    """
+    Bytes held by a model's weights, counted from its state_dict so that the packed
+    int8 weights of dynamically quantized Linear layers are included. Tied tensors count once.
+    """
+    seen = set()
+
+    def size(value) -> int:
+        if isinstance(value, (tuple, list)):
+            return sum(size(v) for v in value)
+        if not isinstance(value, torch.Tensor):
+            return 0
+        key = (value.data_ptr(), value.numel())
+        if key in seen:
+            return 0
+        seen.add(key)
+        return value.numel() * value.element_size()
+
+    return sum(size(v) for v in model.state_dict().values())
+
+
+def _resolve_precision(config, use_cuda: bool):
+    """Map config.precision to (torch dtype to load in, whether to int8-quantize afterwards)"""
+    precision = config.precision
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision '{precision}', expected one of {PRECISIONS}")
+    if precision == "auto":
+        return (torch.float16 if use_cuda else torch.float32), False
+    if precision == "bf16":
+        return torch.bfloat16, False
+    if precision == "int8":
+        return torch.float32, True
+    return torch.float32, False
+
 
+def _throughput_probe(model, tokenizer, tokens: int) -> float:
+    """Greedy-decode a fixed number of tokens and return tokens/sec"""
+    inputs = tokenizer(["def fibonacci(n):"], return_tensors="pt").to(model.device)
+    start = time.time()
+    with torch.no_grad():
+        output = model.generate(
+            **inputs,
+            max_new_tokens=tokens,
+            min_new_tokens=tokens,
+            do_sample=False,
+            pad_token_id=tokenizer.pad_token_id
+        )
+    generated = output.shape[1] - inputs.input_ids.shape[1]
+    return generated / max(time.time() - start, 1e-6)
 
-def get_pipeline(max_new_tokens: Optional[int] = None, trust_remote_code: bool = True):
+
+def _load_from_checkpoint(model_name: str, config, use_cuda: bool, torch_dtype, quantize: bool):
+    """from_pretrained the original checkpoint and apply dtype conversion and quantization"""
+    tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=True)
+
+    # Add memory optimization settings with CPU offloading
+    if use_cuda:
+        torch.cuda.empty_cache()
+        gc.collect()
+        gpu_total_mem = torch.cuda.get_device_properties(0).total_memory
+        gpu_mem_gb = int(gpu_total_mem / 1024**3 * 0.9)
+        max_memory = {0: f"{gpu_mem_gb}GB", "cpu": "32GB"}
+        device_map = "auto"
+    else:
+        max_memory = None
+        device_map = None
+
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        torch_dtype=torch_dtype,
+        device_map=device_map,
+        trust_remote_code=True,
+        low_cpu_mem_usage=True,
+        max_memory=max_memory,
+        offload_folder="offload"
+    )
+    model.eval()
+    if quantize:
+        fp32_bytes = model_nbytes(model)
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        gc.collect()
+        logger.info(f"Quantized Linear layers to int8 ({fp32_bytes / 1024**3:.2f} GB fp32 before)")
+    return model, tokenizer
+
+
+def _load_from_snapshot(path: str, use_cuda: bool):
+    """Map a snapshot into memory; returns (model, tokenizer) or None if it cannot be used"""
+    try:
+        model, tokenizer = load_snapshot(path)
+    except Exception as e:
+        logger.warning(f"Ignoring unusable snapshot {path}: {str(e)}")
+        return None
+    if use_cuda:
+        model = model.to("cuda")
+    return model, tokenizer
+
+
+def _save_snapshot(model, tokenizer, path: str, dtype_name: str) -> Optional[float]:
+    """Persist the materialized model; returns the seconds spent, or None when it was skipped"""
+    device_map = getattr(model, "hf_device_map", None) or {}
+    if any(device in ("cpu", "disk") for device in device_map.values()):
+        logger.warning("Model is offloaded across devices; not writing a snapshot")
+        return None
+    start = time.time()
+    try:
+        save_snapshot(model, tokenizer, path, dtype_name)
+    except Exception as e:
+        logger.warning(f"Could not write snapshot {path}: {str(e)}")
+        return None
+    logger.info(f"Wrote snapshot {path}")
+    return round(time.time() - start, 2)
+
+
+def load_model(model_name: str, config) -> ModelHandle:
     """
-    Lazily initialize and return the shared Hugging Face pipeline.
-    Safe to call from multiple agents; initialization is guarded by a lock.
+    Load a tokenizer and causal LM according to config's device and precision settings.
+    With config.snapshot_dir set, the first load writes a materialized snapshot and later
+    loads map it instead of converting the original checkpoint again.
     """
-    global _pipeline
-    if _pipeline is not None:
-        return _pipeline
+    start = time.time()
+    use_cuda = torch.cuda.is_available() and config.device != "cpu"
+    if use_cuda and config.precision == "int8":
+        # Dynamic quantization only has CPU kernels
+        logger.warning("int8 precision runs on CPU only; ignoring the available GPU")
+        use_cuda = False
+    torch_dtype, quantize = _resolve_precision(config, use_cuda)
+    dtype_name = "int8-dynamic" if quantize else str(torch_dtype).replace("torch.", "")
+
+    snapshot = snapshot_path(config.snapshot_dir, model_name, dtype_name) if config.snapshot_dir else None
+    loaded = _load_from_snapshot(snapshot, use_cuda) if snapshot and has_snapshot(snapshot) else None
+    if loaded is not None:
+        model, tokenizer = loaded
+        source, snapshot_seconds = "snapshot", None
+    else:
+        model, tokenizer = _load_from_checkpoint(model_name, config, use_cuda, torch_dtype, quantize)
+        source = "checkpoint"
+        snapshot_seconds = _save_snapshot(model, tokenizer, snapshot, dtype_name) if snapshot else None
+
+    # Batched prompts are left-padded so generation continues from the real last token
+    tokenizer.padding_side = "left"
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+
+    handle = ModelHandle(
+        name=model_name,
+        model=model,
+        tokenizer=tokenizer,
+        nbytes=model_nbytes(model),
+        device=str(model.device),
+        dtype=dtype_name
+    )
+    handle.load_report = {
+        "precision": config.precision,
+        "dtype": dtype_name,
+        "source": source,
+        "weights_gb": round(handle.nbytes / 1024**3, 3),
+        "load_seconds": round(time.time() - start, 2),
+        # ru_maxrss is in KB on Linux
+        "process_peak_rss_gb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024**2, 3),
+    }
+    if snapshot_seconds is not None:
+        handle.load_report["snapshot_write_seconds"] = snapshot_seconds
+    if config.load_report_tokens > 0:
+        handle.load_report["tokens_per_second"] = round(
+            _throughput_probe(model, tokenizer, config.load_report_tokens), 2
+        )
+    logger.info(f"Load report for {model_name}: {handle.load_report}")
+    return handle
+
+
+class ModelRegistry:
+    """Owns every model loaded in this process"""
+
+    SWAP_HISTORY = 20
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._models: Dict[str, ModelHandle] = {}
+        self._loading: Dict[str, threading.Event] = {}
+        self._role_overrides: Dict[str, str] = {}
+        self._known_sizes: Dict[str, int] = {}
+        self._eviction_listeners: List[Callable[[str], None]] = []
+        self._released = threading.Condition(self._lock)
+        self._swaps: Dict[str, SwapStatus] = {}
+        self.memory_budget_bytes = 0  # 0 means unlimited
+
+    def configure(self, config):
+        """Apply the memory budget from config"""
+        self.memory_budget_bytes = int(config.model_memory_budget_gb * 1024**3)
 
-    with _lock:
-        if _pipeline is not None:
-            return _pipeline
+    def add_eviction_listener(self, listener: Callable[[str], None]):
+        """Register a callback invoked with the model name whenever a model is unloaded"""
+        with self._lock:
+            if listener not in self._eviction_listeners:
+                self._eviction_listeners.append(listener)
 
-        model_name = _MODEL_NAME
-        logger.info(f"Loading model pipeline: {model_name}")
+    def set_role(self, role: str, model_name: str):
+        """Point a role at a different model name, overriding the config mapping"""
+        with self._lock:
+            self._role_overrides[role] = model_name
 
+    def resolve(self, role: str, config) -> str:
+        with self._lock:
+            return self._role_overrides.get(role) or config.model_for_role(role)
+
+    def acquire(self, role: str, config) -> ModelHandle:
+        """Return the model for role, loading it if needed, and take a lease on it"""
+        name = self.resolve(role, config)
+        while True:
+            with self._lock:
+                handle = self._models.get(name)
+                if handle is not None:
+                    handle.leases += 1
+                    handle.last_used = time.time()
+                    handle.roles.add(role)
+                    return handle
+                loading = self._loading.get(name)
+                if loading is None:
+                    loading = self._loading[name] = threading.Event()
+                    break
+            # Another thread is loading this model; wait and retry
+            loading.wait()
+
+        try:
+            handle = self._load(name, role, config)
+        finally:
+            with self._lock:
+                self._loading.pop(name).set()
+        return handle
+
+    def release(self, handle: ModelHandle):
+        with self._lock:
+            handle.leases = max(0, handle.leases - 1)
+            handle.last_used = time.time()
+            self._released.notify_all()
+
+    @contextmanager
+    def lease(self, role: str, config):
+        """Hold a model for the duration of a call so it cannot be evicted mid-generation"""
+        handle = self.acquire(role, config)
         try:
-            device_is_cuda = torch.cuda.is_available()
-            torch_dtype = torch.float16 if device_is_cuda else torch.float32
-            device_map = "auto" if device_is_cuda else None
-
-            tokenizer = AutoTokenizer.from_pretrained(model_name, trust_remote_code=trust_remote_code)
-
-            # from_pretrained with device_map (lets accelerate / transformers place tensors on GPU)
-            model = AutoModelForCausalLM.from_pretrained(
-                model_name,
-                trust_remote_code=trust_remote_code,
-                device_map=device_map,
-                low_cpu_mem_usage=True,
-                torch_dtype=torch_dtype,
+            yield handle
+        finally:
+            self.release(handle)
+
+    def _load(self, name: str, role: str, config) -> ModelHandle:
+        """Load name and register it already leased to the caller"""
+        with self._lock:
+            estimate = self._known_sizes.get(name) or max(
+                (h.nbytes for h in self._models.values()), default=0
             )
+            self._make_room(estimate)
 
-            _pipeline = pipeline(
-                "text-generation",
-                model=model,
-                tokenizer=tokenizer,
+        logger.info(f"Loading model: {name}")
+        start = time.time()
+        handle = load_model(name, config)
+        logger.info(f"Model {name} loaded in {time.time() - start:.1f}s ({handle.nbytes / 1024**3:.2f} GB)")
+
+        handle.roles.add(role)
+        handle.leases = 1
+        with self._lock:
+            self._known_sizes[name] = handle.nbytes
+            self._models[name] = handle
+            self._make_room(0, keep=name)
+            if self.memory_budget_bytes and self._total_bytes() > self.memory_budget_bytes:
+                self._unload(name)
+                raise ModelBudgetError(
+                    f"Model {name} ({handle.nbytes / 1024**3:.2f} GB) does not fit in the "
+                    f"{self.memory_budget_bytes / 1024**3:.2f} GB budget; all other models are in use"
+                )
+        return handle
+
+    def _total_bytes(self) -> int:
+        return sum(h.nbytes for h in self._models.values())
+
+    def _make_room(self, incoming: int, keep: Optional[str] = None):
+        """Evict idle models, least recently used first, until incoming bytes fit the budget"""
+        if not self.memory_budget_bytes:
+            return
+        idle = sorted(
+            (h for h in self._models.values() if h.leases == 0 and h.name != keep),
+            key=lambda h: h.last_used
+        )
+        for handle in idle:
+            if self._total_bytes() + incoming <= self.memory_budget_bytes:
+                break
+            logger.info(f"Evicting idle model {handle.name} to stay within memory budget")
+            self._unload(handle.name)
+
+    def _notify_unload(self, name: str):
+        for listener in list(self._eviction_listeners):
+            try:
+                listener(name)
+            except Exception:
+                logger.exception(f"Eviction listener failed for {name}")
+
+    def _unload(self, name: str):
+        handle = self._models.pop(name, None)
+        if handle is None:
+            return
+        self._notify_unload(name)
+        handle.model = None
+        handle.tokenizer = None
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def evict(self, name: str) -> bool:
+        """Unload a model if it is idle; returns whether it was unloaded"""
+        with self._lock:
+            handle = self._models.get(name)
+            if handle is None or handle.leases > 0:
+                return False
+            self._unload(name)
+            return True
+
+    def swap(self, role: str, config, new_model_name: Optional[str] = None) -> SwapStatus:
+        """
+        Start a double-buffered reload of role in the background and return its status.
+        The new model (new_model_name, or a fresh copy of the current one) loads and warms up
+        while the old one keeps serving; role switches over atomically once warmup passes, and
+        the old model is freed after its in-flight leases drain.
+        """
+        old_name = self.resolve(role, config)
+        with self._lock:
+            for status in self._swaps.values():
+                if status.role == role and status.finished_at is None:
+                    raise RuntimeError(f"A swap for role {role} is already in progress ({status.id})")
+            status = SwapStatus(
+                id=uuid.uuid4().hex[:12], role=role, from_model=old_name, to_model=new_model_name or old_name
             )
+            self._swaps[status.id] = status
+            # Keep a short history of finished swaps for the progress endpoint
+            finished = [s.id for s in self._swaps.values() if s.finished_at is not None]
+            for swap_id in finished[:-self.SWAP_HISTORY]:
+                del self._swaps[swap_id]
+        threading.Thread(
+            target=self._run_swap, args=(status, config), name=f"model-swap-{role}", daemon=True
+        ).start()
+        return status
+
+    def swap_status(self, swap_id: str) -> Optional[SwapStatus]:
+        with self._lock:
+            return self._swaps.get(swap_id)
 
-            # set default generation param on pipeline if needed (but we'll pass explicit args when calling)
-            logger.info("Model pipeline loaded successfully.")
-            return _pipeline
+    def _run_swap(self, status: SwapStatus, config):
+        new_handle = None
+        # The swap holds a lease on the new model until the switch so it cannot be evicted
+        holding = False
+        try:
+            with self._lock:
+                existing = self._models.get(status.to_model)
+                if existing is not None and status.to_model != status.from_model:
+                    # Already resident for another role; just share it
+                    existing.leases += 1
+                    new_handle, holding = existing, True
+                else:
+                    self._make_room(self._known_sizes.get(status.to_model, 0))
+            if new_handle is None:
+                logger.info(f"Swap {status.id}: loading {status.to_model} for role {status.role}")
+                new_handle = load_model(status.to_model, config)
+                new_handle.leases, holding = 1, True
+                with self._lock:
+                    incoming = self._total_bytes() + new_handle.nbytes
+                    if self.memory_budget_bytes and incoming > self.memory_budget_bytes:
+                        raise ModelBudgetError(
+                            f"Both {status.from_model} and {status.to_model} must fit in the "
+                            f"{self.memory_budget_bytes / 1024**3:.2f} GB budget during a swap"
+                        )
 
-        except Exception:
-            logger.exception("Failed to load model pipeline")
-            # leave _pipeline as None for callers to handle
-            raise
+            status.state = "warming"
+            tokens = max(config.load_report_tokens, 4)
+            status.warmup_tokens_per_second = round(
+                _throughput_probe(new_handle.model, new_handle.tokenizer, tokens), 2
+            )
 
+            with self._lock:
+                previous = self._models.get(status.to_model)
+                if previous is not new_handle:
+                    if previous is not None:
+                        # Same-name reload: per-model state bound to the old weights must go
+                        self._notify_unload(status.to_model)
+                    self._models[status.to_model] = new_handle
+                    self._known_sizes[status.to_model] = new_handle.nbytes
+                self._role_overrides[status.role] = status.to_model
+                new_handle.roles.add(status.role)
+                new_handle.leases -= 1
+                holding = False
+                status.state = "switched"
+                status.switched_at = time.time()
+            logger.info(f"Swap {status.id}: role {status.role} now served by {status.to_model}")
 
-def safe_reload(new_model_name: Optional[str] = None):
+            old = previous if status.to_model == status.from_model else self._models.get(status.from_model)
+            if old is not None and old is not new_handle:
+                self._drain(status, old, config)
+            status.state = "done"
+        except Exception as e:
+            logger.error(f"Swap {status.id} failed, {status.from_model} keeps serving: {str(e)}")
+            status.state = "failed"
+            status.error = str(e)
+            if new_handle is not None and self._models.get(new_handle.name) is not new_handle:
+                new_handle.model = None
+                gc.collect()
+            elif new_handle is not None and holding:
+                self.release(new_handle)
+        finally:
+            status.finished_at = time.time()
+
+    def _drain(self, status: SwapStatus, old: ModelHandle, config):
+        """Wait for in-flight requests on old, then free it unless another role still uses it"""
+        status.state = "draining"
+        deadline = time.time() + config.swap_drain_timeout
+        with self._lock:
+            while old.leases > 0 and time.time() < deadline:
+                status.draining_leases = old.leases
+                self._released.wait(timeout=min(1.0, max(0.0, deadline - time.time())))
+            status.draining_leases = old.leases
+            if old.leases > 0:
+                logger.warning(f"Swap {status.id}: {old.name} still has {old.leases} leases; leaving it to idle eviction")
+                return
+            if self._models.get(old.name) is old:
+                still_used = [r for r in old.roles if r != status.role and self.resolve(r, config) == old.name]
+                if still_used:
+                    logger.info(f"Swap {status.id}: keeping {old.name} for roles {still_used}")
+                    return
+                self._unload(old.name)
+            else:
+                # Replaced by a same-name reload; nothing else references the old weights
+                old.model = None
+                old.tokenizer = None
+                gc.collect()
+                if torch.cuda.is_available():
+                    torch.cuda.empty_cache()
+        logger.info(f"Swap {status.id}: freed previous {old.name}")
+
+    def resident(self) -> Dict[str, Any]:
+        """Report which models are resident, which roles use them and how large they are"""
+        now = time.time()
+        with self._lock:
+            models = [
+                {
+                    "name": h.name,
+                    "roles": sorted(h.roles),
+                    "bytes": h.nbytes,
+                    "gb": round(h.nbytes / 1024**3, 3),
+                    "device": h.device,
+                    "dtype": h.dtype,
+                    "leases": h.leases,
+                    "load_report": h.load_report,
+                    "idle_seconds": round(now - h.last_used, 1) if h.leases == 0 else 0.0,
+                    "loaded_at": h.loaded_at,
+                }
+                for h in self._models.values()
+            ]
+            return {
+                "models": models,
+                "total_bytes": self._total_bytes(),
+                "memory_budget_bytes": self.memory_budget_bytes,
+                "role_overrides": dict(self._role_overrides),
+                "swaps": [s.to_dict() for s in self._swaps.values()],
+            }
+
+
+_registry = ModelRegistry()
+_pipelines: Dict[str, Any] = {}
+# A cached pipeline holds a reference to the weights, so drop it when its model is evicted
+_registry.add_eviction_listener(lambda name: _pipelines.pop(name, None))
+
+
+def get_registry() -> ModelRegistry:
+    return _registry
+
+
+def get_pipeline(max_new_tokens: Optional[int] = None, trust_remote_code: bool = True, role: str = "chat"):
     """
-    Clear and reload the global pipeline. Use with caution during development.
+    Return a Hugging Face text-generation pipeline wrapping the registry's model for role.
+    The pipeline reuses the registry's weights and tokenizer, so no second copy is loaded.
     """
-    global _pipeline, _MODEL_NAME
-    with _lock:
-        if new_model_name:
-            _MODEL_NAME = new_model_name
-        _pipeline = None
-        return get_pipeline()
+    from app.agents.base_agent import SPARConfig
+
+    config = SPARConfig.from_env()
+    with _registry.lease(role, config) as handle:
+        pipe = _pipelines.get(handle.name)
+        if pipe is None or pipe.model is not handle.model:
+            pipe = _pipelines[handle.name] = pipeline(
+                "text-generation",
+                model=handle.model,
+                tokenizer=handle.tokenizer,
+            )
+        return pipe
+
+
+def safe_reload(new_model_name: Optional[str] = None, role: str = "chat"):
+    """
+    Hot-swap role to new_model_name (or a fresh copy of its current model) and wait for it.
+    The old model keeps serving until the new one has loaded and passed warmup.
+    """
+    from app.agents.base_agent import SPARConfig
+
+    status = _registry.swap(role, SPARConfig.from_env(), new_model_name)
+    while status.finished_at is None:
+        time.sleep(0.5)
+    if status.state == "failed":
+        raise RuntimeError(f"Reload of role {role} failed: {status.error}")
+    return get_pipeline(role=role)
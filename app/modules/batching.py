@@ -0,0 +1,175 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .cancellation import CancelToken, PipelineCancelled, wait_future
+
+logger = logging.getLogger(__name__)
+
+# (max_new_tokens, temperature, do_sample, top_p, stop) - requests are only batched
+# together when every generation parameter matches.
+GenerationParams = Tuple
+
+
+@dataclass
+class BatchRequest:
+    """A single prompt waiting in the batching queue"""
+    text: str
+    length: int
+    params: GenerationParams
+    prefix: Optional[Any] = None
+    cancel: Optional[CancelToken] = None
+    future: Future = field(default_factory=Future)
+    enqueued_at: float = field(default_factory=time.time)
+
+
+class BatchingEngine:
+    """
+    Collects concurrent generation calls into a request queue and runs them as
+    batched model calls on a single worker thread.
+    Requests are grouped by generation parameters, then bucketed by prompt length
+    so that left-padding waste inside one batch stays bounded by bucket_width tokens.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[List[str], GenerationParams, List[Optional[Any]], List[Optional[CancelToken]]], List[str]],
+        max_batch_size: int = 4,
+        max_wait_ms: int = 10,
+        bucket_width: int = 64,
+    ):
+        self._run_batch = run_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max_wait_ms / 1000.0
+        self.bucket_width = max(1, bucket_width)
+        self._queue: "queue.Queue[BatchRequest]" = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._stats = {"requests": 0, "batches": 0, "batched_requests": 0, "max_batch_size_seen": 0, "cancelled": 0}
+        # Guards _stopping, so nothing is queued after stop() has asked the worker to exit
+        self._submit_lock = threading.Lock()
+        self._stopping = False
+        self._worker = threading.Thread(target=self._loop, name="spar-batching-engine", daemon=True)
+        self._worker.start()
+
+    def submit(self, text: str, length: int, params: GenerationParams, prefix: Optional[Any] = None, cancel: Optional[CancelToken] = None) -> Future:
+        """
+        Queue a prompt and return a future resolving to the generated text.
+        prefix is an opaque reusable-prefix descriptor handed back to run_batch; cancel is handed
+        back too, so run_batch can finish a cancelled row early while the rest of its batch decodes.
+        After stop() the future fails with RuntimeError, since the worker would never run it.
+        """
+        request = BatchRequest(text=text, length=length, params=params, prefix=prefix, cancel=cancel)
+        with self._submit_lock:
+            if self._stopping:
+                request.future.set_exception(RuntimeError("Batching engine is stopped"))
+            else:
+                self._queue.put(request)
+        return request.future
+
+    def generate(self, text: str, length: int, params: GenerationParams, prefix: Optional[Any] = None, cancel: Optional[CancelToken] = None) -> str:
+        """Blocking helper: submit a prompt and wait for its result, or until cancel fires"""
+        return wait_future(self.submit(text, length, params, prefix, cancel), cancel)
+
+    def stop(self):
+        """Finish queued work and let the worker thread exit; later submits are rejected"""
+        with self._submit_lock:
+            self._stopping = True
+            self._queue.put(None)
+
+    def stats(self) -> Dict[str, float]:
+        """Return batching counters (requests seen, batches run, mean batch size)"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["queue_depth"] = self._queue.qsize()
+        stats["mean_batch_size"] = (
+            stats["batched_requests"] / stats["batches"] if stats["batches"] else 0.0
+        )
+        return stats
+
+    def _collect(self) -> List[BatchRequest]:
+        """Block for the first request, then gather more until the batch window closes"""
+        pending = []
+        first = self._queue.get()
+        if first is not None:
+            pending.append(first)
+        deadline = time.time() + self.max_wait
+        while pending and len(pending) < self.max_batch_size:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is not None:
+                pending.append(request)
+        return pending
+
+    def _bucket(self, pending: List[BatchRequest]) -> List[List[BatchRequest]]:
+        """Group by generation params, then split each group into length buckets"""
+        groups: Dict[GenerationParams, List[BatchRequest]] = {}
+        for request in pending:
+            groups.setdefault(request.params, []).append(request)
+
+        batches = []
+        for requests in groups.values():
+            requests.sort(key=lambda r: r.length)
+            current: List[BatchRequest] = []
+            for request in requests:
+                if current and (
+                    len(current) >= self.max_batch_size
+                    or request.length - current[0].length > self.bucket_width
+                ):
+                    batches.append(current)
+                    current = []
+                current.append(request)
+            if current:
+                batches.append(current)
+        return batches
+
+    def _loop(self):
+        while not (self._stopping and self._queue.empty()):
+            pending = self._collect()
+            with self._stats_lock:
+                self._stats["requests"] += len(pending)
+            for batch in self._bucket(pending):
+                self._execute(batch)
+
+    def _execute(self, batch: List[BatchRequest]):
+        # Requests cancelled while queued never reach the model
+        live = []
+        for request in batch:
+            if request.cancel is not None and request.cancel.cancelled:
+                request.future.set_exception(PipelineCancelled(request.cancel.reason))
+                with self._stats_lock:
+                    self._stats["cancelled"] += 1
+            else:
+                live.append(request)
+        if not live:
+            return
+        batch = live
+
+        texts = [r.text for r in batch]
+        try:
+            start = time.time()
+            outputs = self._run_batch(texts, batch[0].params, [r.prefix for r in batch], [r.cancel for r in batch])
+            logger.info(
+                f"Batched generate: size={len(batch)}, "
+                f"lengths={[r.length for r in batch]}, time={time.time() - start:.2f}s"
+            )
+        except Exception as e:
+            logger.error(f"Batched generation failed: {str(e)}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+
+        with self._stats_lock:
+            self._stats["batches"] += 1
+            self._stats["batched_requests"] += len(batch)
+            self._stats["max_batch_size_seen"] = max(self._stats["max_batch_size_seen"], len(batch))
+        for request, output in zip(batch, outputs):
+            request.future.set_result(output)
@@ -0,0 +1,82 @@
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Optional
+
+# How often blocking waits wake up to look at their CancelToken
+CANCEL_POLL_SECONDS = 0.1
+
+
+class PipelineCancelled(Exception):
+    """Raised at the next checkpoint once a request's CancelToken is cancelled or past its deadline"""
+    def __init__(self, reason: str):
+        super().__init__(f"Pipeline cancelled: {reason}")
+        self.reason = reason
+
+
+class CancelToken:
+    """
+    Cooperative cancellation for one request, shared by every stage working on it.
+    cancel() may be called from any thread (e.g. the event loop when the client disconnects);
+    workers check the token between tokens, tests and debug attempts and stop at the next check.
+    deadline is an absolute time.time() after which the token counts as cancelled.
+    """
+
+    def __init__(self, deadline: Optional[float] = None):
+        self.deadline = deadline
+        self._event = threading.Event()
+        self._lock = threading.Lock()
+        self._reason: Optional[str] = None
+
+    @classmethod
+    def with_timeout(cls, seconds: Optional[float]) -> "CancelToken":
+        """Token whose deadline is seconds from now; None or <= 0 means no deadline"""
+        return cls(time.time() + seconds if seconds and seconds > 0 else None)
+
+    def cancel(self, reason: str = "cancelled"):
+        with self._lock:
+            if self._reason is None:
+                self._reason = reason
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        if self._event.is_set():
+            return True
+        if self.deadline is not None and time.time() >= self.deadline:
+            self.cancel("deadline exceeded")
+            return True
+        return False
+
+    @property
+    def reason(self) -> Optional[str]:
+        return self._reason
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left before the deadline, or None without one"""
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.time())
+
+    def raise_if_cancelled(self):
+        if self.cancelled:
+            raise PipelineCancelled(self._reason)
+
+    def wait(self, seconds: float) -> bool:
+        """Sleep up to seconds, waking early on cancel or deadline; returns whether the token is cancelled"""
+        remaining = self.remaining()
+        if remaining is not None:
+            seconds = min(seconds, remaining)
+        self._event.wait(max(0.0, seconds))
+        return self.cancelled
+
+
+def wait_future(future: Future, cancel: Optional[CancelToken]) -> Any:
+    """future.result(), but give up with PipelineCancelled as soon as cancel fires"""
+    if cancel is None:
+        return future.result()
+    while True:
+        try:
+            return future.result(timeout=CANCEL_POLL_SECONDS)
+        except FutureTimeoutError:
+            cancel.raise_if_cancelled()
@@ -0,0 +1,104 @@
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class QueueFullError(Exception):
+    """Raised when an executor is at its queue depth and cannot admit more work"""
+    def __init__(self, name: str, retry_after: int):
+        super().__init__(f"{name} queue is full, retry after {retry_after}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class BoundedExecutor:
+    """
+    Thread pool for blocking model- or subprocess-bound work called from async endpoints.
+    Admission control: at most max_queue_depth jobs may be queued or running at once;
+    anything beyond that is rejected immediately with QueueFullError instead of piling up.
+    """
+
+    def __init__(self, name: str, max_workers: int = 4, max_queue_depth: int = 16, retry_after: int = 5):
+        self.name = name
+        self.max_workers = max(1, max_workers)
+        self.max_queue_depth = max(self.max_workers, max_queue_depth)
+        self.retry_after = retry_after
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"spar-{name}")
+        self._lock = threading.Lock()
+        self._admitted = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._total_wait = 0.0
+        self._total_run = 0.0
+
+    def _admit(self):
+        with self._lock:
+            if self._admitted >= self.max_queue_depth:
+                self._rejected += 1
+                raise QueueFullError(self.name, self.retry_after)
+            self._admitted += 1
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """Run func(*args, **kwargs) on the pool without blocking the event loop"""
+        return await self.submit(func, *args, **kwargs)
+
+    def submit(self, func: Callable, *args, **kwargs) -> "asyncio.Future":
+        """
+        Admit and schedule func on the pool, returning an awaitable asyncio future.
+        Admission happens synchronously, so QueueFullError is raised before anything is queued.
+        Must be called from a running event loop.
+        """
+        self._admit()
+        submitted = time.time()
+
+        def job():
+            started = time.time()
+            with self._lock:
+                self._running += 1
+                self._total_wait += started - submitted
+            try:
+                return func(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._total_run += time.time() - started
+
+        def release(future):
+            # Runs when the job finishes or is cancelled before starting, so the slot
+            # is freed even if the awaiting request went away mid-flight.
+            with self._lock:
+                self._admitted -= 1
+                if future.cancelled() or future.exception() is not None:
+                    self._failed += 1
+                else:
+                    self._completed += 1
+
+        future = self._pool.submit(job)
+        future.add_done_callback(release)
+        return asyncio.wrap_future(future)
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return queue depth, utilisation and latency counters"""
+        with self._lock:
+            finished = self._completed + self._failed
+            return {
+                "max_workers": self.max_workers,
+                "max_queue_depth": self.max_queue_depth,
+                "running": self._running,
+                "queued": self._admitted - self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "avg_wait_seconds": self._total_wait / finished if finished else 0.0,
+                "avg_run_seconds": self._total_run / finished if finished else 0.0,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
@@ -19,11 +19,21 @@ class LLMMode(Enum):
     HEURISTIC_ONLY = 'heuristic_only'
     MOCK = 'mock'
 
-LLM_MODE: LLMMode = LLMMode.AUTO  # Change as needed
-
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 
+def _llm_mode_from_env() -> LLMMode:
+    """LLM_MODE from the environment; an unrecognised value falls back to AUTO instead of failing the import"""
+    value = os.getenv("LLM_MODE", LLMMode.AUTO.value)
+    try:
+        return LLMMode(value)
+    except ValueError:
+        logging.warning(f"Unknown LLM_MODE {value!r}, using {LLMMode.AUTO.value!r}; expected one of {[mode.value for mode in LLMMode]}")
+        return LLMMode.AUTO
+
+# LLM_MODE=mock also switches SPARConfig.from_env() to the mock generation backend
+LLM_MODE: LLMMode = _llm_mode_from_env()
+
 def load_method_keywords() -> dict:
     """
     Load method keywords from the template registry YAML file.
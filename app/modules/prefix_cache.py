@@ -0,0 +1,92 @@
+import logging
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PrefixEntry:
+    """Precomputed past_key_values for one agent's chat-templated system prefix"""
+    agent: str
+    prefix_ids: List[int]
+    past_key_values: Any
+    nbytes: int
+
+
+def kv_nbytes(past_key_values: Any) -> int:
+    """Approximate memory held by a KV cache (DynamicCache or legacy tuple form)"""
+    if hasattr(past_key_values, "to_legacy_cache"):
+        past_key_values = past_key_values.to_legacy_cache()
+    total = 0
+    for layer in past_key_values:
+        for tensor in layer:
+            total += tensor.numel() * tensor.element_size()
+    return total
+
+
+class PrefixCache:
+    """
+    LRU cache of system-prompt KV states shared across requests.
+    Bounded by total bytes; per-agent counters track hits, misses and prefill tokens saved.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[Tuple[str, str], PrefixEntry]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+
+    def _agent_stats(self, agent: str) -> Dict[str, int]:
+        return self._stats.setdefault(
+            agent, {"hits": 0, "misses": 0, "bypassed": 0, "prefill_tokens_saved": 0}
+        )
+
+    def get(self, agent: str, prefix_text: str) -> Optional[PrefixEntry]:
+        """Look up a prefix, refreshing its LRU position and counting a hit"""
+        with self._lock:
+            entry = self._entries.get((agent, prefix_text))
+            if entry is not None:
+                self._entries.move_to_end((agent, prefix_text))
+                self._agent_stats(agent)["hits"] += 1
+            return entry
+
+    def put(self, agent: str, prefix_text: str, prefix_ids: List[int], past_key_values: Any) -> PrefixEntry:
+        """Store a freshly computed prefix (counted as a miss) and evict down to the byte budget"""
+        entry = PrefixEntry(agent, prefix_ids, past_key_values, kv_nbytes(past_key_values))
+        with self._lock:
+            self._agent_stats(agent)["misses"] += 1
+            if entry.nbytes > self.max_bytes:
+                logger.warning(f"Prefix for {agent} ({entry.nbytes} bytes) exceeds cache budget, not cached")
+                return entry
+            old = self._entries.pop((agent, prefix_text), None)
+            if old is not None:
+                self._bytes -= old.nbytes
+            self._entries[(agent, prefix_text)] = entry
+            self._bytes += entry.nbytes
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes
+                logger.info(f"Evicted prefix cache entry for {evicted.agent}")
+        return entry
+
+    def record_saved(self, agent: str, tokens: int):
+        with self._lock:
+            self._agent_stats(agent)["prefill_tokens_saved"] += tokens
+
+    def record_bypass(self, agent: str):
+        """Count a request whose prefix could not be reused (batched or misaligned)"""
+        with self._lock:
+            self._agent_stats(agent)["bypassed"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "agents": {agent: dict(s) for agent, s in self._stats.items()},
+            }
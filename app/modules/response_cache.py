@@ -0,0 +1,109 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def response_key(**fields: Any) -> str:
+    """Content address of a generation request: sha256 over its canonical JSON form"""
+    payload = json.dumps(fields, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    Content-addressed cache of completed generations.
+    A bounded in-memory LRU sits in front of an optional directory of one JSON file per key,
+    which survives restarts. Disk hits are promoted back into memory.
+    """
+
+    def __init__(self, max_entries: int, disk_dir: str = ""):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "bypassed": 0, "disk_errors": 0}
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        # Two-character fan-out keeps directories small
+        return os.path.join(self.disk_dir, key[:2], f"{key}.json")
+
+    def _remember(self, key: str, response: str):
+        self._entries[key] = response
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, counting a memory hit, disk hit or miss"""
+        with self._lock:
+            response = self._entries.get(key)
+            if response is not None:
+                self._entries.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return response
+
+        response = self._read_disk(key) if self.disk_dir else None
+        with self._lock:
+            if response is None:
+                self._stats["misses"] += 1
+                return None
+            self._stats["disk_hits"] += 1
+            self._remember(key, response)
+        return response
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._remember(key, response)
+        if self.disk_dir:
+            self._write_disk(key, response)
+
+    def record_bypass(self):
+        """Count a generation that was not cacheable (unseeded sampling)"""
+        with self._lock:
+            self._stats["bypassed"] += 1
+
+    def _read_disk(self, key: str) -> Optional[str]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"Unreadable response cache entry {key}: {str(e)}")
+            with self._lock:
+                self._stats["disk_errors"] += 1
+            return None
+
+    def _write_disk(self, key: str, response: str):
+        """Write via a temp file and rename so readers never see a partial entry"""
+        path = self._path(key)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"response": response}, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not persist response cache entry {key}: {str(e)}")
+            with self._lock:
+                self._stats["disk_errors"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        hits = stats["memory_hits"] + stats["disk_hits"]
+        lookups = hits + stats["misses"]
+        stats["max_entries"] = self.max_entries
+        stats["disk_dir"] = self.disk_dir or None
+        stats["hit_rate"] = round(hits / lookups, 4) if lookups else 0.0
+        return stats
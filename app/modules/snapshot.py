@@ -0,0 +1,221 @@
+"""
+Materialized model snapshots.
+A snapshot holds a model exactly as it sits in memory after loading: final dtype, int8
+quantization already applied. It is stored as one safetensors file next to the config and
+tokenizer. Loading maps the file with MAP_PRIVATE, so weights are never copied or converted.
+Every process that loads the same snapshot shares the page cache, copy-on-write.
+"""
+
+import json
+import logging
+import os
+import re
+import shutil
+import struct
+import tempfile
+from itertools import chain
+from typing import Any, Dict, Tuple
+
+import torch
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_WEIGHTS = "model.safetensors"
+SNAPSHOT_META = "snapshot.json"
+SNAPSHOT_VERSION = 1
+
+SAFETENSORS_DTYPES = {
+    "F64": torch.float64,
+    "F32": torch.float32,
+    "F16": torch.float16,
+    "BF16": torch.bfloat16,
+    "I64": torch.int64,
+    "I32": torch.int32,
+    "I16": torch.int16,
+    "I8": torch.int8,
+    "U8": torch.uint8,
+    "BOOL": torch.bool,
+}
+
+
+def snapshot_path(snapshot_dir: str, model_name: str, dtype_name: str) -> str:
+    """Directory of the snapshot for a model name at a given materialized dtype"""
+    safe_name = re.sub(r"[^A-Za-z0-9_.-]+", "--", model_name)
+    return os.path.join(snapshot_dir, f"{safe_name}--{dtype_name}")
+
+
+def has_snapshot(path: str) -> bool:
+    return os.path.exists(os.path.join(path, SNAPSHOT_META))
+
+
+def read_safetensors_mmap(path: str) -> Tuple[Dict[str, torch.Tensor], Dict[str, str]]:
+    """
+    Map a safetensors file copy-on-write and return (tensors, metadata).
+    The tensors are views into the mapping; only the rare misaligned tensor is copied.
+    """
+    with open(path, "rb") as f:
+        header_len = struct.unpack("<Q", f.read(8))[0]
+        header = json.loads(f.read(header_len))
+    metadata = header.pop("__metadata__", {}) or {}
+    data_start = 8 + header_len
+
+    storage = torch.UntypedStorage.from_file(path, shared=False, nbytes=os.path.getsize(path))
+    buffer = torch.empty(0, dtype=torch.uint8).set_(storage)
+
+    tensors = {}
+    for name, info in header.items():
+        dtype = SAFETENSORS_DTYPES[info["dtype"]]
+        start, end = info["data_offsets"]
+        raw = buffer[data_start + start:data_start + end]
+        try:
+            tensor = raw.view(dtype)
+        except RuntimeError:
+            # The dtype view needs the offset aligned to the element size
+            tensor = raw.clone().view(dtype)
+        tensors[name] = tensor.view(info["shape"])
+    return tensors, metadata
+
+
+def _quantized_linears(model) -> Dict[str, Any]:
+    return {
+        name: module for name, module in model.named_modules()
+        if isinstance(module, torch.ao.nn.quantized.dynamic.Linear)
+    }
+
+
+def save_snapshot(model, tokenizer, path: str, dtype_name: str):
+    """
+    Write model (already in its final dtype/quantization) and tokenizer to path.
+    Dynamically quantized Linear layers are stored as their int8 values plus scale and zero point.
+    Tied tensors are stored once and recorded as aliases.
+    """
+    from safetensors.torch import save_file
+
+    tensors: Dict[str, torch.Tensor] = {}
+    aliases: Dict[str, str] = {}
+    parameters: Dict[str, bool] = {}
+    seen: Dict[Tuple, str] = {}
+    for name, tensor in chain(
+        ((n, t) for n, t in model.named_parameters(remove_duplicate=False)),
+        ((n, t) for n, t in model.named_buffers(remove_duplicate=False))
+    ):
+        parameters[name] = isinstance(tensor, torch.nn.Parameter)
+        key = (tensor.data_ptr(), tensor.dtype, tuple(tensor.shape))
+        if key in seen:
+            aliases[name] = seen[key]
+            continue
+        seen[key] = name
+        tensors[name] = tensor.detach().to("cpu").contiguous()
+
+    quantized = {}
+    for name, module in _quantized_linears(model).items():
+        weight, bias = module.weight(), module.bias()
+        entry = {"in_features": module.in_features, "out_features": module.out_features, "bias": bias is not None}
+        tensors[f"{name}.weight_int8"] = weight.int_repr().contiguous()
+        if weight.qscheme() in (torch.per_channel_affine, torch.per_channel_symmetric):
+            entry["axis"] = weight.q_per_channel_axis()
+            tensors[f"{name}.weight_scale"] = weight.q_per_channel_scales().contiguous()
+            tensors[f"{name}.weight_zero_point"] = weight.q_per_channel_zero_points().contiguous()
+        else:
+            tensors[f"{name}.weight_scale"] = torch.tensor([weight.q_scale()], dtype=torch.float64)
+            tensors[f"{name}.weight_zero_point"] = torch.tensor([weight.q_zero_point()], dtype=torch.int64)
+        if bias is not None:
+            tensors[f"{name}.bias"] = bias.detach().contiguous()
+        quantized[name] = entry
+
+    meta = {
+        "version": SNAPSHOT_VERSION,
+        "dtype": dtype_name,
+        # int8 models are rebuilt from an fp32 module tree with the quantized Linears swapped in
+        "skeleton_dtype": "float32" if quantized else dtype_name,
+        "parameters": parameters,
+        "aliases": aliases,
+        "quantized": quantized,
+        "torch_version": torch.__version__,
+    }
+
+    # Build in a temporary sibling directory and rename, so a crash never leaves half a snapshot
+    parent = os.path.dirname(os.path.abspath(path))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(dir=parent, prefix=".snapshot-")
+    try:
+        save_file(tensors, os.path.join(tmp_dir, SNAPSHOT_WEIGHTS), metadata={"format": "pt"})
+        model.config.save_pretrained(tmp_dir)
+        if getattr(model, "generation_config", None) is not None:
+            model.generation_config.save_pretrained(tmp_dir)
+        tokenizer.save_pretrained(tmp_dir)
+        with open(os.path.join(tmp_dir, SNAPSHOT_META), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        if os.path.exists(path):
+            shutil.rmtree(path)
+        os.replace(tmp_dir, path)
+    except Exception:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+
+
+def _set_tensor(model, name: str, tensor: torch.Tensor, is_parameter: bool, cache: Dict[int, Any]):
+    module_name, _, leaf = name.rpartition(".")
+    module = model.get_submodule(module_name) if module_name else model
+    if is_parameter:
+        # Tied names must end up sharing one Parameter object
+        parameter = cache.get(id(tensor))
+        if parameter is None:
+            parameter = cache[id(tensor)] = torch.nn.Parameter(tensor, requires_grad=False)
+        module._parameters[leaf] = parameter
+    else:
+        module._buffers[leaf] = tensor
+
+
+def _quantized_linear(name: str, entry: Dict[str, Any], tensors: Dict[str, torch.Tensor]):
+    int_repr = tensors[f"{name}.weight_int8"]
+    scale, zero_point = tensors[f"{name}.weight_scale"], tensors[f"{name}.weight_zero_point"]
+    if "axis" in entry:
+        weight = torch._make_per_channel_quantized_tensor(int_repr, scale, zero_point, entry["axis"])
+    else:
+        weight = torch._make_per_tensor_quantized_tensor(int_repr, float(scale[0]), int(zero_point[0]))
+    linear = torch.ao.nn.quantized.dynamic.Linear(
+        entry["in_features"], entry["out_features"], bias_=entry["bias"], dtype=torch.qint8
+    )
+    linear.set_weight_bias(weight, tensors.get(f"{name}.bias"))
+    return linear
+
+
+def load_snapshot(path: str):
+    """Rebuild (model, tokenizer) from a snapshot without reading the original checkpoint"""
+    from transformers import AutoConfig, AutoModelForCausalLM, AutoTokenizer, GenerationConfig
+
+    with open(os.path.join(path, SNAPSHOT_META), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {meta.get('version')}")
+
+    tensors, _ = read_safetensors_mmap(os.path.join(path, SNAPSHOT_WEIGHTS))
+    hf_config = AutoConfig.from_pretrained(path, trust_remote_code=True)
+    # Build the module tree without allocating weights; the mapped tensors are assigned below
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(
+            hf_config, torch_dtype=getattr(torch, meta["skeleton_dtype"]), trust_remote_code=True
+        )
+
+    for name, entry in meta["quantized"].items():
+        parent_name, _, child = name.rpartition(".")
+        parent = model.get_submodule(parent_name) if parent_name else model
+        setattr(parent, child, _quantized_linear(name, entry, tensors))
+
+    cache: Dict[int, Any] = {}
+    for name, is_parameter in meta["parameters"].items():
+        source = meta["aliases"].get(name, name)
+        _set_tensor(model, name, tensors[source], is_parameter, cache)
+
+    missing = [n for n, t in chain(model.named_parameters(), model.named_buffers()) if t.is_meta]
+    if missing:
+        raise ValueError(f"Snapshot does not cover {len(missing)} tensors, e.g. {missing[:3]}")
+
+    try:
+        model.generation_config = GenerationConfig.from_pretrained(path)
+    except OSError:
+        pass
+    model.eval()
+    tokenizer = AutoTokenizer.from_pretrained(path, trust_remote_code=True)
+    return model, tokenizer
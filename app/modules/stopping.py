@@ -0,0 +1,75 @@
+import re
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+FENCE = "```"
+
+# The OpenAI API accepts at most this many stop sequences per request
+MAX_SERVER_STOP_STRINGS = 4
+
+
+@dataclass(frozen=True)
+class StopSpec:
+    """
+    Per-call description of where a completion's useful output ends.
+    Backends stop decoding as soon as find_end() reports a cut point, and the
+    manager trims every response with trim() so all backends return the same text.
+    Frozen so it can be hashed into batching params and response cache keys.
+    """
+    stop_strings: Tuple[str, ...] = ()  # cut before the earliest occurrence
+    stop_on_fence: bool = False  # cut after the code fence that closes the first opened one
+    line_pattern: str = ""  # regex matched at the start of each line...
+    max_lines: int = 0  # ...cut after this many matching lines
+    end_pattern: str = ""  # cut after the first match of this regex (DOTALL)
+
+    def find_end(self, text: str, final: bool = False) -> Optional[int]:
+        """
+        Return the index the output should be cut at, or None to keep decoding.
+        While decoding (final=False) only complete lines count towards max_lines.
+        """
+        ends = []
+        for stop in self.stop_strings:
+            index = text.find(stop)
+            if index >= 0:
+                ends.append(index)
+
+        if self.stop_on_fence:
+            opening = text.find(FENCE)
+            # The opening fence runs to the end of its line (it may carry a language tag)
+            line_end = text.find("\n", opening) if opening >= 0 else -1
+            if line_end >= 0:
+                closing = text.find(FENCE, line_end)
+                if closing >= 0:
+                    ends.append(closing + len(FENCE))
+
+        if self.max_lines > 0 and self.line_pattern:
+            lines = text.split("\n")
+            if not final:
+                lines = lines[:-1]
+            matched, offset = 0, 0
+            for line in lines:
+                if re.match(self.line_pattern, line):
+                    matched += 1
+                    if matched == self.max_lines:
+                        ends.append(offset + len(line))
+                        break
+                offset += len(line) + 1
+
+        if self.end_pattern:
+            match = re.search(self.end_pattern, text, re.DOTALL)
+            if match:
+                ends.append(match.end())
+
+        return min(ends) if ends else None
+
+    def trim(self, text: str) -> str:
+        end = self.find_end(text, final=True)
+        return text if end is None else text[:end]
+
+    @property
+    def needs_client_side(self) -> bool:
+        """
+        True when the spec has rules a server-side stop list cannot express: fences, line
+        counts, patterns, or more stop strings than the OpenAI API accepts
+        """
+        return bool(self.stop_on_fence or self.max_lines or self.end_pattern or len(self.stop_strings) > MAX_SERVER_STOP_STRINGS)
@@ -0,0 +1,30 @@
+from .analysis import analysis_stats, analyze_code, check_code
+from .pool import SandboxPool, current_pool, get_pool, shutdown_pool
+from .profiler import parse_constraints, profile_complexity
+from .result_cache import TestResultCache, get_test_cache, source_key
+from .runner import SKIPPED_AFTER_FAILURE, ResourceLimits, TestBudget, combine_usage, resource_usage, run_in_sandbox
+from .cases import TestCase, parse_test, parse_tests
+
+__all__ = [
+    "SKIPPED_AFTER_FAILURE",
+    "ResourceLimits",
+    "SandboxPool",
+    "TestBudget",
+    "TestCase",
+    "TestResultCache",
+    "analysis_stats",
+    "analyze_code",
+    "check_code",
+    "combine_usage",
+    "current_pool",
+    "get_pool",
+    "get_test_cache",
+    "parse_constraints",
+    "parse_test",
+    "parse_tests",
+    "profile_complexity",
+    "resource_usage",
+    "run_in_sandbox",
+    "shutdown_pool",
+    "source_key",
+]
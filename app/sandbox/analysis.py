@@ -0,0 +1,224 @@
+import ast
+import builtins
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Set
+
+from .profiler import DEGREES, parse_constraints
+
+logger = logging.getLogger(__name__)
+
+# Calls that hang waiting for stdin, end or replace the worker, or run arbitrary code
+FORBIDDEN_CALLS = {
+    "input", "breakpoint", "exit", "quit", "eval", "exec", "__import__",
+    "sys.exit", "os._exit", "os.system", "os.popen", "os.fork", "os.kill", "os.killpg",
+    "os.remove", "os.unlink", "os.rmdir", "os.execv", "os.execvp", "os.spawnv", "shutil.rmtree",
+}
+# Modules whose import alone is a hazard: subprocesses, sockets, native code, or the signals and
+# rlimits the harness itself relies on
+FORBIDDEN_MODULES = {"subprocess", "socket", "ctypes", "multiprocessing", "signal", "resource", "shutil", "pty"}
+
+# Names the harness provides on top of the builtins
+HARNESS_NAMES = {"assert_raises", "__name__"}
+
+LOOP_DEPTH = "loop_depth"
+UNBOUNDED_RECURSION = "unbounded_recursion"
+FORBIDDEN_CALL = "forbidden_call"
+UNDEFINED_NAME = "undefined_name"
+SYNTAX_ERROR = "syntax_error"
+
+
+def _issue(kind: str, message: str, node: Optional[ast.AST] = None) -> Dict[str, Any]:
+    return {"kind": kind, "message": message, "line": getattr(node, "lineno", None)}
+
+
+def _is_constant_iterable(node: ast.AST) -> bool:
+    """range() over literals or a literal collection; looping over it does not grow with the input"""
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "range":
+        return all(isinstance(arg, ast.Constant) or (isinstance(arg, ast.UnaryOp) and isinstance(arg.operand, ast.Constant)) for arg in node.args)
+    return isinstance(node, ast.Constant) or (isinstance(node, (ast.List, ast.Tuple, ast.Set)) and all(isinstance(e, ast.Constant) for e in node.elts))
+
+
+def loop_depth(node: ast.AST) -> int:
+    """
+    Deepest nesting of for loops and comprehensions over input-sized iterables.
+    while loops are left out: inside a for loop they are usually a binary search or an
+    amortized two-pointer scan, not another factor of n. Nested functions count on their own.
+    """
+    deepest = 0
+    for child in ast.iter_child_nodes(node):
+        if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+            continue
+        depth = loop_depth(child)
+        if isinstance(child, (ast.For, ast.AsyncFor)) and not _is_constant_iterable(child.iter):
+            depth += 1
+        elif isinstance(child, ast.comprehension) and not _is_constant_iterable(child.iter):
+            depth += 1
+        deepest = max(deepest, depth)
+    if isinstance(node, (ast.ListComp, ast.SetComp, ast.DictComp, ast.GeneratorExp)):
+        # Generators of one comprehension nest left to right, but the walk above counted them side by side
+        generators = sum(1 for generator in node.generators if not _is_constant_iterable(generator.iter))
+        deepest = max(deepest, generators + max((loop_depth(part) for part in _comprehension_parts(node)), default=0))
+    return deepest
+
+
+def _comprehension_parts(node: ast.AST) -> List[ast.AST]:
+    if isinstance(node, ast.DictComp):
+        return [node.key, node.value]
+    return [node.elt]
+
+
+def _dotted(node: ast.AST, aliases: Dict[str, str]) -> Optional[str]:
+    """"os.system" for os.system(...), following import aliases such as `from os import system`"""
+    parts = []
+    while isinstance(node, ast.Attribute):
+        parts.append(node.attr)
+        node = node.value
+    if not isinstance(node, ast.Name):
+        return None
+    parts.append(aliases.get(node.id, node.id))
+    return ".".join(reversed(parts))
+
+
+def _calls_itself(function: ast.FunctionDef) -> bool:
+    for node in ast.walk(function):
+        if isinstance(node, ast.Call):
+            target = node.func
+            if isinstance(target, ast.Name) and target.id == function.name:
+                return True
+            if isinstance(target, ast.Attribute) and target.attr == function.name and isinstance(target.value, ast.Name) and target.value.id in ("self", "cls"):
+                return True
+    return False
+
+
+def _has_branch(function: ast.FunctionDef) -> bool:
+    """Whether any path could avoid the recursive call: a condition, short-circuit or loop"""
+    branches = (ast.If, ast.IfExp, ast.BoolOp, ast.Match, ast.While, ast.For, ast.Try, ast.comprehension)
+    return any(isinstance(node, branches) for node in ast.walk(function))
+
+
+def _bound_names(module: ast.Module) -> Set[str]:
+    """Every name the code binds anywhere; scopes are ignored, so only names never bound are reported"""
+    names = set(HARNESS_NAMES) | set(dir(builtins))
+    for node in ast.walk(module):
+        if isinstance(node, ast.Name) and isinstance(node.ctx, (ast.Store, ast.Del)):
+            names.add(node.id)
+        elif isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            names.add(node.name)
+        elif isinstance(node, ast.arg):
+            names.add(node.arg)
+        elif isinstance(node, (ast.Import, ast.ImportFrom)):
+            names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ExceptHandler) and node.name:
+            names.add(node.name)
+        elif isinstance(node, (ast.Global, ast.Nonlocal)):
+            names.update(node.names)
+        elif isinstance(node, (ast.MatchAs, ast.MatchStar)) and node.name:
+            names.add(node.name)
+        elif isinstance(node, ast.MatchMapping) and node.rest:
+            names.add(node.rest)
+    return names
+
+
+def analyze_code(code: str, constraints: str = "") -> Dict[str, Any]:
+    """
+    Static checks run before any test process is started.
+    Returns {"ok", "issues", "warnings", "loop_depth", "recursive"}; ok is False when the code
+    cannot parse, calls or imports something forbidden, uses a name it never defines, or recurses
+    without any base case. Loops nested deeper than the complexity stated in constraints allows
+    are only a warning: nesting overcounts loops over per-element sub-collections (an adjacency
+    list walk is O(V+E), not O(n^2)), so the profiler judges the actual growth.
+    """
+    try:
+        module = ast.parse(code)
+    except SyntaxError as e:
+        return {"ok": False, "issues": [_issue(SYNTAX_ERROR, f"SyntaxError: {e.msg}", e)], "warnings": [], "loop_depth": 0, "recursive": []}
+
+    issues = []
+    aliases: Dict[str, str] = {}
+    star_import = False
+    for node in ast.walk(module):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                if alias.name.split(".")[0] in FORBIDDEN_MODULES:
+                    issues.append(_issue(FORBIDDEN_CALL, f"Imports forbidden module {alias.name}", node))
+                aliases[alias.asname or alias.name] = alias.name
+        elif isinstance(node, ast.ImportFrom):
+            if (node.module or "").split(".")[0] in FORBIDDEN_MODULES:
+                issues.append(_issue(FORBIDDEN_CALL, f"Imports forbidden module {node.module}", node))
+            for alias in node.names:
+                star_import = star_import or alias.name == "*"
+                aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+    for node in ast.walk(module):
+        if isinstance(node, ast.Call):
+            name = _dotted(node.func, aliases)
+            if name in FORBIDDEN_CALLS:
+                issues.append(_issue(FORBIDDEN_CALL, f"Calls forbidden {name}()", node))
+
+    if not star_import:
+        bound = _bound_names(module)
+        reported = set()
+        for node in ast.walk(module):
+            if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load) and node.id not in bound and node.id not in reported:
+                reported.add(node.id)
+                issues.append(_issue(UNDEFINED_NAME, f"Name {node.id!r} is never defined or imported", node))
+
+    recursive = []
+    for node in ast.walk(module):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) and _calls_itself(node):
+            recursive.append(node.name)
+            if not _has_branch(node):
+                issues.append(_issue(UNBOUNDED_RECURSION, f"{node.name}() calls itself unconditionally", node))
+
+    depth = max((loop_depth(node) for node in ast.walk(module) if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef))), default=0)
+    depth = max(depth, loop_depth(module))
+    warnings = []
+    stated, _ = parse_constraints(constraints)
+    if stated is not None and depth > DEGREES[stated]:
+        warnings.append(_issue(LOOP_DEPTH, f"Loops over the input are nested {depth} deep, but {stated} is required"))
+
+    return {"ok": not issues, "issues": issues, "warnings": warnings, "loop_depth": depth, "recursive": recursive}
+
+
+class AnalysisStats:
+    """Counts of analyzed and rejected candidates, by issue and warning kind"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = {"checked": 0, "rejected": 0, "issues": {}, "warnings": {}}
+
+    def record(self, report: Dict[str, Any]):
+        with self._lock:
+            self._stats["checked"] += 1
+            if not report["ok"]:
+                self._stats["rejected"] += 1
+                for kind in {issue["kind"] for issue in report["issues"]}:
+                    self._stats["issues"][kind] = self._stats["issues"].get(kind, 0) + 1
+            for kind in {warning["kind"] for warning in report["warnings"]}:
+                self._stats["warnings"][kind] = self._stats["warnings"].get(kind, 0) + 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["issues"] = dict(self._stats["issues"])
+            stats["warnings"] = dict(self._stats["warnings"])
+        stats["rejection_rate"] = round(stats["rejected"] / stats["checked"], 4) if stats["checked"] else 0.0
+        return stats
+
+
+_stats = AnalysisStats()
+
+
+def analysis_stats() -> Dict[str, Any]:
+    return _stats.stats()
+
+
+def check_code(code: str, constraints: str = "") -> Dict[str, Any]:
+    """analyze_code() and count the outcome in analysis_stats()"""
+    report = analyze_code(code, constraints)
+    _stats.record(report)
+    if not report["ok"]:
+        logger.info(f"Static analysis rejected code: {'; '.join(issue['message'] for issue in report['issues'])}")
+    elif report["warnings"]:
+        logger.info(f"Static analysis warnings: {'; '.join(warning['message'] for warning in report['warnings'])}")
+    return report
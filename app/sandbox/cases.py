@@ -0,0 +1,159 @@
+import ast
+from dataclasses import dataclass
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+# kind values: a call compared with ==, a call expected to raise, or any other assert kept as source
+EQUALS = "equals"
+RAISES = "raises"
+ASSERT = "assert"
+
+
+@dataclass(frozen=True)
+class TestCase:
+    """
+    One generated test, parsed once from its assert line.
+    Expressions are stored as normalized source (ast.unparse), so two lines that differ only in
+    formatting, quoting or operand order of == become equal records and are deduplicated.
+    Frozen so it can be hashed and used as a key.
+    """
+    __test__ = False  # not a pytest test class
+
+    kind: str
+    function: str = ""  # expression for the callable under test, usually just its name
+    args: Tuple[str, ...] = ()
+    kwargs: Tuple[Tuple[str, str], ...] = ()
+    expected: str = ""  # EQUALS: expression for the expected value
+    exception: str = ""  # RAISES: expression for the expected exception class
+    statement: str = ""  # ASSERT: the normalized assert statement itself
+
+    @property
+    def call(self) -> str:
+        arguments = list(self.args) + [f"{name}={value}" for name, value in self.kwargs]
+        return f"{self.function}({', '.join(arguments)})"
+
+    @property
+    def source(self) -> str:
+        """The test as one canonical Python statement"""
+        if self.kind == EQUALS:
+            return f"assert {self.call} == {self.expected}"
+        if self.kind == RAISES:
+            arguments = [self.exception, self.function] + list(self.args) + [f"{name}={value}" for name, value in self.kwargs]
+            return f"assert_raises({', '.join(arguments)})"
+        return self.statement
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact JSON form for the sandbox protocol and the API: empty fields are left out"""
+        record: Dict[str, Any] = {"kind": self.kind}
+        if self.kind == ASSERT:
+            record["statement"] = self.statement
+            return record
+        record["function"] = self.function
+        if self.args:
+            record["args"] = list(self.args)
+        if self.kwargs:
+            record["kwargs"] = dict(self.kwargs)
+        if self.kind == EQUALS:
+            record["expected"] = self.expected
+        else:
+            record["exception"] = self.exception
+        return record
+
+    @classmethod
+    def from_dict(cls, record: Dict[str, Any]) -> "TestCase":
+        """Rebuild a record, re-parsing its expressions so client-supplied ones are valid and normalized"""
+        kind = record.get("kind")
+        if kind == ASSERT:
+            case = parse_test(record.get("statement", ""))
+            if case is None:
+                raise ValueError(f"Invalid test statement: {record.get('statement')!r}")
+            return case
+        if kind not in (EQUALS, RAISES):
+            raise ValueError(f"Unknown test kind: {kind!r}")
+        case = cls(
+            kind=kind,
+            function=_normalize(record.get("function", "")),
+            args=tuple(_normalize(arg) for arg in record.get("args", [])),
+            kwargs=tuple((str(name), _normalize(value)) for name, value in record.get("kwargs", {}).items()),
+            expected=_normalize(record.get("expected", "")) if kind == EQUALS else "",
+            exception=_normalize(record.get("exception", "")) if kind == RAISES else ""
+        )
+        return case
+
+
+def _normalize(expression: str) -> str:
+    try:
+        return ast.unparse(ast.parse(expression, mode="eval").body)
+    except SyntaxError as e:
+        raise ValueError(f"Invalid test expression {expression!r}: {e.msg}")
+
+
+def _split_call(call: ast.Call) -> Optional[Tuple[Tuple[str, ...], Tuple[Tuple[str, str], ...]]]:
+    """Positional and keyword argument sources; None if the call unpacks *args or **kwargs"""
+    if any(isinstance(arg, ast.Starred) for arg in call.args) or any(keyword.arg is None for keyword in call.keywords):
+        return None
+    return (
+        tuple(ast.unparse(arg) for arg in call.args),
+        tuple((keyword.arg, ast.unparse(keyword.value)) for keyword in call.keywords)
+    )
+
+
+def _parse_node(node: ast.stmt) -> Optional[TestCase]:
+    if isinstance(node, ast.Assert) and node.msg is not None:
+        # Structured records have nowhere to keep the message, so keep the whole statement
+        return TestCase(ASSERT, statement=ast.unparse(node))
+    # assert_raises(Exc, func, *args) as a statement, or wrapped in a redundant assert
+    call = node.value if isinstance(node, ast.Expr) else node.test if isinstance(node, ast.Assert) else None
+    if (
+        isinstance(call, ast.Call)
+        and isinstance(call.func, ast.Name)
+        and call.func.id == "assert_raises"
+        and len(call.args) >= 2
+    ):
+        split = _split_call(ast.Call(func=call.func, args=call.args[2:], keywords=call.keywords))
+        if split is not None:
+            return TestCase(RAISES, ast.unparse(call.args[1]), split[0], split[1], exception=ast.unparse(call.args[0]))
+
+    if not isinstance(node, ast.Assert):
+        return None
+    test = node.test
+    if isinstance(test, ast.Compare) and len(test.ops) == 1 and isinstance(test.ops[0], ast.Eq):
+        left, right = test.left, test.comparators[0]
+        # assert expected == solution(...) is the same test as assert solution(...) == expected
+        if not isinstance(left, ast.Call) and isinstance(right, ast.Call):
+            left, right = right, left
+        if isinstance(left, ast.Call):
+            split = _split_call(left)
+            if split is not None:
+                return TestCase(EQUALS, ast.unparse(left.func), split[0], split[1], expected=ast.unparse(right))
+    return TestCase(ASSERT, statement=ast.unparse(node))
+
+
+def parse_test(line: str) -> Optional[TestCase]:
+    """Parse one generated line; None if it is not valid Python or not a single assert/assert_raises"""
+    try:
+        module = ast.parse(line.strip())
+    except (SyntaxError, ValueError):
+        return None
+    if len(module.body) != 1:
+        return None
+    return _parse_node(module.body[0])
+
+
+def parse_tests(tests: Iterable[Union[str, Dict[str, Any], TestCase]]) -> List[TestCase]:
+    """
+    Parse raw lines, API records or existing cases into TestCases, in order, dropping
+    invalid lines and duplicates. Invalid records raise ValueError.
+    """
+    cases: List[TestCase] = []
+    seen = set()
+    for test in tests:
+        if isinstance(test, TestCase):
+            case = test
+        elif isinstance(test, dict):
+            case = TestCase.from_dict(test)
+        else:
+            case = parse_test(str(test))
+        if case is not None and case not in seen:
+            seen.add(case)
+            cases.append(case)
+    return cases
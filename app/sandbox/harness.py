@@ -0,0 +1,357 @@
+"""
+Test harness that runs inside a sandbox worker process.
+It is started by path in isolated mode and uses only the standard library, so candidate
+code never sees the app package.
+
+Protocol: one JSON job per line on stdin, {"code": str, "tests": [record], "timeout": float, "limits": {...}},
+where each record is a structured test (see app.sandbox.cases.TestCase.to_dict) or a plain
+statement string and limits is app.sandbox.runner.ResourceLimits.to_dict(). A profiling job has
+"profile": {"function": str, "params": [kind], "sizes": [int], "repeats": int} instead of tests
+(see app.sandbox.profiler). The worker serves jobs until stdin closes. Per job, one JSON object
+per line on stdout:
+    {"event": "loaded", "status": "ok"|"error"|"timeout", "error": str}
+    {"event": "result", "index": int, "status": "pass"|"fail"|"error"|"timeout", "error": str,
+     "time": float, "cpu_time": float, "peak_rss_kb": int}
+    {"event": "point", "n": int, "status": "ok"|"error"|"timeout", "seconds": float, "error": str}
+    {"event": "done", "dirty": str}
+Each job's candidate is loaded once to check that it runs; every test then executes it again into
+a fresh namespace, so module-level state (counters, memo dicts, mutable globals) cannot carry over.
+After each job the worker puts back the interpreter state the job changed (module attributes,
+sys and builtins included, the recursion limit, cwd and environment). "dirty" says why that was
+not enough, e.g. the job imported new modules, and the worker must not take another job.
+Limits are soft rlimits, so a later job can raise them again up to the hard limits the worker started with.
+"""
+
+import copy
+import json
+import os
+import random
+import resource
+import signal
+import sys
+import time
+from typing import Optional
+
+# Imported once at worker start so candidates using them do not pay for it per job, and do not
+# get the worker retired for importing a new module
+PRELOAD = ("typing", "collections", "heapq", "bisect", "math", "itertools", "functools", "re", "string", "operator")
+
+
+class TestTimeout(BaseException):
+    """A BaseException, so a candidate's bare `except Exception` cannot swallow it"""
+
+
+class CPULimitExceeded(BaseException):
+    """Raised on SIGXCPU once a test has used up its CPU seconds"""
+
+
+def assert_raises(expected, func, *args, **kwargs):
+    """Available to tests: assert_raises(ValueError, solution, a, b)"""
+    try:
+        func(*args, **kwargs)
+    except expected:
+        return
+    raise AssertionError(f"{getattr(expected, '__name__', expected)} not raised")
+
+
+def _on_alarm(signum, frame):
+    raise TestTimeout()
+
+
+def _on_cpu_limit(signum, frame):
+    raise CPULimitExceeded()
+
+
+def _set_soft_limit(which: int, value=None):
+    """Set a soft rlimit; None means as high as the hard limit allows"""
+    _, hard = resource.getrlimit(which)
+    if value is None or (hard != resource.RLIM_INFINITY and value > hard):
+        value = hard
+    resource.setrlimit(which, (value, hard))
+
+
+def apply_limits(limits: dict):
+    """Memory, file size and process limits for the whole job; a missing or 0 size is unlimited"""
+    _set_soft_limit(resource.RLIMIT_AS, limits.get("memory_mb", 0) * 1024 * 1024 or None)
+    _set_soft_limit(resource.RLIMIT_FSIZE, limits.get("file_mb", 0) * 1024 * 1024 or None)
+    # RLIMIT_NPROC counts every process of the user, so 0 forbids any new process or thread
+    _set_soft_limit(resource.RLIMIT_NPROC, None if limits.get("allow_subprocesses", True) else 0)
+
+
+def _cpu_seconds() -> float:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _reset_peak_rss():
+    """Restart the peak-RSS high-water mark so it covers just the next test (Linux only)"""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+    except OSError:
+        pass
+
+
+def _peak_rss_kb() -> int:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+# (cpu_time, peak_rss_kb) of the last _run_measured call, recorded even when it raised
+measured = [0.0, 0]
+
+
+def _run_measured(timeout: float, cpu_seconds: int, func, *args):
+    """
+    Run func under the wall-clock timeout and a CPU-seconds budget, recording its usage in measured.
+    The budget is a soft RLIMIT_CPU just above what this worker has already used.
+    """
+    _reset_peak_rss()
+    cpu_started = _cpu_seconds()
+    if cpu_seconds > 0:
+        _set_soft_limit(resource.RLIMIT_CPU, int(cpu_started) + 1 + cpu_seconds)
+    try:
+        _run_limited(timeout, func, *args)
+    finally:
+        if cpu_seconds > 0:
+            _set_soft_limit(resource.RLIMIT_CPU)
+        measured[:] = [round(_cpu_seconds() - cpu_started, 6), _peak_rss_kb()]
+
+
+def _run_limited(timeout: float, func, *args):
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        func(*args)
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _exec(source: str, namespace: dict, filename: str):
+    exec(compile(source, filename, "exec"), namespace)
+
+
+def _eval(expression: str, namespace: dict):
+    return eval(compile(expression, "<test>", "eval"), namespace)
+
+
+def check_case(case, namespace: dict):
+    """Run one test record against namespace, raising AssertionError if it does not hold"""
+    if isinstance(case, str):
+        _exec(case, namespace, "<test>")
+        return
+    if case["kind"] == "assert":
+        _exec(case["statement"], namespace, "<test>")
+        return
+    func = _eval(case["function"], namespace)
+    args = [_eval(arg, namespace) for arg in case.get("args", [])]
+    kwargs = {name: _eval(value, namespace) for name, value in case.get("kwargs", {}).items()}
+    if case["kind"] == "raises":
+        assert_raises(_eval(case["exception"], namespace), func, *args, **kwargs)
+        return
+    actual = func(*args, **kwargs)
+    expected = _eval(case["expected"], namespace)
+    if actual != expected:
+        arguments = case.get("args", []) + [f"{name}={value}" for name, value in case.get("kwargs", {}).items()]
+        raise AssertionError(f"{case['function']}({', '.join(arguments)}) returned {actual!r}, expected {expected!r}")
+
+
+def _new_namespace() -> dict:
+    return {"__name__": "__candidate__", "assert_raises": assert_raises}
+
+
+def load(code: str, timeout: float, cpu_seconds: int = 0):
+    """Execute the candidate once; returns (namespace, status, error)"""
+    namespace = _new_namespace()
+    try:
+        _run_measured(timeout, cpu_seconds, _exec, code, namespace, "<candidate>")
+    except TestTimeout:
+        return namespace, "timeout", "Timed out loading code"
+    except CPULimitExceeded:
+        return namespace, "timeout", "CPU time limit exceeded loading code"
+    except BaseException as e:
+        return namespace, "error", f"{type(e).__name__}: {str(e)}"
+    return namespace, "ok", ""
+
+
+def _load_and_check(code: str, test, namespace: Optional[dict]):
+    if namespace is None:
+        namespace = _new_namespace()
+        _exec(code, namespace, "<candidate>")
+    check_case(test, namespace)
+
+
+def run_test(code: str, test, timeout: float, cpu_seconds: int = 0, namespace: Optional[dict] = None) -> dict:
+    """
+    Run one test against a freshly executed copy of the candidate. Its functions' __globals__
+    is that new namespace, so nothing a previous test did to it is visible. namespace may be
+    the just-loaded one, as long as no test has run against it yet.
+    """
+    started = time.perf_counter()
+    status, error = "pass", ""
+    try:
+        _run_measured(timeout, cpu_seconds, _load_and_check, code, test, namespace)
+    except TestTimeout:
+        status, error = "timeout", "Test execution timed out"
+    except CPULimitExceeded:
+        status, error = "timeout", "CPU time limit exceeded"
+    except AssertionError as e:
+        status, error = "fail", str(e) or "Assertion failed"
+    except BaseException as e:
+        status, error = "error", f"{type(e).__name__}: {str(e)}"
+    return {
+        "status": status,
+        "error": error,
+        "time": round(time.perf_counter() - started, 6),
+        "cpu_time": measured[0],
+        "peak_rss_kb": measured[1]
+    }
+
+
+def make_input(kind: str, n: int, rng: random.Random):
+    """Synthetic argument of size n; kinds are chosen by app.sandbox.profiler.input_kinds"""
+    if kind == "int_list":
+        return [rng.randint(0, n) for _ in range(n)]
+    if kind == "str_list":
+        return ["".join(rng.choice("abcde") for _ in range(5)) for _ in range(n)]
+    if kind == "pairs":
+        return [[rng.randint(0, n), rng.randint(0, n)] for _ in range(n)]
+    if kind == "str":
+        return "".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(n))
+    if kind == "dict":
+        return {i: rng.randint(0, n) for i in range(n)}
+    if kind == "n":
+        return n
+    if kind == "float":
+        return rng.random() * n
+    # "small": a scalar next to the sized inputs, e.g. k or target
+    return rng.randint(1, 10)
+
+
+def run_profile(namespace: dict, profile: dict, timeout: float, send):
+    """
+    Time the function on inputs of growing size, keeping the best of a few runs per size.
+    Stops at the first size that errors or runs past timeout, since larger ones would too.
+    """
+    func = namespace.get(profile["function"])
+    if not callable(func):
+        send({"event": "point", "n": 0, "status": "error", "seconds": 0.0, "error": f"{profile['function']} is not defined"})
+        return
+    rng = random.Random(0)
+    for n in profile["sizes"]:
+        args = [make_input(kind, n, rng) for kind in profile["params"]]
+        best = None
+        try:
+            for _ in range(profile.get("repeats", 3)):
+                # Functions may sort or consume their arguments in place
+                call_args = copy.deepcopy(args)
+                started = time.perf_counter()
+                _run_limited(timeout, func, *call_args)
+                elapsed = time.perf_counter() - started
+                best = elapsed if best is None else min(best, elapsed)
+                if elapsed > timeout / 4:
+                    # Slow enough that one run is an accurate measurement
+                    break
+        except TestTimeout:
+            send({"event": "point", "n": n, "status": "timeout", "seconds": timeout, "error": ""})
+            return
+        except BaseException as e:
+            send({"event": "point", "n": n, "status": "error", "seconds": 0.0, "error": f"{type(e).__name__}: {str(e)}"})
+            return
+        send({"event": "point", "n": n, "status": "ok", "seconds": round(best, 9), "error": ""})
+
+
+def snapshot_state() -> dict:
+    """The process state a job could change outside its own namespace (see restore_state)"""
+    return {
+        "module_names": set(sys.modules),
+        "modules": {name: (module, dict(vars(module))) for name, module in list(sys.modules.items()) if hasattr(module, "__dict__")},
+        "recursion_limit": sys.getrecursionlimit(),
+        "cwd": os.getcwd(),
+        "environ": dict(os.environ),
+    }
+
+
+def restore_state(snapshot: dict) -> str:
+    """
+    Put back what a job changed since snapshot: rebound or added attributes of every module that
+    was already loaded (monkey-patched stdlib, sys and builtins), replaced sys.modules entries,
+    the recursion limit, cwd and environment. Returns why the worker is still not clean, or "":
+    modules imported by the job cannot be unloaded, and may have patched anything on import.
+    """
+    for name, (module, saved) in snapshot["modules"].items():
+        if sys.modules.get(name) is not module:
+            sys.modules[name] = module
+        current = vars(module)
+        for key in [key for key in current if key not in saved]:
+            del current[key]
+        for key, value in saved.items():
+            if key not in current or current[key] is not value:
+                current[key] = value
+    sys.setrecursionlimit(snapshot["recursion_limit"])
+    try:
+        os.chdir(snapshot["cwd"])
+    except OSError as e:
+        return f"Cannot return to {snapshot['cwd']}: {str(e)}"
+    if dict(os.environ) != snapshot["environ"]:
+        os.environ.clear()
+        os.environ.update(snapshot["environ"])
+    imported = sorted(set(sys.modules) - snapshot["module_names"])
+    if imported:
+        return f"Job imported {', '.join(imported[:5])}" + (f" and {len(imported) - 5} more" if len(imported) > 5 else "")
+    return ""
+
+
+def run_job(job: dict, send):
+    timeout = float(job["timeout"])
+    limits = job.get("limits", {})
+    cpu_seconds = limits.get("cpu_seconds", 0)
+    snapshot = snapshot_state()
+    apply_limits(limits)
+    try:
+        namespace, status, error = load(job["code"], timeout, cpu_seconds)
+        send({"event": "loaded", "status": status, "error": error})
+        if status == "ok" and "profile" in job:
+            run_profile(namespace, job["profile"], timeout, send)
+        elif status == "ok":
+            for index, test in enumerate(job["tests"]):
+                # The first test can use the namespace from the load check; later ones start afresh
+                send({"event": "result", "index": index, **run_test(job["code"], test, timeout, cpu_seconds, namespace if index == 0 else None)})
+    finally:
+        # Lift the limits between jobs; the next job sets its own
+        apply_limits({})
+        dirty = restore_state(snapshot)
+    send({"event": "done", "dirty": dirty})
+
+
+def main():
+    # Keep the protocol on private copies of stdin/stdout: the candidate reads EOF from input()
+    # and anything it prints goes to /dev/null
+    jobs = os.fdopen(os.dup(0), "r")
+    protocol = os.fdopen(os.dup(1), "w")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    signal.signal(signal.SIGALRM, _on_alarm)
+    signal.signal(signal.SIGXCPU, _on_cpu_limit)
+    # Writing past RLIMIT_FSIZE then fails with OSError instead of killing the worker
+    signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+    for name in PRELOAD:
+        __import__(name)
+
+    def send(message: dict):
+        protocol.write(json.dumps(message) + "\n")
+        protocol.flush()
+
+    for line in jobs:
+        if line.strip():
+            run_job(json.loads(line), send)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,139 @@
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+from ..modules.cancellation import CANCEL_POLL_SECONDS, CancelToken
+from .runner import SandboxWorker
+
+logger = logging.getLogger(__name__)
+
+
+class SandboxPool:
+    """
+    Pre-started sandbox workers shared by every request in the process.
+    Workers have already paid for interpreter startup and the common DSA imports, so a test
+    run only waits for its own code. The harness puts back the interpreter state each job
+    changed; a worker is replaced after max_jobs jobs, or as soon as it crashes, hangs, times
+    out a test, is killed by a cancel or a fail-fast stop, or its job imported modules that
+    cannot be unloaded.
+    """
+
+    def __init__(self, size: int, max_jobs: int = 50):
+        self.size = max(1, size)
+        self.max_jobs = max(1, max_jobs)
+        self._idle: "queue.Queue[SandboxWorker]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stats = {
+            "jobs": 0,
+            "waiting": 0,
+            "total_wait_seconds": 0.0,
+            "max_wait_seconds": 0.0,
+            "recycled": {"max_jobs": 0, "timeout": 0, "crash": 0, "cancelled": 0, "abandoned": 0, "dirty": 0},
+        }
+        for _ in range(self.size):
+            self._idle.put(SandboxWorker())
+        logger.info(f"Started {self.size} sandbox workers")
+
+    @contextmanager
+    def worker(self, cancel: Optional[CancelToken] = None, deadline: Optional[float] = None):
+        """
+        Check out an idle worker for one job, waiting for one to free up if all are busy.
+        Raises TimeoutError if none is free by deadline.
+        """
+        waited_from = time.time()
+        with self._lock:
+            self._stats["waiting"] += 1
+        try:
+            while True:
+                try:
+                    worker = self._idle.get(timeout=CANCEL_POLL_SECONDS)
+                    break
+                except queue.Empty:
+                    if cancel is not None:
+                        cancel.raise_if_cancelled()
+                    if deadline is not None and time.time() >= deadline:
+                        raise TimeoutError()
+        finally:
+            waited = time.time() - waited_from
+            with self._lock:
+                self._stats["waiting"] -= 1
+        with self._lock:
+            self._stats["jobs"] += 1
+            self._stats["total_wait_seconds"] += waited
+            self._stats["max_wait_seconds"] = max(self._stats["max_wait_seconds"], waited)
+        try:
+            yield worker
+        finally:
+            self._release(worker)
+
+    def _release(self, worker: SandboxWorker):
+        reason = worker.retire_reason
+        if reason is None and not worker.alive:
+            reason = "crash"
+        if reason is None and worker.jobs >= self.max_jobs:
+            reason = "max_jobs"
+        if reason is not None or self._closed:
+            worker.close()
+            if self._closed:
+                return
+            with self._lock:
+                self._stats["recycled"][reason] += 1
+            worker = SandboxWorker()
+        self._idle.put(worker)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["recycled"] = dict(self._stats["recycled"])
+        stats["size"] = self.size
+        stats["idle"] = self._idle.qsize()
+        stats["avg_wait_seconds"] = stats["total_wait_seconds"] / stats["jobs"] if stats["jobs"] else 0.0
+        return stats
+
+    def shutdown(self):
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+
+def host_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+_pool: Optional[SandboxPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(config) -> Optional[SandboxPool]:
+    """The process-wide pool, started on first use; None when SANDBOX_POOL_SIZE is negative"""
+    global _pool
+    if config.sandbox_pool_size < 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = SandboxPool(config.sandbox_pool_size or host_cores(), config.sandbox_worker_max_jobs)
+    return _pool
+
+
+def current_pool() -> Optional[SandboxPool]:
+    """The process-wide pool if it has been started, without starting it"""
+    with _pool_lock:
+        return _pool
+
+
+def shutdown_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
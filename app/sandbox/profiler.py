@@ -0,0 +1,240 @@
+import ast
+import logging
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..modules.cancellation import CancelToken
+from .pool import get_pool
+from .runner import ResourceLimits, profile_in_sandbox
+
+logger = logging.getLogger(__name__)
+
+# (label, polynomial degree, log of the growth function); verdicts compare degrees, since
+# e.g. O(n) and O(n log n) cannot be told apart reliably from a few timings
+COMPLEXITY_CLASSES = [
+    ("O(1)", 0, lambda n: 0.0),
+    ("O(log n)", 0, lambda n: math.log(math.log2(n))),
+    ("O(n)", 1, lambda n: math.log(n)),
+    ("O(n log n)", 1, lambda n: math.log(n) + math.log(math.log2(n))),
+    ("O(n^2)", 2, lambda n: 2 * math.log(n)),
+    ("O(n^3)", 3, lambda n: 3 * math.log(n)),
+    ("O(2^n)", math.inf, lambda n: n * math.log(2)),
+]
+DEGREES = {label: degree for label, degree, _ in COMPLEXITY_CLASSES}
+
+# How "O(...)" bodies are written in prompts, after lowercasing and removing spaces and "*"
+COMPLEXITY_ALIASES = {
+    "1": "O(1)",
+    "logn": "O(log n)",
+    "n": "O(n)",
+    "m+n": "O(n)",
+    "n+m": "O(n)",
+    "v+e": "O(n)",
+    "nlogn": "O(n log n)",
+    "n^2": "O(n^2)",
+    "n2": "O(n^2)",
+    "nn": "O(n^2)",
+    "n^3": "O(n^3)",
+    "n3": "O(n^3)",
+    "2^n": "O(2^n)",
+}
+
+# Timings below this are dominated by call overhead and timer resolution
+MIN_MEASURABLE_SECONDS = 2e-5
+
+# A simpler class is preferred unless a more complex one fits this much better (variance of log residuals)
+FIT_TOLERANCE = 0.02
+
+SMALLEST_SIZE = 100
+
+# Parameter names that identify an input kind when there is no annotation
+NAME_KINDS = {
+    "int_list": ("nums", "arr", "array", "numbers", "values", "items", "lst", "list", "data", "heights", "prices", "xs"),
+    "str": ("s", "text", "string", "word", "t", "str"),
+    "pairs": ("grid", "matrix", "edges", "intervals", "pairs", "points"),
+    "int": ("n", "k", "m", "target", "x", "num", "size", "count", "amount"),
+}
+SIZED_KINDS = ("int_list", "str_list", "pairs", "str", "dict")
+
+
+def parse_complexity(text: str) -> Optional[str]:
+    """Complexity class of an "O(...)" body such as "n log n" or "n²", or None if unrecognized"""
+    body = text.lower().replace(" ", "").replace("*", "").replace("²", "^2").replace("³", "^3")
+    body = body.replace("log(n)", "logn").replace("log2n", "logn")
+    return COMPLEXITY_ALIASES.get(body)
+
+
+def parse_constraints(constraints: str) -> Tuple[Optional[str], Optional[int]]:
+    """
+    Stated complexity class and input size bound from an extract_constraints() string, e.g.
+    "size 10^5, time complexity O(n log n)". With several complexities the loosest one wins,
+    since "O(1) space" is picked up as a time complexity too.
+    """
+    stated = [parse_complexity(body) for body in re.findall(r"O\(([^)]+)\)", constraints or "")]
+    stated = [label for label in stated if label is not None]
+    complexity = max(stated, key=lambda label: DEGREES[label]) if stated else None
+    bounds = [int(base) ** int(exponent or 1) for base, exponent in re.findall(r"size\s+(\d+)(?:\^(\d+))?", constraints or "")]
+    return complexity, max(bounds) if bounds else None
+
+
+def _annotation_kind(annotation: str) -> Optional[str]:
+    annotation = annotation.lower().replace("typing.", "")
+    if re.match(r"(list|sequence|iterable|tuple)\[(list|tuple)", annotation):
+        return "pairs"
+    if re.match(r"(list|sequence|iterable|tuple)\[str", annotation):
+        return "str_list"
+    if re.match(r"(list|sequence|iterable|tuple)\b", annotation):
+        return "int_list"
+    for kind in ("str", "int", "float", "dict"):
+        if annotation == kind or annotation.startswith(f"{kind}["):
+            return kind
+    return None
+
+
+def input_kinds(code: str, function: str) -> Optional[List[str]]:
+    """
+    One synthetic input kind per required parameter of function (see harness.make_input), or None
+    if the function is missing or a parameter's kind cannot be inferred.
+    Integers scale with n unless a sized input exists, in which case they stay small (k, target).
+    """
+    try:
+        module = ast.parse(code)
+    except SyntaxError:
+        return None
+    definition = next((node for node in module.body if isinstance(node, ast.FunctionDef) and node.name == function), None)
+    if definition is None or definition.args.vararg is not None:
+        return None
+    arguments = definition.args.posonlyargs + definition.args.args
+    required = arguments[:len(arguments) - len(definition.args.defaults)]
+    if any(default is None for default in definition.args.kw_defaults):
+        return None
+
+    kinds = []
+    for argument in required:
+        kind = _annotation_kind(ast.unparse(argument.annotation)) if argument.annotation is not None else None
+        if kind is None:
+            kind = next((name_kind for name_kind, names in NAME_KINDS.items() if argument.arg.lower() in names), None)
+        if kind is None:
+            return None
+        kinds.append(kind)
+    sized = any(kind in SIZED_KINDS for kind in kinds)
+    return [("small" if sized else "n") if kind == "int" else kind for kind in kinds]
+
+
+def profile_sizes(bound: Optional[int], max_size: int) -> List[int]:
+    """Input sizes in half-decade steps from SMALLEST_SIZE up to the bound (capped at max_size)"""
+    limit = min(bound, max_size) if bound else max_size
+    if limit < SMALLEST_SIZE:
+        return [max(1, limit)]
+    sizes = []
+    n = float(SMALLEST_SIZE)
+    while round(n) <= limit:
+        sizes.append(round(n))
+        n *= math.sqrt(10)
+    if sizes[-1] < limit:
+        sizes.append(limit)
+    return sizes
+
+
+def fit_complexity(points: List[Tuple[int, float]]) -> Optional[Tuple[str, float]]:
+    """
+    Best-fitting class for (n, seconds) timings and the log of its constant factor, or None with
+    fewer than three measurable points. Each class is fitted in log space; the score is the
+    variance of the residuals, so a class fits when time / growth(n) is nearly constant.
+    """
+    points = [(n, seconds) for n, seconds in points if seconds >= MIN_MEASURABLE_SECONDS and n > 1]
+    if len(points) < 3:
+        return None
+    fits = []
+    for label, _, log_growth in COMPLEXITY_CLASSES:
+        residuals = [math.log(seconds) - log_growth(n) for n, seconds in points]
+        mean = sum(residuals) / len(residuals)
+        variance = sum((residual - mean) ** 2 for residual in residuals) / len(residuals)
+        fits.append((label, mean, variance))
+    best = min(variance for _, _, variance in fits)
+    label, log_constant, _ = next(fit for fit in fits if fit[2] <= best + FIT_TOLERANCE)
+    return label, log_constant
+
+
+def complexity_verdict(points: List[Dict[str, Any]], stated: Optional[str], bound: Optional[int], time_limit: float) -> Dict[str, Any]:
+    """
+    Judge harness point events against the stated complexity and size bound.
+    "fail" when the measured class grows faster than the stated one, or a run at or below the
+    bound takes (or is predicted to take) longer than time_limit; "inconclusive" when the
+    solution could not be run on synthetic inputs.
+    """
+    report: Dict[str, Any] = {
+        "verdict": "pass",
+        "reason": "",
+        "expected": stated,
+        "measured": None,
+        "bound": bound,
+        "points": [[point["n"], point["seconds"]] for point in points if point["status"] == "ok"],
+        "predicted_seconds_at_bound": None,
+    }
+    failed = next((point for point in points if point["status"] != "ok"), None)
+    if failed is not None and failed["status"] == "error":
+        report["verdict"] = "inconclusive"
+        report["reason"] = f"Solution could not run on synthetic input of size {failed['n']}: {failed['error']}"
+        return report
+    fit = fit_complexity(report["points"])
+    if fit is not None:
+        report["measured"], log_constant = fit
+    if failed is not None:
+        report["verdict"] = "fail"
+        report["reason"] = f"Took longer than {time_limit}s on an input of size {failed['n']}" + (f" (bound {bound})" if bound else "")
+        if report["measured"]:
+            report["reason"] += f"; runtime grows like {report['measured']}"
+        return report
+    if not report["points"]:
+        report["verdict"] = "inconclusive"
+        report["reason"] = "No timings were collected"
+        return report
+
+    if fit is not None:
+        if stated is not None and DEGREES[report["measured"]] > DEGREES[stated]:
+            report["verdict"] = "fail"
+            report["reason"] = f"Runtime grows like {report['measured']}, but {stated} is required"
+            return report
+
+    if bound is not None:
+        largest, seconds = report["points"][-1]
+        if largest < bound and fit is not None:
+            log_growth = next(growth for label, _, growth in COMPLEXITY_CLASSES if label == report["measured"])
+            seconds = math.exp(min(log_constant + log_growth(bound), 700.0))
+        report["predicted_seconds_at_bound"] = round(seconds, 6)
+        if seconds > time_limit:
+            report["verdict"] = "fail"
+            report["reason"] = f"Expected to take {seconds:.2f}s on an input of size {bound}, limit is {time_limit}s"
+            return report
+    report["reason"] = f"Runtime grows like {report['measured']}" if report["measured"] else "Too fast to measure at the profiled sizes"
+    return report
+
+
+def profile_complexity(code: str, function: str, constraints: str, config, cancel: Optional[CancelToken] = None) -> Dict[str, Any]:
+    """
+    Time function on synthetic inputs scaled up to the stated size bound and judge the result
+    against the stated constraints (see complexity_verdict). "skipped" when nothing is stated.
+    """
+    stated, bound = parse_constraints(constraints)
+    if stated is None and bound is None:
+        return {"verdict": "skipped", "reason": "No complexity or size constraint stated"}
+    kinds = input_kinds(code, function)
+    if kinds is None:
+        return {"verdict": "inconclusive", "reason": f"Cannot derive synthetic inputs from the signature of {function}", "expected": stated, "bound": bound}
+
+    profile = {"function": function, "params": kinds, "sizes": profile_sizes(bound, config.profile_max_size), "repeats": 3}
+    logger.info(f"Profiling {function}({', '.join(kinds)}) at sizes {profile['sizes']}")
+    run = profile_in_sandbox(
+        code,
+        profile,
+        config.profile_time_limit,
+        config.profile_budget,
+        cancel=cancel,
+        pool=get_pool(config),
+        limits=ResourceLimits.from_config(config)
+    )
+    if run["status"] != "ok":
+        return {"verdict": "inconclusive", "reason": f"Profiling did not run: {run['error']}", "expected": stated, "bound": bound}
+    return complexity_verdict(run["points"], stated, bound, config.profile_time_limit)
@@ -0,0 +1,444 @@
+import json
+import logging
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from ..modules.cancellation import CANCEL_POLL_SECONDS, CancelToken
+
+logger = logging.getLogger(__name__)
+
+HARNESS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "harness.py")
+
+# Extra time the parent allows beyond a test's timeout before killing its worker, so the
+# harness can normally report the timeout itself
+KILL_GRACE_SECONDS = 1.0
+
+# Adaptive timeouts: once some tests have finished, each test may take this many times the
+# slowest of them, but never less than the floor
+ADAPTIVE_TIMEOUT_FACTOR = 10.0
+ADAPTIVE_TIMEOUT_FLOOR_SECONDS = 1.0
+
+BUDGET_EXHAUSTED = "Test round time budget exhausted"
+SKIPPED_AFTER_FAILURE = "Skipped after an earlier failure"
+
+# Fields each harness event must carry (see harness.py)
+EVENT_FIELDS = {
+    "loaded": ("status", "error"),
+    "result": ("index", "status", "error", "time"),
+    "point": ("n", "status", "seconds", "error"),
+    "done": (),
+}
+
+
+def _result(status: str, error: str, elapsed: float = 0.0, cpu_time: Optional[float] = None, peak_rss_kb: Optional[int] = None, reported: bool = False) -> Dict[str, Any]:
+    # cpu_time and peak_rss_kb are only known for tests the harness measured itself. reported is
+    # True only for outcomes the harness sent for the test; the ones made up here (a crash, a
+    # timeout the parent enforced, a skip) say nothing lasting about the code
+    return {"status": status, "error": error, "time": round(elapsed, 6), "cpu_time": cpu_time, "peak_rss_kb": peak_rss_kb, "reported": reported}
+
+
+@dataclass(frozen=True)
+class ResourceLimits:
+    """rlimits the harness applies to each job (memory, file size, processes) and each test (CPU); 0 is unlimited"""
+    memory_mb: int = 0
+    cpu_seconds: int = 0
+    file_mb: int = 0
+    allow_subprocesses: bool = True
+
+    @classmethod
+    def from_config(cls, config) -> "ResourceLimits":
+        return cls(
+            memory_mb=config.test_memory_mb,
+            cpu_seconds=config.test_cpu_seconds,
+            file_mb=config.test_file_mb,
+            allow_subprocesses=config.test_allow_subprocesses
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class TestBudget:
+    """
+    Wall-clock budget for one round of tests, shared by all of its shards.
+    A test may run until the round deadline, but no longer than the adaptive timeout:
+    ADAPTIVE_TIMEOUT_FACTOR x the slowest finished test, between the floor and max_test_seconds.
+    """
+    __test__ = False  # not a pytest test class
+
+    def __init__(self, round_seconds: float, max_test_seconds: float):
+        self.deadline = time.time() + round_seconds
+        self.max_test_seconds = max_test_seconds
+        self._slowest: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._slowest = seconds if self._slowest is None else max(self._slowest, seconds)
+
+    def test_timeout(self) -> float:
+        with self._lock:
+            slowest = self._slowest
+        if slowest is None:
+            return self.max_test_seconds
+        return min(self.max_test_seconds, max(ADAPTIVE_TIMEOUT_FLOOR_SECONDS, ADAPTIVE_TIMEOUT_FACTOR * slowest))
+
+    def test_deadline(self, started: float) -> float:
+        return min(started + self.test_timeout() + KILL_GRACE_SECONDS, self.deadline)
+
+    @property
+    def exhausted(self) -> bool:
+        return time.time() >= self.deadline
+
+
+def resource_usage(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Roll up the measured tests among results: total CPU and wall time, and the highest peak RSS"""
+    measured = [result for result in results if result.get("cpu_time") is not None]
+    return {
+        "tests_measured": len(measured),
+        "cpu_time": round(sum(result["cpu_time"] for result in measured), 6),
+        "wall_time": round(sum(result["time"] for result in measured), 6),
+        "peak_rss_kb": max((result["peak_rss_kb"] or 0 for result in measured), default=0)
+    }
+
+
+def combine_usage(usages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Roll up several resource_usage() summaries, e.g. one per test round"""
+    return {
+        "rounds": len(usages),
+        "tests_measured": sum(usage["tests_measured"] for usage in usages),
+        "cpu_time": round(sum(usage["cpu_time"] for usage in usages), 6),
+        "wall_time": round(sum(usage["wall_time"] for usage in usages), 6),
+        "peak_rss_kb": max((usage["peak_rss_kb"] for usage in usages), default=0)
+    }
+
+
+class _Stopped(Exception):
+    """The round no longer needs this shard's results (fail-fast)"""
+
+
+class SandboxWorker:
+    """
+    One harness process serving jobs over its stdin/stdout pipes.
+    A reader thread turns its output into a queue of events. retire_reason is set once the
+    worker must not take another job (it hung, crashed, timed out a test, was cancelled or
+    abandoned mid-job, or its job left interpreter state behind).
+    """
+
+    def __init__(self):
+        self.process = subprocess.Popen(
+            [sys.executable, "-I", HARNESS],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True
+        )
+        self.jobs = 0
+        self.retire_reason: Optional[str] = None
+        self.events: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+        threading.Thread(target=self._read, name="spar-sandbox-reader", daemon=True).start()
+
+    def _read(self):
+        for line in self.process.stdout:
+            try:
+                self.events.put(json.loads(line))
+            except ValueError:
+                logger.warning(f"Ignoring malformed sandbox output: {line[:200]!r}")
+        self.events.put(None)
+
+    def send(self, code: str, tests: List[Union[str, Dict[str, Any]]], timeout: float, limits: ResourceLimits, profile: Optional[Dict[str, Any]] = None):
+        self.jobs += 1
+        job = {"code": code, "tests": tests, "timeout": timeout, "limits": limits.to_dict()}
+        if profile is not None:
+            job["profile"] = profile
+        try:
+            self.process.stdin.write(json.dumps(job) + "\n")
+            self.process.stdin.flush()
+        except OSError:
+            # The worker already died; next() reports the exit
+            pass
+
+    def next(self, deadline: Callable[[], float], cancel: Optional[CancelToken], stop: Optional[threading.Event] = None) -> Optional[Dict[str, Any]]:
+        """
+        Next event, or None once the process has exited.
+        deadline() is re-read on every poll, so adaptive timeouts tighten while waiting.
+        Raises TimeoutError past the deadline and _Stopped once stop is set.
+        """
+        while True:
+            remaining = deadline() - time.time()
+            if remaining <= 0:
+                raise TimeoutError()
+            try:
+                return self.events.get(timeout=min(remaining, CANCEL_POLL_SECONDS))
+            except queue.Empty:
+                # Keep an earlier, more specific reason such as "timeout" or "crash"
+                if cancel is not None and cancel.cancelled:
+                    self.retire_reason = self.retire_reason or "cancelled"
+                    cancel.raise_if_cancelled()
+                if stop is not None and stop.is_set():
+                    self.retire_reason = self.retire_reason or "abandoned"
+                    raise _Stopped()
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def close(self):
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+
+
+def _is_event(event: Any, kind: str, index: Optional[int] = None) -> bool:
+    """
+    Whether a line from the worker is the protocol event expected next. Anything else (a line
+    written by a process the candidate forked, or one left over from an earlier job) means the
+    worker is out of step and must be retired.
+    """
+    if not isinstance(event, dict) or event.get("event") != kind:
+        return False
+    if any(field not in event for field in EVENT_FIELDS[kind]):
+        return False
+    return index is None or event["index"] == index
+
+
+def _out_of_step(worker: SandboxWorker, event: Any) -> str:
+    worker.retire_reason = "crash"
+    logger.warning(f"Sandbox worker out of step, retiring it: {str(event)[:200]!r}")
+    return f"Sandbox sent an unexpected message: {str(event)[:200]}"
+
+
+def _finish_job(worker: SandboxWorker, done: Optional[Dict[str, Any]]):
+    """Retire worker if it exited or is out of step, or if the job left state behind that the harness could not undo"""
+    if done is None:
+        worker.retire_reason = "crash"
+    elif not _is_event(done, "done"):
+        _out_of_step(worker, done)
+    elif done.get("dirty") and worker.retire_reason is None:
+        logger.info(f"Retiring sandbox worker: {done['dirty']}")
+        worker.retire_reason = "dirty"
+
+
+def _timeout_result(budget: TestBudget, started: float) -> Dict[str, Any]:
+    error = BUDGET_EXHAUSTED if budget.exhausted else "Test execution timed out"
+    return _result("timeout", error, time.time() - started)
+
+
+def _run_once(
+    worker: SandboxWorker,
+    code: str,
+    tests: List[Tuple[int, Union[str, Dict[str, Any]]]],
+    budget: TestBudget,
+    cancel: Optional[CancelToken],
+    stop: threading.Event,
+    limits: ResourceLimits
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Run (index, test) pairs as one job on worker, yielding (index, result) for a prefix of them.
+    If the worker hangs or dies mid-test, that test gets a timeout/error result, the prefix
+    ends there and the worker is retired; the caller runs the rest on another worker.
+    """
+    worker.send(code, [test for _, test in tests], budget.max_test_seconds, limits)
+    started = time.time()
+    try:
+        loaded = worker.next(lambda: budget.test_deadline(started), cancel, stop)
+    except TimeoutError:
+        # Loading would hang again on any other worker
+        worker.retire_reason = "timeout"
+        timed_out = _timeout_result(budget, started)
+        yield from ((index, dict(timed_out)) for index, _ in tests)
+        return
+    except _Stopped:
+        return
+    if loaded is None:
+        worker.retire_reason = "crash"
+        exit_code = worker.process.wait()
+        yield from ((index, _result("error", f"Sandbox exited with code {exit_code} while loading code")) for index, _ in tests)
+        return
+    if not _is_event(loaded, "loaded"):
+        error = _out_of_step(worker, loaded)
+        yield from ((index, _result("error", error)) for index, _ in tests)
+        return
+    if loaded["status"] != "ok":
+        if loaded["status"] == "timeout":
+            worker.retire_reason = "timeout"
+        yield from ((index, _result(loaded["status"], loaded["error"])) for index, _ in tests)
+    else:
+        for position, (index, _) in enumerate(tests):
+            if stop.is_set():
+                # The rest of this job may already be queued; it must not count once the round is stopped
+                worker.retire_reason = worker.retire_reason or "abandoned"
+                return
+            started = time.time()
+            try:
+                event = worker.next(lambda: budget.test_deadline(started), cancel, stop)
+            except TimeoutError:
+                worker.retire_reason = "timeout"
+                yield index, _timeout_result(budget, started)
+                return
+            except _Stopped:
+                return
+            if event is None:
+                worker.retire_reason = "crash"
+                yield index, _result("error", f"Sandbox exited with code {worker.process.wait()}", time.time() - started)
+                return
+            if not _is_event(event, "result", position):
+                yield index, _result("error", _out_of_step(worker, event), time.time() - started)
+                return
+            if event["status"] == "timeout":
+                # An interrupted test may leave threads or half-updated module state behind
+                worker.retire_reason = "timeout"
+            yield index, _result(event["status"], event["error"], event["time"], event.get("cpu_time"), event.get("peak_rss_kb"), reported=True)
+
+    # Consume the end-of-job marker so the worker's next job starts in step; next() re-reads
+    # the deadline on every poll, so it is fixed here rather than computed in the lambda
+    done_by = time.time() + KILL_GRACE_SECONDS
+    try:
+        _finish_job(worker, worker.next(lambda: done_by, cancel))
+    except TimeoutError:
+        worker.retire_reason = "timeout"
+
+
+@contextmanager
+def _one_off_worker(cancel: Optional[CancelToken] = None, deadline: Optional[float] = None):
+    worker = SandboxWorker()
+    try:
+        yield worker
+    finally:
+        worker.close()
+
+
+def run_in_sandbox(
+    code: str,
+    tests: List[Union[str, Dict[str, Any]]],
+    budget: TestBudget,
+    on_result: Optional[Callable[[int, Dict[str, Any]], None]] = None,
+    cancel: Optional[CancelToken] = None,
+    pool=None,
+    fail_fast: bool = False,
+    limits: Optional[ResourceLimits] = None
+) -> List[Dict[str, Any]]:
+    """
+    Run every test (a statement or a TestCase.to_dict() record) against code, split into shards that run in parallel on separate workers
+    (one per pool worker, or a single fresh process without a pool). Each shard loads the code once.
+    Returns one {"status", "error", "time", "cpu_time", "peak_rss_kb", "reported"} dict per test, in order; on_result(index, result)
+    is called as each one arrives. With fail_fast the first non-passing test stops the round,
+    and tests that never ran come back "skipped", as do tests cut off by the round budget.
+    limits are applied by the harness; by default only the wall-clock timeouts apply.
+    Raises PipelineCancelled, killing the workers, once cancel fires.
+    """
+    limits = limits or ResourceLimits()
+    checkout = pool.worker if pool is not None else _one_off_worker
+    parallelism = min(len(tests), pool.size if pool is not None else 1)
+    results: Dict[int, Dict[str, Any]] = {}
+    lock = threading.Lock()
+    stop = threading.Event()
+
+    def deliver(index: int, result: Dict[str, Any]):
+        with lock:
+            results[index] = result
+            if result["status"] not in ("timeout", "skipped"):
+                budget.record(result["time"])
+            if fail_fast and result["status"] != "pass":
+                stop.set()
+            if on_result:
+                on_result(index, result)
+
+    def run_shard(shard: List[Tuple[int, Union[str, Dict[str, Any]]]]):
+        pending = shard
+        while pending and not stop.is_set() and not budget.exhausted:
+            if cancel is not None:
+                cancel.raise_if_cancelled()
+            try:
+                with checkout(cancel, budget.deadline) as worker:
+                    for index, result in _run_once(worker, code, pending, budget, cancel, stop, limits):
+                        deliver(index, result)
+            except TimeoutError:
+                # The budget ran out while waiting for a free worker
+                return
+            pending = [(index, test) for index, test in pending if index not in results]
+
+    # Round-robin so every shard gets a similar mix of tests
+    shards = [list(enumerate(tests))[i::parallelism] for i in range(parallelism)]
+    if len(shards) == 1:
+        run_shard(shards[0])
+    else:
+        with ThreadPoolExecutor(max_workers=len(shards), thread_name_prefix="spar-sandbox-shard") as executor:
+            futures = [executor.submit(run_shard, shard) for shard in shards]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                # One shard was cancelled; make the others let go of their workers too
+                stop.set()
+                raise
+
+    reason = SKIPPED_AFTER_FAILURE if stop.is_set() else BUDGET_EXHAUSTED
+    for index in range(len(tests)):
+        if index not in results:
+            deliver(index, _result("skipped", reason))
+    return [results[index] for index in range(len(tests))]
+
+
+def profile_in_sandbox(
+    code: str,
+    profile: Dict[str, Any],
+    run_timeout: float,
+    budget_seconds: float,
+    cancel: Optional[CancelToken] = None,
+    pool=None,
+    limits: Optional[ResourceLimits] = None
+) -> Dict[str, Any]:
+    """
+    Run one profiling job (see harness.run_profile) on a single worker, each timed call limited
+    to run_timeout and the whole job to budget_seconds.
+    Returns {"status", "error", "points"}: status is how loading the code went ("timeout" also
+    when the budget ran out first) and points holds the point events that arrived in time.
+    """
+    limits = limits or ResourceLimits()
+    checkout = pool.worker if pool is not None else _one_off_worker
+    deadline = time.time() + budget_seconds
+    points: List[Dict[str, Any]] = []
+    try:
+        with checkout(cancel, deadline) as worker:
+            worker.send(code, [], run_timeout, limits, profile=profile)
+            try:
+                loaded = worker.next(lambda: deadline, cancel)
+            except TimeoutError:
+                worker.retire_reason = "timeout"
+                raise
+            if loaded is None:
+                worker.retire_reason = "crash"
+                return {"status": "error", "error": f"Sandbox exited with code {worker.process.wait()} while loading code", "points": points}
+            if not _is_event(loaded, "loaded"):
+                return {"status": "error", "error": _out_of_step(worker, loaded), "points": points}
+            if loaded["status"] != "ok":
+                if loaded["status"] == "timeout":
+                    worker.retire_reason = "timeout"
+                return {"status": loaded["status"], "error": loaded["error"], "points": points}
+            while True:
+                try:
+                    event = worker.next(lambda: deadline, cancel)
+                except TimeoutError:
+                    worker.retire_reason = "timeout"
+                    break
+                if event is None or _is_event(event, "done"):
+                    _finish_job(worker, event)
+                    break
+                if not _is_event(event, "point"):
+                    _out_of_step(worker, event)
+                    break
+                if event["status"] == "timeout":
+                    worker.retire_reason = "timeout"
+                points.append(event)
+    except TimeoutError:
+        return {"status": "timeout", "error": "Profiling budget exhausted", "points": points}
+    return {"status": "ok", "error": "", "points": points}
@@ -15,6 +15,7 @@ import traceback
 import requests
 import re
 import time
+import json
 
 # Page configuration
 st.set_page_config(
@@ -713,7 +714,7 @@ if submitted and user_input.strip():
             pipeline_start = time.time()
             try:
                 full_pipeline_response = requests.post(
-                    "http://localhost:8000/api/full-pipeline",
+                    "http://localhost:8000/api/full-pipeline/stream",
                     json={
                         "user_prompt": original_prompt,
                         "language": "python",
@@ -721,12 +722,41 @@ if submitted and user_input.strip():
                         "signature": st.session_state["tua_output"].get("signature", "def solution(*args, **kwargs):"),
                         "edge_cases": st.session_state["tua_output"].get("edge_cases", "Handle all relevant edge cases")
                     },
-                    timeout=300
+                    stream=True,
+                    timeout=(10, 300)
                 )
-                pipeline_time = time.time() - pipeline_start
                 
                 if full_pipeline_response.status_code == 200:
-                    pipeline_result = full_pipeline_response.json()
+                    # Render stage events live as the pipeline streams them
+                    progress_placeholder = st.empty()
+                    code_placeholder = st.empty()
+                    streamed_code = ""
+                    pipeline_result = None
+                    for line in full_pipeline_response.iter_lines(decode_unicode=True):
+                        if not line:
+                            continue
+                        message = json.loads(line)
+                        event, data = message["event"], message["data"]
+                        if event == "code_token":
+                            streamed_code += data["text"]
+                            code_placeholder.code(streamed_code, language="python")
+                        elif event == "test_result":
+                            progress_placeholder.info(f"Attempt {data['attempt']}: {data['status']} - {data['test']}")
+                        elif event == "debug_attempt":
+                            progress_placeholder.info(f"Debug attempt {data['attempt']}: {'fixed' if data['success'] else 'failed'}")
+                        elif event == "result":
+                            pipeline_result = data
+                        elif event == "error":
+                            raise RuntimeError(data.get("details", "Pipeline failed"))
+                        elif event == "cancelled":
+                            raise RuntimeError(f"Pipeline cancelled: {data.get('details')}")
+                        else:
+                            progress_placeholder.info(f"Stage: {event}")
+                    progress_placeholder.empty()
+                    code_placeholder.empty()
+                    pipeline_time = time.time() - pipeline_start
+                    if pipeline_result is None:
+                        raise RuntimeError("Pipeline stream ended without a result")
                     st.session_state.pipeline_result = pipeline_result
                     
                     # Code Agent Card
@@ -786,10 +816,11 @@ if submitted and user_input.strip():
                                 icon = "✅" if res["status"] == "pass" else "❌" if res["status"] == "fail" else "❓"
                                 safe_test = html.escape(res.get("test", ""))
                                 error_html = f"<br><span style=\"color:#ff0000;\">Error: {html.escape(res.get('error', ''))}</span>" if res.get('error') != "No error" else ""
+                                cached_html = " <small>(cached)</small>" if res.get("cached") else ""
                                 
                                 st.markdown(f'<div class="test-bubble {test_class}">'
                                            f'<span class="test-icon">{icon}</span>'
-                                           f'<code>{safe_test}</code>'
+                                           f'<code>{safe_test}</code>{cached_html}'
                                            f'{error_html}'
                                            f'</div>', unsafe_allow_html=True)
                     
@@ -1,16 +1,30 @@
 import os
+import time
 os.environ["PYTORCH_CUDA_ALLOC_CONF"] = "expandable_segments:True"
+_import_started = time.perf_counter()
 
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
 from pydantic import BaseModel
 import uvicorn
+import asyncio
+import json
 import logging
+import sys
+import threading
 
-from app.agents.task_understanding_agent import generate_structured_prompt
-from app.agents.subtask_distributor import agent as subtask_distributor_agent
+# Keep these imports free of model loading and network calls; that happens in lifespan()
+from app.agents.task_understanding_agent import generate_structured_prompt, get_lemmatizer
+from app.agents.subtask_distributor import get_agent as get_subtask_distributor
 from app.agents.prompt_refiner import PromptRefinerAgent
 from app.agents.main_ss import MainSolutionSystem
-from app.agents.base_agent import SPARConfig
+from app.agents.base_agent import SPARConfig, LocalModelManager
+from app.modules.cancellation import CancelToken, PipelineCancelled
+from app.modules.executor import BoundedExecutor, QueueFullError
+from app.sandbox import analysis_stats, current_pool, get_pool, get_test_cache, shutdown_pool
+
+_import_seconds = time.perf_counter() - _import_started
 
 # Configure logging
 logging.basicConfig(
@@ -19,7 +33,82 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-app = FastAPI()
+# ---------- Startup ----------
+# Filled in by _startup(); /readyz reports it
+startup_state = {"ready": False, "error": None, "phases": {"imports": round(_import_seconds, 3)}}
+
+def _startup():
+    """Load models, build the agents and optionally warm up; runs once on a background thread"""
+    phases = startup_state["phases"]
+    config = SPARConfig.from_env()
+    started = time.perf_counter()
+    try:
+        phase_started = time.perf_counter()
+        LocalModelManager().initialize(config)
+        phases["backend"] = round(time.perf_counter() - phase_started, 3)
+
+        phase_started = time.perf_counter()
+        get_pool(config)
+        phases["sandbox"] = round(time.perf_counter() - phase_started, 3)
+
+        phase_started = time.perf_counter()
+        get_spar_system()
+        get_subtask_distributor()
+        phases["agents"] = round(time.perf_counter() - phase_started, 3)
+
+        # Any WordNet download happens here rather than inside the first /api/tua request
+        phase_started = time.perf_counter()
+        get_lemmatizer()
+        phases["lemmatizer"] = round(time.perf_counter() - phase_started, 3)
+
+        if config.warmup_tokens > 0:
+            phase_started = time.perf_counter()
+            LocalModelManager().warmup(["code", "chat"], config.warmup_tokens)
+            phases["warmup"] = round(time.perf_counter() - phase_started, 3)
+        startup_state["ready"] = True
+    except Exception as e:
+        startup_state["error"] = str(e)
+        logger.error(f"Startup failed: {str(e)}", exc_info=True)
+    phases["total"] = round(_import_seconds + time.perf_counter() - started, 3)
+    breakdown = ", ".join(f"{name} {seconds:.2f}s" for name, seconds in phases.items())
+    logger.info(f"Startup {'complete' if startup_state['ready'] else 'failed'}: {breakdown}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Serve /healthz straight away; /readyz flips once the models are loaded
+    threading.Thread(target=_startup, name="spar-startup", daemon=True).start()
+    yield
+    model_executor.shutdown()
+    sandbox_executor.shutdown()
+    shutdown_pool()
+
+app = FastAPI(lifespan=lifespan)
+
+# ---------- Executors ----------
+# Model-bound and subprocess-bound work runs off the event loop so health checks
+# and other requests keep being served while generations are in flight.
+_executor_config = SPARConfig.from_env()
+model_executor = BoundedExecutor(
+    "model",
+    max_workers=_executor_config.executor_workers,
+    max_queue_depth=_executor_config.executor_queue_depth,
+    retry_after=_executor_config.retry_after_seconds
+)
+sandbox_executor = BoundedExecutor(
+    "sandbox",
+    max_workers=_executor_config.sandbox_workers,
+    max_queue_depth=_executor_config.sandbox_queue_depth,
+    retry_after=_executor_config.retry_after_seconds
+)
+
+@app.exception_handler(QueueFullError)
+async def queue_full_handler(request: Request, exc: QueueFullError):
+    logger.warning(f"Rejected {request.url.path}: {exc}")
+    return JSONResponse(
+        status_code=503,
+        content={"error": "Server busy", "status": "failed", "details": str(exc)},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # ---------- Request Models ----------
 class PromptRequest(BaseModel):
@@ -34,27 +123,35 @@ class PRARequest(BaseModel):
     tua: dict
     std: dict
 
+class ReloadRequest(BaseModel):
+    role: str = "chat"
+    model_name: str = None  # omitted reloads the role's current model
+
 class FullPipelineRequest(BaseModel):
     user_prompt: str
     language: str = "python"
     refined_prompt: str = None
     signature: str = None
     edge_cases: str = None
+    timeout_seconds: float = None  # deadline for the whole run; omitted uses PIPELINE_TIMEOUT, 0 disables it
 
 # ---------- SPAR System Singleton ----------
 spar_system = None
+_spar_lock = threading.Lock()
 def get_spar_system():
     global spar_system
-    if spar_system is None:
-        config = SPARConfig()
-        spar_system = MainSolutionSystem(config)
+    # Called from executor threads, so guard against building two systems concurrently
+    with _spar_lock:
+        if spar_system is None:
+            config = SPARConfig.from_env()
+            spar_system = MainSolutionSystem(config)
     return spar_system
 
 # ---------- Individual Endpoints ----------
 @app.post("/api/tua")
 async def run_tua(request: PromptRequest):
     task_data = {"original_prompt": request.user_prompt, "language": request.language}
-    structured = generate_structured_prompt(task_data)
+    structured = await model_executor.run(generate_structured_prompt, task_data)
     logger.info(f"TUA output: {structured}")
     return structured
 
@@ -64,70 +161,103 @@ async def run_std(request: STDRequest):
         "structured_prompt": request.structured_prompt,
         "language": request.language,
     }
-    result = subtask_distributor_agent(input_dict)
+    result = await model_executor.run(lambda: get_subtask_distributor()(input_dict))
     logger.info(f"STD output: {result}")
     return {"std_result": result}
 
 @app.post("/api/pra")
 async def run_pra(request: PRARequest):
     logger.info(f"PRARequest received: {request}")
-    pra = PromptRefinerAgent()
     # Unwrap std_result if needed
     std_data = request.std.get("std_result", request.std)
-    result = pra.refine(request.tua, std_data)
+    result = await model_executor.run(lambda: PromptRefinerAgent().refine(request.tua, std_data))
     logger.info(f"PRA result: {result}")
     return result
 
 # ---------- Full Pipeline (Fixed) ----------
+# How often a running pipeline checks whether its client is still connected
+DISCONNECT_POLL_SECONDS = 0.5
+
+def _cancel_token(request: FullPipelineRequest) -> CancelToken:
+    timeout = request.timeout_seconds if request.timeout_seconds is not None else _executor_config.pipeline_timeout
+    return CancelToken.with_timeout(timeout)
+
+async def _cancel_on_disconnect(http_request: Request, cancel: CancelToken, job):
+    """Cancel the pipeline as soon as the client goes away, e.g. a closed tab or a resubmit"""
+    while not job.done() and not cancel.cancelled:
+        if await http_request.is_disconnected():
+            logger.info("Client disconnected, cancelling pipeline")
+            cancel.cancel("client disconnected")
+            return
+        await asyncio.sleep(DISCONNECT_POLL_SECONDS)
+
+def _full_pipeline(request: FullPipelineRequest, on_event=None, cancel: CancelToken = None):
+    """Blocking body of the full pipeline; runs on the model executor"""
+    emit = on_event or (lambda event, data: None)
+    spar = get_spar_system()
+
+    # Check if refined_prompt is provided, otherwise run TUA/STD/PRA
+    if request.refined_prompt:
+        logger.info("Using provided refined_prompt, skipping TUA/STD/PRA.")
+        code_prompt = request.refined_prompt
+        signature = request.signature or "def solution(*args, **kwargs):"
+        edge_cases = request.edge_cases or "Handle all relevant edge cases"
+    else:
+        logger.info(f"Processing prompt: {request.user_prompt}")
+
+        # Step 1 - TUA
+        task_data = {"original_prompt": request.user_prompt, "language": request.language}
+        tua_result = generate_structured_prompt(task_data)
+        logger.info(f"TUA output: {tua_result}")
+        emit("tua", tua_result)
+
+        # Step 2 - STD
+        std_result = get_subtask_distributor()({
+            "structured_prompt": tua_result["structured_prompt"],
+            "language": request.language
+        }, cancel=cancel)
+        logger.info(f"STD output: {std_result}")
+        emit("std", std_result)
+
+        # Step 3 - PRA
+        std_for_pra = std_result.get("std_result", std_result)
+        refined_prompts_data = PromptRefinerAgent().refine(tua_result, std_for_pra, cancel=cancel)
+        logger.info(f"PRA output: {refined_prompts_data}")
+        emit("pra", refined_prompts_data)
+
+        refined_prompts = refined_prompts_data.get("refined_prompts", [])
+        code_prompt = refined_prompts[0]["refined_prompt"] if refined_prompts else (
+            f"# Language: {request.language}\n"
+            f"# Task: {request.user_prompt}\n"
+            f"# Signature: {request.signature or tua_result.get('signature', 'def solution(*args, **kwargs):')}\n"
+            f"# Instructions: Write a complete solution. Handle all relevant edge cases."
+        )
+        signature = request.signature or tua_result.get("signature", "def solution(*args, **kwargs):")
+        edge_cases = request.edge_cases or tua_result.get("edge_cases", "Handle all relevant edge cases")
+
+    logger.info(f"Calling solve_problem with: code_prompt={code_prompt[:50]}..., signature={signature}, edge_cases={edge_cases}")
+    # Step 4 - Solve Problem
+    result = spar.solve_problem(request.user_prompt, code_prompt, signature, edge_cases, on_event=on_event, cancel=cancel)
+    logger.info(f"Full pipeline result: {result}")
+    return result
+
 @app.post("/api/full-pipeline")
-async def run_full_pipeline(request: FullPipelineRequest):
+async def run_full_pipeline(request: FullPipelineRequest, http_request: Request):
     """Run the complete SPAR pipeline including code generation, testing, and debugging"""
     logger.info(f"Full pipeline request received: {request.dict()}")
+    cancel = _cancel_token(request)
     try:
-        spar = get_spar_system()
-
-        # Check if refined_prompt is provided, otherwise run TUA/STD/PRA
-        if request.refined_prompt:
-            logger.info("Using provided refined_prompt, skipping TUA/STD/PRA.")
-            code_prompt = request.refined_prompt
-            signature = request.signature or "def solution(*args, **kwargs):"
-            edge_cases = request.edge_cases or "Handle all relevant edge cases"
-        else:
-            logger.info(f"Processing prompt: {request.user_prompt}")
-
-            # Step 1 - TUA
-            task_data = {"original_prompt": request.user_prompt, "language": request.language}
-            tua_result = generate_structured_prompt(task_data)
-            logger.info(f"TUA output: {tua_result}")
-
-            # Step 2 - STD
-            std_result = subtask_distributor_agent({
-                "structured_prompt": tua_result["structured_prompt"],
-                "language": request.language
-            })
-            logger.info(f"STD output: {std_result}")
-
-            # Step 3 - PRA
-            std_for_pra = std_result.get("std_result", std_result)
-            refined_prompts_data = PromptRefinerAgent().refine(tua_result, std_for_pra)
-            logger.info(f"PRA output: {refined_prompts_data}")
-
-            refined_prompts = refined_prompts_data.get("refined_prompts", [])
-            code_prompt = refined_prompts[0]["refined_prompt"] if refined_prompts else (
-                f"# Language: {request.language}\n"
-                f"# Task: {request.user_prompt}\n"
-                f"# Signature: {request.signature or tua_result.get('signature', 'def solution(*args, **kwargs):')}\n"
-                f"# Instructions: Write a complete solution. Handle all relevant edge cases."
-            )
-            signature = request.signature or tua_result.get("signature", "def solution(*args, **kwargs):")
-            edge_cases = request.edge_cases or tua_result.get("edge_cases", "Handle all relevant edge cases")
-
-        logger.info(f"Calling solve_problem with: code_prompt={code_prompt[:50]}..., signature={signature}, edge_cases={edge_cases}")
-        # Step 4 - Solve Problem
-        result = spar.solve_problem(request.user_prompt, code_prompt, signature, edge_cases)
-        logger.info(f"Full pipeline result: {result}")
-        return result
-
+        job = model_executor.submit(_full_pipeline, request, None, cancel)
+        watcher = asyncio.ensure_future(_cancel_on_disconnect(http_request, cancel, job))
+        try:
+            return await job
+        finally:
+            watcher.cancel()
+    except QueueFullError:
+        raise
+    except PipelineCancelled as pc:
+        logger.info(f"Full pipeline cancelled: {pc.reason}")
+        return {"error": "Cancelled", "status": "cancelled", "details": pc.reason}
     except ValueError as ve:
         logger.error(f"Validation error in full pipeline: {str(ve)}", exc_info=True)
         return {"error": "Validation failed", "status": "failed", "details": str(ve)}
@@ -135,17 +265,80 @@ async def run_full_pipeline(request: FullPipelineRequest):
         logger.error(f"Error in full pipeline: {str(e)}", exc_info=True)
         return {"error": "Processing failed", "status": "failed", "details": str(e)}
 
+def _encode_event(event: str, data, sse: bool) -> str:
+    payload = json.dumps(data, default=str)
+    if sse:
+        return f"event: {event}\ndata: {payload}\n\n"
+    return json.dumps({"event": event, "data": data}, default=str) + "\n"
+
+@app.post("/api/full-pipeline/stream")
+async def run_full_pipeline_stream(request: FullPipelineRequest, http_request: Request, format: str = "ndjson"):
+    """
+    Streaming variant of /api/full-pipeline.
+    Emits stage events (tua, std, pra, code_token, code, tests, test_result, test_round,
+    debug_attempt, refinement) as they happen, then a final result, cancelled or error event.
+    format=ndjson (default) or format=sse.
+    """
+    logger.info(f"Streaming pipeline request received: {request.dict()}")
+    sse = format == "sse"
+    loop = asyncio.get_running_loop()
+    events: asyncio.Queue = asyncio.Queue()
+
+    def on_event(event, data):
+        # Called from the executor thread
+        loop.call_soon_threadsafe(events.put_nowait, (event, data))
+
+    # Admission happens here, so a full queue is still a plain 503 rather than a broken stream
+    cancel = _cancel_token(request)
+    job = model_executor.submit(_full_pipeline, request, on_event, cancel)
+
+    async def stream():
+        watcher = asyncio.ensure_future(_cancel_on_disconnect(http_request, cancel, job))
+        try:
+            yield _encode_event("accepted", {"queue": model_executor.metrics()["queued"]}, sse)
+            while True:
+                next_event = asyncio.ensure_future(events.get())
+                done, _ = await asyncio.wait({next_event, job}, return_when=asyncio.FIRST_COMPLETED)
+                if next_event in done:
+                    yield _encode_event(*next_event.result(), sse)
+                    continue
+                next_event.cancel()
+                while not events.empty():
+                    yield _encode_event(*events.get_nowait(), sse)
+                try:
+                    yield _encode_event("result", job.result(), sse)
+                except PipelineCancelled as pc:
+                    logger.info(f"Streaming pipeline cancelled: {pc.reason}")
+                    yield _encode_event("cancelled", {"status": "cancelled", "details": pc.reason}, sse)
+                except Exception as e:
+                    logger.error(f"Error in streaming pipeline: {str(e)}", exc_info=True)
+                    yield _encode_event("error", {"error": "Processing failed", "status": "failed", "details": str(e)}, sse)
+                break
+        finally:
+            watcher.cancel()
+            if not job.done():
+                # The response was torn down mid-stream: the client is gone
+                cancel.cancel("client disconnected")
+
+    media_type = "text/event-stream" if sse else "application/x-ndjson"
+    return StreamingResponse(stream(), media_type=media_type)
+
 # ---------- Other Endpoints ----------
+def _code_generation(request: PromptRequest):
+    spar = get_spar_system()
+    task_data = {"original_prompt": request.user_prompt, "language": request.language}
+    tua_result = generate_structured_prompt(task_data)
+    signature = tua_result.get("signature", "def solution(*args, **kwargs):")
+    return spar.code_agent.generate_code(request.user_prompt, signature=signature)
+
 @app.post("/api/code-generation")
 async def run_code_generation(request: PromptRequest):
     try:
-        spar = get_spar_system()
-        task_data = {"original_prompt": request.user_prompt, "language": request.language}
-        tua_result = generate_structured_prompt(task_data)
-        signature = tua_result.get("signature", "def solution(*args, **kwargs):")
-        code = spar.code_agent.generate_code(request.user_prompt, signature=signature)
+        code = await model_executor.run(_code_generation, request)
         logger.info(f"Generated code: {code}")
         return {"code": code, "status": "success"}
+    except QueueFullError:
+        raise
     except Exception as e:
         logger.error(f"Error in code generation: {str(e)}", exc_info=True)
         return {"error": str(e), "status": "failed"}
@@ -153,27 +346,38 @@ async def run_code_generation(request: PromptRequest):
 @app.post("/api/test-generation")
 async def run_test_generation(request: dict):
     try:
-        spar = get_spar_system()
         problem = request.get("problem", "")
         code = request.get("code", "")
         edge_cases = request.get("edge_cases", "Handle all relevant edge cases")
         constraints = request.get("constraints", "Not specified")
-        test_cases = spar.tester.generate_tests(problem, code, edge_cases, constraints)
+        test_cases = await model_executor.run(
+            lambda: get_spar_system().tester.generate_tests(problem, code, edge_cases, constraints)
+        )
         logger.info(f"Generated test cases: {test_cases}")
         return {"test_cases": test_cases, "status": "success"}
+    except QueueFullError:
+        raise
     except Exception as e:
         logger.error(f"Error in test generation: {str(e)}", exc_info=True)
         return {"error": str(e), "status": "failed"}
 
 @app.post("/api/run-tests")
 async def run_tests(request: dict):
+    """
+    Run tests given as raw assert lines ("test_cases"), structured records ("test_ir"), or both.
+    The results carry both forms as well.
+    """
     try:
-        spar = get_spar_system()
         code = request.get("code", "")
-        test_cases = request.get("test_cases", [])
-        test_results = spar.tester.run_tests(code, test_cases)
+        test_cases = request.get("test_cases", []) + request.get("test_ir", [])
+        constraints = request.get("constraints", "")
+        test_results = await sandbox_executor.run(
+            lambda: get_spar_system().tester.run_tests(code, test_cases, constraints=constraints)
+        )
         logger.info(f"Test results: {test_results}")
         return {"test_results": test_results, "status": "success"}
+    except QueueFullError:
+        raise
     except Exception as e:
         logger.error(f"Error in running tests: {str(e)}", exc_info=True)
         return {"error": str(e), "status": "failed"}
@@ -181,22 +385,86 @@ async def run_tests(request: dict):
 @app.post("/api/debug-code")
 async def debug_code(request: dict):
     try:
-        spar = get_spar_system()
         problem = request.get("problem", "")
         code = request.get("code", "")
         error = request.get("error", "")
         test_cases = request.get("test_cases", [])
-        debug_result = spar.debugger({
+        debug_result = await model_executor.run(lambda: get_spar_system().debugger({
             "problem": problem,
             "code": code,
             "error": error,
             "test_results": {"test_cases": test_cases, "error": error}
-        })
+        }))
         logger.info(f"Debug result: {debug_result}")
         return {"debug_result": debug_result, "status": "success"}
+    except QueueFullError:
+        raise
     except Exception as e:
         logger.error(f"Error in debugging code: {str(e)}", exc_info=True)
         return {"error": str(e), "status": "failed"}
 
+@app.get("/api/models")
+async def models():
+    """Resident models, the roles using them and their memory footprint"""
+    # Only the local backend imports the registry (and torch); nothing can be resident otherwise
+    if "app.model_manager" not in sys.modules:
+        return {"models": [], "total_bytes": 0}
+    from app.model_manager import get_registry
+    return get_registry().resident()
+
+@app.get("/api/metrics")
+async def metrics():
+    """Executor queue metrics plus the sandbox pool's, test cache's, static analysis and generation backend's counters"""
+    # Never start the pool just to report on it, e.g. for a scrape before startup or after shutdown
+    pool = current_pool()
+    test_cache = get_test_cache(_executor_config)
+    return {
+        "model_executor": model_executor.metrics(),
+        "sandbox_executor": sandbox_executor.metrics(),
+        "sandbox_pool": pool.stats() if pool is not None else None,
+        "test_cache": test_cache.stats() if test_cache is not None else None,
+        "static_analysis": analysis_stats(),
+        "generation": LocalModelManager().backend_stats()
+    }
+
+@app.post("/api/models/reload")
+async def reload_model(request: ReloadRequest):
+    """
+    Hot-swap the model serving a role. The old model keeps serving while the new one loads
+    and warms up; poll the returned swap id for progress.
+    """
+    config = SPARConfig.from_env()
+    if config.backend != "local":
+        return JSONResponse(status_code=400, content={"error": f"Reload needs the local backend, not '{config.backend}'", "status": "failed"})
+    from app.model_manager import get_registry
+    try:
+        status = get_registry().swap(request.role, config, request.model_name)
+    except RuntimeError as e:
+        return JSONResponse(status_code=409, content={"error": str(e), "status": "failed"})
+    return JSONResponse(status_code=202, content=status.to_dict())
+
+@app.get("/api/models/reload/{swap_id}")
+async def reload_status(swap_id: str):
+    """Progress of a hot swap started by POST /api/models/reload"""
+    if "app.model_manager" not in sys.modules:
+        return JSONResponse(status_code=404, content={"error": "Unknown swap", "status": "failed"})
+    from app.model_manager import get_registry
+    status = get_registry().swap_status(swap_id)
+    if status is None:
+        return JSONResponse(status_code=404, content={"error": "Unknown swap", "status": "failed"})
+    return status.to_dict()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving the event loop"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: models are loaded and the agents are built"""
+    status_code = 200 if startup_state["ready"] else 503
+    status = "ready" if startup_state["ready"] else ("failed" if startup_state["error"] else "starting")
+    return JSONResponse(status_code=status_code, content={"status": status, **startup_state})
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
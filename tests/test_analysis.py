@@ -0,0 +1,73 @@
+import ast
+
+from app.sandbox.analysis import FORBIDDEN_CALL, LOOP_DEPTH, SYNTAX_ERROR, UNBOUNDED_RECURSION, UNDEFINED_NAME, analyze_code, loop_depth
+
+
+def kinds(report, key="issues"):
+    return {issue["kind"] for issue in report[key]}
+
+
+def test_clean_code_passes():
+    report = analyze_code("def solution(nums):\n    return sorted(nums)\n")
+    assert report["ok"]
+    assert report["issues"] == [] and report["warnings"] == []
+
+
+def test_rejects_syntax_error():
+    report = analyze_code("def solution(:\n")
+    assert not report["ok"]
+    assert kinds(report) == {SYNTAX_ERROR}
+
+
+def test_rejects_forbidden_calls_and_imports_through_aliases():
+    assert kinds(analyze_code("def solution():\n    return input()\n")) == {FORBIDDEN_CALL}
+    assert kinds(analyze_code("from os import system as run\ndef solution():\n    run('ls')\n")) == {FORBIDDEN_CALL}
+    assert kinds(analyze_code("import subprocess\n")) == {FORBIDDEN_CALL}
+
+
+def test_rejects_undefined_name_but_not_builtins_or_star_imports():
+    assert kinds(analyze_code("def solution(n):\n    return helper(n)\n")) == {UNDEFINED_NAME}
+    assert analyze_code("def solution(n):\n    return len(range(n))\n")["ok"]
+    assert analyze_code("from math import *\ndef solution(n):\n    return sqrt(n)\n")["ok"]
+
+
+def test_recursion_needs_a_base_case():
+    assert kinds(analyze_code("def f(n):\n    return f(n - 1)\n")) == {UNBOUNDED_RECURSION}
+    report = analyze_code("def f(n):\n    if n == 0:\n        return 0\n    return f(n - 1)\n")
+    assert report["ok"] and report["recursive"] == ["f"]
+
+
+def test_loop_depth_ignores_constant_loops_and_nested_functions():
+    module = ast.parse(
+        "def solution(nums):\n"
+        "    for i in range(3):\n"
+        "        for x in nums:\n"
+        "            pass\n"
+        "    def inner():\n"
+        "        for a in nums:\n"
+        "            for b in nums:\n"
+        "                pass\n"
+    )
+    assert loop_depth(module.body[0]) == 1
+
+
+def test_deep_nesting_is_only_a_warning():
+    code = "def solution(nums):\n    for a in nums:\n        for b in nums:\n            pass\n"
+    report = analyze_code(code, "time complexity O(n)")
+    assert report["ok"]
+    assert kinds(report, "warnings") == {LOOP_DEPTH}
+    assert report["loop_depth"] == 2
+
+
+def test_adjacency_list_walk_is_not_rejected_for_v_plus_e():
+    code = (
+        "def solution(n, adj):\n"
+        "    seen = 0\n"
+        "    for u in range(n):\n"
+        "        for v in adj[u]:\n"
+        "            seen += v\n"
+        "    return seen\n"
+    )
+    report = analyze_code(code, "time complexity O(V+E)")
+    assert report["ok"]
+    assert report["issues"] == []
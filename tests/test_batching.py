@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from app.modules.batching import BatchingEngine, BatchRequest
+from app.modules.cancellation import CancelToken, PipelineCancelled
+
+
+def upper(texts, params, prefixes, cancels):
+    return [text.upper() for text in texts]
+
+
+def request(length, params=("p",)):
+    return BatchRequest(text=str(length), length=length, params=params)
+
+
+def test_bucket_groups_by_params_then_splits_by_length_and_size():
+    engine = BatchingEngine(upper, max_batch_size=2, bucket_width=10)
+    try:
+        batches = engine._bucket([request(5), request(40), request(1), request(8, ("q",)), request(3)])
+        assert [[r.length for r in batch] for batch in batches] == [[1, 3], [5], [40], [8]]
+    finally:
+        engine.stop()
+
+
+def test_concurrent_requests_share_one_batch():
+    calls = []
+    release = threading.Event()
+
+    def run_batch(texts, params, prefixes, cancels):
+        calls.append(list(texts))
+        release.wait(2)
+        return upper(texts, params, prefixes, cancels)
+
+    engine = BatchingEngine(run_batch, max_batch_size=4, max_wait_ms=200)
+    try:
+        futures = [engine.submit(text, 1, ("p",)) for text in ("a", "b", "c")]
+        release.set()
+        assert [future.result(timeout=2) for future in futures] == ["A", "B", "C"]
+        assert calls == [["a", "b", "c"]]
+        assert engine.stats()["mean_batch_size"] == 3
+    finally:
+        engine.stop()
+
+
+def test_cancelled_request_never_reaches_the_model():
+    seen = []
+    engine = BatchingEngine(lambda texts, *rest: seen.extend(texts) or [t for t in texts], max_wait_ms=50)
+    try:
+        cancel = CancelToken()
+        cancel.cancel("client left")
+        future = engine.submit("gone", 1, ("p",), cancel=cancel)
+        with pytest.raises(PipelineCancelled):
+            future.result(timeout=2)
+        assert seen == []
+    finally:
+        engine.stop()
+
+
+def test_submit_after_stop_fails_instead_of_hanging():
+    engine = BatchingEngine(upper, max_wait_ms=1)
+    queued = engine.submit("a", 1, ("p",))
+    engine.stop()
+    late = engine.submit("b", 1, ("p",))
+    assert queued.result(timeout=2) == "A"
+    with pytest.raises(RuntimeError, match="stopped"):
+        late.result(timeout=2)
@@ -0,0 +1,40 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from app.modules.cancellation import CancelToken, PipelineCancelled, wait_future
+
+
+def test_token_without_deadline_only_cancels_on_request():
+    token = CancelToken.with_timeout(None)
+    assert token.remaining() is None
+    token.raise_if_cancelled()
+    token.cancel("client disconnected")
+    token.cancel("second reason is ignored")
+    with pytest.raises(PipelineCancelled) as excinfo:
+        token.raise_if_cancelled()
+    assert excinfo.value.reason == "client disconnected"
+
+
+def test_deadline_cancels_once_passed():
+    token = CancelToken.with_timeout(0.05)
+    assert not token.cancelled
+    assert token.wait(5)
+    assert token.reason == "deadline exceeded"
+    assert token.remaining() == 0.0
+
+
+def test_wait_future_gives_up_when_cancelled():
+    token = CancelToken()
+    pending = Future()
+    threading.Timer(0.05, token.cancel, args=("stop",)).start()
+    started = time.time()
+    with pytest.raises(PipelineCancelled):
+        wait_future(pending, token)
+    assert time.time() - started < 2
+
+    done = Future()
+    done.set_result(42)
+    assert wait_future(done, CancelToken()) == 42
@@ -0,0 +1,61 @@
+import pytest
+
+from app.sandbox.cases import ASSERT, EQUALS, RAISES, TestCase, parse_test, parse_tests
+
+
+def test_equality_with_a_call_becomes_equals():
+    case = parse_test("assert solution([1, 2], k=3) == 6")
+    assert case == TestCase(EQUALS, "solution", ("[1, 2]",), (("k", "3"),), expected="6")
+    assert case.source == "assert solution([1, 2], k=3) == 6"
+
+
+def test_reversed_equality_is_the_same_record():
+    assert parse_test("assert 6 == solution([1,2],k=3)") == parse_test("assert solution([1, 2], k=3) == 6")
+
+
+def test_assert_raises_becomes_raises_with_or_without_assert():
+    case = parse_test("assert_raises(ValueError, solution, -1)")
+    assert case == TestCase(RAISES, "solution", ("-1",), exception="ValueError")
+    assert parse_test("assert assert_raises(ValueError, solution, -1)") == case
+    assert case.source == "assert_raises(ValueError, solution, -1)"
+
+
+def test_other_asserts_are_kept_as_statements():
+    case = parse_test("assert solution(3) in (1, 2)")
+    assert case.kind == ASSERT
+    assert case.statement == "assert solution(3) in (1, 2)"
+    assert parse_test("assert solution(*args) == 1").kind == ASSERT
+
+
+def test_assert_message_is_kept():
+    case = parse_test('assert solution(1) == 2, "hint"')
+    assert case.kind == ASSERT
+    assert case.source == "assert solution(1) == 2, 'hint'"
+
+
+def test_invalid_lines_are_rejected():
+    assert parse_test("assert solution(") is None
+    assert parse_test("x = 1; assert x") is None
+    assert parse_test("print(1)") is None
+
+
+def test_parse_tests_drops_invalid_lines_and_duplicates_in_order():
+    cases = parse_tests([
+        "assert f(1) == 1",
+        "not python (",
+        "assert f( 1 )==1  # same test",
+        "assert 1 == f(1)",
+        {"kind": "equals", "function": "f", "args": ["2"], "expected": "4"},
+        "assert f(2) == 4",
+    ])
+    assert [case.source for case in cases] == ["assert f(1) == 1", "assert f(2) == 4"]
+
+
+def test_dict_form_round_trips_and_rejects_bad_records():
+    for line in ("assert f(1, x='a') == [1]", "assert_raises(KeyError, f, {})", "assert f(1) > 0"):
+        case = parse_test(line)
+        assert TestCase.from_dict(case.to_dict()) == case
+    with pytest.raises(ValueError):
+        TestCase.from_dict({"kind": "equals", "function": "f", "expected": "(("})
+    with pytest.raises(ValueError):
+        TestCase.from_dict({"kind": "nope"})
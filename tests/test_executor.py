@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+import pytest
+
+from app.modules.executor import BoundedExecutor, QueueFullError
+
+
+def test_rejects_work_beyond_queue_depth_and_frees_slots():
+    async def scenario():
+        executor = BoundedExecutor("test", max_workers=1, max_queue_depth=2, retry_after=7)
+        release = threading.Event()
+        try:
+            running = [executor.submit(release.wait, 2) for _ in range(2)]
+            with pytest.raises(QueueFullError) as excinfo:
+                executor.submit(release.wait, 2)
+            assert excinfo.value.retry_after == 7
+            assert executor.metrics()["rejected"] == 1
+
+            release.set()
+            await asyncio.gather(*running)
+            assert await executor.run(lambda: "admitted again") == "admitted again"
+            metrics = executor.metrics()
+            assert metrics["completed"] == 3 and metrics["queued"] == 0
+        finally:
+            release.set()
+            executor.shutdown()
+
+    asyncio.run(scenario())
+
+
+def test_failed_job_releases_its_slot():
+    async def scenario():
+        executor = BoundedExecutor("test", max_workers=1, max_queue_depth=1)
+        try:
+            with pytest.raises(ZeroDivisionError):
+                await executor.run(lambda: 1 / 0)
+            assert await executor.run(lambda: 1) == 1
+            assert executor.metrics()["failed"] == 1
+        finally:
+            executor.shutdown()
+
+    asyncio.run(scenario())
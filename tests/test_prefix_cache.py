@@ -0,0 +1,50 @@
+from app.modules.prefix_cache import PrefixCache, kv_nbytes
+
+
+class FakeTensor:
+    def __init__(self, nbytes):
+        self.nbytes = nbytes
+
+    def numel(self):
+        return self.nbytes
+
+    def element_size(self):
+        return 1
+
+
+def kv(nbytes):
+    """One layer of key and value tensors holding nbytes in total"""
+    return ((FakeTensor(nbytes // 2), FakeTensor(nbytes - nbytes // 2)),)
+
+
+def test_kv_nbytes_sums_every_layer():
+    assert kv_nbytes(kv(10) + kv(6)) == 16
+
+
+def test_evicts_least_recently_used_down_to_the_byte_budget():
+    cache = PrefixCache(max_bytes=100)
+    cache.put("coder", "a", [1], kv(40))
+    cache.put("tester", "b", [2], kv(40))
+    assert cache.get("coder", "a") is not None
+    cache.put("planner", "c", [3], kv(40))
+
+    assert cache.get("tester", "b") is None
+    assert cache.get("coder", "a") is not None
+    stats = cache.stats()
+    assert stats["entries"] == 2 and stats["bytes"] == 80
+    assert stats["agents"]["coder"] == {"hits": 2, "misses": 1, "bypassed": 0, "prefill_tokens_saved": 0}
+
+
+def test_oversized_prefix_is_returned_but_not_cached():
+    cache = PrefixCache(max_bytes=10)
+    entry = cache.put("coder", "a", [1, 2], kv(20))
+    assert entry.prefix_ids == [1, 2]
+    assert cache.get("coder", "a") is None
+    assert cache.stats()["bytes"] == 0
+
+
+def test_replacing_a_prefix_does_not_double_count_bytes():
+    cache = PrefixCache(max_bytes=100)
+    cache.put("coder", "a", [1], kv(30))
+    cache.put("coder", "a", [1], kv(50))
+    assert cache.stats()["bytes"] == 50
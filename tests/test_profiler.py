@@ -0,0 +1,51 @@
+from app.sandbox.profiler import complexity_verdict, fit_complexity, parse_constraints, profile_sizes
+
+SIZES = [100, 316, 1000, 3162, 10000]
+
+
+def timings(growth):
+    return [(n, growth(n)) for n in SIZES]
+
+
+def points(pairs, status="ok"):
+    return [{"n": n, "seconds": seconds, "status": status, "error": ""} for n, seconds in pairs]
+
+
+def test_fit_recovers_the_growth_class():
+    assert fit_complexity(timings(lambda n: 1e-3))[0] == "O(1)"
+    assert fit_complexity(timings(lambda n: 1e-6 * n))[0] == "O(n)"
+    assert fit_complexity(timings(lambda n: 1e-8 * n * n))[0] == "O(n^2)"
+
+
+def test_fit_needs_three_measurable_points():
+    assert fit_complexity([(100, 1e-3), (1000, 1e-2)]) is None
+    assert fit_complexity(timings(lambda n: 1e-7)) is None
+
+
+def test_parse_constraints_takes_the_loosest_complexity_and_largest_bound():
+    assert parse_constraints("size 10^5, time complexity O(n log n)") == ("O(n log n)", 100000)
+    assert parse_constraints("time complexity O(n), O(1) space, size 1000") == ("O(n)", 1000)
+    assert parse_constraints("") == (None, None)
+
+
+def test_profile_sizes_stop_at_the_bound():
+    assert profile_sizes(1000, 10 ** 6) == [100, 316, 1000]
+    assert profile_sizes(50, 10 ** 6) == [50]
+
+
+def test_verdict_fails_growth_faster_than_stated():
+    report = complexity_verdict(points(timings(lambda n: 1e-8 * n * n)), "O(n)", None, 1.0)
+    assert report["verdict"] == "fail" and report["measured"] == "O(n^2)"
+    assert complexity_verdict(points(timings(lambda n: 1e-6 * n)), "O(n)", None, 1.0)["verdict"] == "pass"
+
+
+def test_verdict_extrapolates_to_the_bound():
+    report = complexity_verdict(points(timings(lambda n: 1e-6 * n)), None, 10 ** 8, 1.0)
+    assert report["verdict"] == "fail"
+    assert round(report["predicted_seconds_at_bound"]) == 100
+
+
+def test_verdict_on_timeouts_and_errors():
+    timed_out = points(timings(lambda n: 1e-3)) + points([(10 ** 5, 0.0)], status="timeout")
+    assert complexity_verdict(timed_out, None, 10 ** 5, 1.0)["verdict"] == "fail"
+    assert complexity_verdict(points([(100, 0.0)], status="error"), None, None, 1.0)["verdict"] == "inconclusive"
@@ -0,0 +1,61 @@
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from app.backends import replica_pool
+from app.backends.replica_pool import ReplicaPoolBackend, _Replica
+
+
+class FakeProcess:
+    def __init__(self):
+        self.pid = 0
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.exitcode is None
+
+    def join(self, timeout=None):
+        self.exitcode = 0
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    monkeypatch.setattr(replica_pool, "REAP_INTERVAL_SECONDS", 0.2)
+    backend = ReplicaPoolBackend(SimpleNamespace())
+    backend._results = queue.Queue()
+    backend._replicas = [_Replica(index, [index], FakeProcess(), queue.Queue()) for index in range(2)]
+    backend._started = True
+    collector = threading.Thread(target=backend._collect, daemon=True)
+    collector.start()
+    yield backend, collector
+    backend.shutdown()
+
+
+def test_dead_replica_is_reaped_while_others_keep_returning_results(backend):
+    backend, _ = backend
+    busy, dying = backend._replicas
+    orphan = backend._submit(dying, "generate", None)
+    dying.process.exitcode = -9
+    deadline = time.time() + 3
+    while not orphan.done() and time.time() < deadline:
+        # Keep the results queue busy so the collector never sits idle for a full interval
+        future = backend._submit(busy, "generate", None)
+        request_id = max(backend._pending)
+        backend._results.put(("done", busy.index, request_id, "ok"))
+        assert future.result(timeout=1) == "ok"
+    with pytest.raises(RuntimeError, match="died"):
+        orphan.result(timeout=0)
+    assert not dying.alive
+    assert backend._least_loaded() is busy
+
+
+def test_shutdown_stops_the_collector_without_reporting_failures(backend, caplog):
+    backend, collector = backend
+    backend.shutdown()
+    collector.join(timeout=2)
+    assert not collector.is_alive()
+    assert all(replica.alive for replica in backend._replicas)
+    assert "exited with code" not in caplog.text
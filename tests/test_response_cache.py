@@ -0,0 +1,62 @@
+import dataclasses
+
+from app.agents.base_agent import LocalModelManager, SPARConfig
+from app.modules.response_cache import ResponseCache, response_key
+from app.modules.stopping import StopSpec
+
+
+class CountingBackend:
+    name = "fake"
+
+    def __init__(self):
+        self.calls = 0
+
+    def model_name(self, role):
+        return f"model-{role}"
+
+    def generate(self, prompt, max_tokens, **kwargs):
+        self.calls += 1
+        return f" reply {self.calls} "
+
+
+def manager(**config):
+    """A LocalModelManager wired to a fake backend, kept apart from the process-wide singleton"""
+    instance = object.__new__(LocalModelManager)
+    instance._config = dataclasses.replace(SPARConfig(), **config)
+    instance._backend = CountingBackend()
+    instance._response_cache = ResponseCache(8)
+    instance._initialized = True
+    return instance
+
+
+def test_key_ignores_field_order_but_not_values():
+    assert response_key(a=1, b=[1, 2]) == response_key(b=[1, 2], a=1)
+    assert response_key(a=1, b=[1, 2]) != response_key(a=1, b=[2, 1])
+
+
+def test_lru_bound_and_disk_entries_survive_a_restart(tmp_path):
+    cache = ResponseCache(1, str(tmp_path))
+    cache.put("k1", "one")
+    cache.put("k2", "two")
+    assert cache.stats()["entries"] == 1
+
+    restarted = ResponseCache(1, str(tmp_path))
+    assert restarted.get("k1") == "one"
+    assert restarted.get("missing") is None
+    assert restarted.stats()["disk_hits"] == 1 and restarted.stats()["misses"] == 1
+
+
+def test_seeded_generation_is_served_from_the_cache():
+    models = manager(do_sample=True, seed=7)
+    assert models.generate_content("hi", 16) == "reply 1"
+    assert models.generate_content("hi", 16) == "reply 1"
+    assert models.generate_content("hi", 32) == "reply 2"
+    assert models.generate_content("hi", 16, stop=StopSpec(stop_strings=["\n"])) == "reply 3"
+    assert models._backend.calls == 3
+
+
+def test_unseeded_sampling_bypasses_the_cache():
+    models = manager(do_sample=True, seed=-1)
+    assert models.generate_content("hi", 16) == "reply 1"
+    assert models.generate_content("hi", 16) == "reply 2"
+    assert models._response_cache.stats()["bypassed"] == 2
@@ -0,0 +1,44 @@
+from app.sandbox.result_cache import TestResultCache, source_key
+
+
+def reported(status, error=""):
+    return {"status": status, "error": error, "time": 0.01, "cpu_time": 0.01, "peak_rss_kb": 1000, "reported": True}
+
+
+def test_source_key_ignores_comments_and_formatting():
+    assert source_key("def f(x):\n    return x+1  # add one\n") == source_key("def f( x ):\n\n    return (x + 1)\n")
+    assert source_key("def f(x):\n    return x + 1\n") != source_key("def f(x):\n    return x + 2\n")
+
+
+def test_source_key_hashes_unparsable_source_as_is():
+    assert source_key("def f(:") == source_key("def f(:")
+    assert source_key("def f(:") != source_key("def f( :")
+
+
+def test_hit_after_reformatting_code_and_test():
+    cache = TestResultCache(8)
+    cache.put(source_key("def f():\n    return 1\n"), "assert f() == 1", reported("pass"))
+    hit = cache.get(source_key("def f():  # same\n    return (1)\n"), "assert f()==1")
+    assert hit["status"] == "pass"
+    assert cache.stats()["hits"] == 1
+
+
+def test_only_outcomes_the_harness_reported_are_cached():
+    cache = TestResultCache(8)
+    runner_made = {**reported("error", "Sandbox exited with code -9"), "reported": False}
+    cache.put("code", "assert a", runner_made)
+    cache.put("code", "assert b", reported("timeout", "Test execution timed out"))
+    cache.put("code", "assert c", reported("error", "MemoryError: "))
+    cache.put("code", "assert d", reported("error", "ZeroDivisionError: division by zero"))
+    assert [cache.get("code", test) is not None for test in ("assert a", "assert b", "assert c", "assert d")] == [False, False, False, True]
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = TestResultCache(2)
+    cache.put("code", "assert a", reported("pass"))
+    cache.put("code", "assert b", reported("pass"))
+    cache.get("code", "assert a")
+    cache.put("code", "assert c", reported("pass"))
+    assert cache.get("code", "assert b") is None
+    assert cache.get("code", "assert a") is not None
+    assert cache.stats()["entries"] == 2
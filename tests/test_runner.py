@@ -0,0 +1,56 @@
+import time
+
+from app.sandbox import SKIPPED_AFTER_FAILURE, TestBudget, run_in_sandbox
+from app.sandbox.runner import ADAPTIVE_TIMEOUT_FACTOR, ADAPTIVE_TIMEOUT_FLOOR_SECONDS, KILL_GRACE_SECONDS, combine_usage, resource_usage
+
+
+def test_timeout_adapts_to_the_slowest_finished_test():
+    budget = TestBudget(60, 5)
+    assert budget.test_timeout() == 5
+    budget.record(0.001)
+    assert budget.test_timeout() == ADAPTIVE_TIMEOUT_FLOOR_SECONDS
+    budget.record(0.2)
+    assert budget.test_timeout() == ADAPTIVE_TIMEOUT_FACTOR * 0.2
+    budget.record(3)
+    assert budget.test_timeout() == 5
+
+
+def test_deadline_never_passes_the_round_deadline():
+    budget = TestBudget(60, 5)
+    now = time.time()
+    assert budget.test_deadline(now) == now + 5 + KILL_GRACE_SECONDS
+    assert budget.test_deadline(now + 120) == budget.deadline
+    assert not budget.exhausted
+    assert TestBudget(0, 5).exhausted
+
+
+def test_fail_fast_skips_tests_after_the_first_failure():
+    code = "def solution(n):\n    return n\n"
+    tests = ["assert solution(1) == 1", "assert solution(2) == 3", "assert solution(3) == 3"]
+    results = run_in_sandbox(code, tests, TestBudget(30, 5), fail_fast=True)
+    assert [result["status"] for result in results] == ["pass", "fail", "skipped"]
+    assert results[2]["error"] == SKIPPED_AFTER_FAILURE
+
+    results = run_in_sandbox(code, tests, TestBudget(30, 5))
+    assert [result["status"] for result in results] == ["pass", "fail", "pass"]
+
+
+def test_resource_usage_rolls_up_only_measured_tests():
+    results = [
+        {"status": "pass", "time": 0.5, "cpu_time": 0.25, "peak_rss_kb": 2000},
+        {"status": "fail", "time": 1.0, "cpu_time": 0.75, "peak_rss_kb": 3000},
+        {"status": "timeout", "time": 9.0, "cpu_time": None, "peak_rss_kb": None},
+    ]
+    usage = resource_usage(results)
+    assert usage == {"tests_measured": 2, "cpu_time": 1.0, "wall_time": 1.5, "peak_rss_kb": 3000}
+    assert resource_usage([]) == {"tests_measured": 0, "cpu_time": 0, "wall_time": 0, "peak_rss_kb": 0}
+
+    total = combine_usage([usage, resource_usage(results[:1])])
+    assert total == {"rounds": 2, "tests_measured": 3, "cpu_time": 1.25, "wall_time": 2.0, "peak_rss_kb": 3000}
+
+
+def test_sandbox_reports_cpu_time_and_peak_rss():
+    code = "def solution(n):\n    return sum(range(n))\n"
+    result = run_in_sandbox(code, ["assert solution(10 ** 5) == 4999950000"], TestBudget(30, 5))[0]
+    assert result["status"] == "pass"
+    assert result["cpu_time"] >= 0 and result["peak_rss_kb"] > 0
@@ -0,0 +1,56 @@
+from types import SimpleNamespace
+
+from app.sandbox import SandboxPool, TestBudget, current_pool, get_pool, run_in_sandbox, shutdown_pool
+
+# Each call bumps a module-level counter and a memo dict, so a test only passes if it sees
+# the candidate's globals exactly as loading left them
+STATEFUL_CODE = """
+count = 0
+memo = {}
+
+def solution(n):
+    global count
+    count += 1
+    memo[n] = memo.get(n, 0) + 1
+    return count + memo[n]
+"""
+STATEFUL_TESTS = ["assert solution(0) == 2"] * 3
+
+
+def test_module_state_does_not_leak_between_tests():
+    results = run_in_sandbox(STATEFUL_CODE, STATEFUL_TESTS, TestBudget(30, 5))
+    assert [result["status"] for result in results] == ["pass"] * 3
+
+
+def test_module_state_does_not_leak_between_pooled_jobs():
+    pool = SandboxPool(1)
+    try:
+        for _ in range(2):
+            results = run_in_sandbox(STATEFUL_CODE, STATEFUL_TESTS, TestBudget(30, 5), pool=pool)
+            assert [result["status"] for result in results] == ["pass"] * 3
+    finally:
+        pool.shutdown()
+
+
+def test_interpreter_state_is_restored_between_pooled_jobs():
+    pool = SandboxPool(1)
+    patching = "import builtins, math, sys\nsys.setrecursionlimit(50)\nmath.sqrt = lambda x: 0\nbuiltins.len = lambda x: 0\n"
+    checking = "import math, sys\ndef solution():\n    return sys.getrecursionlimit(), math.sqrt(4), len([1])\n"
+    try:
+        run_in_sandbox(patching, ["assert True"], TestBudget(30, 5), pool=pool)
+        results = run_in_sandbox(checking, ["assert solution() == (1000, 2.0, 1)"], TestBudget(30, 5), pool=pool)
+        assert results[0]["status"] == "pass"
+        assert pool.stats()["recycled"]["dirty"] == 0
+    finally:
+        pool.shutdown()
+
+
+def test_current_pool_does_not_start_one():
+    shutdown_pool()
+    assert current_pool() is None
+    pool = get_pool(SimpleNamespace(sandbox_pool_size=1, sandbox_worker_max_jobs=5))
+    try:
+        assert current_pool() is pool
+    finally:
+        shutdown_pool()
+    assert current_pool() is None
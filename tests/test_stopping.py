@@ -0,0 +1,40 @@
+from app.modules.stopping import MAX_SERVER_STOP_STRINGS, StopSpec
+
+
+def test_cuts_before_the_earliest_stop_string():
+    spec = StopSpec(stop_strings=("\nclass", "\ndef"))
+    text = "def f():\n    return 1\ndef g():\n    pass\nclass A: pass"
+    assert spec.find_end(text) == text.index("\ndef")
+    assert spec.trim(text) == "def f():\n    return 1"
+    assert StopSpec(stop_strings=("###",)).find_end("no stop yet") is None
+
+
+def test_fence_cut_waits_for_the_closing_fence():
+    spec = StopSpec(stop_on_fence=True)
+    assert spec.find_end("```python\nx = 1\n") is None
+    text = "```python\nx = 1\n```\nmore prose"
+    assert spec.trim(text) == "```python\nx = 1\n```"
+
+
+def test_max_lines_counts_only_complete_lines_while_decoding():
+    spec = StopSpec(line_pattern=r"assert ", max_lines=2)
+    partial = "assert f(1) == 1\nassert f(2) =="
+    assert spec.find_end(partial) is None
+    assert spec.find_end(partial, final=True) == len(partial)
+    text = "assert f(1) == 1\nnote\nassert f(2) == 2\nassert f(3) == 3\n"
+    assert spec.trim(text) == "assert f(1) == 1\nnote\nassert f(2) == 2"
+
+
+def test_end_pattern_cuts_after_the_match():
+    spec = StopSpec(end_pattern=r"\}\s*$")
+    assert spec.trim('{"a": 1}\n') == '{"a": 1}\n'
+    assert StopSpec(end_pattern=r"END").trim("body END trailing") == "body END"
+
+
+def test_needs_client_side():
+    assert not StopSpec().needs_client_side
+    assert not StopSpec(stop_strings=tuple(f"s{i}" for i in range(MAX_SERVER_STOP_STRINGS))).needs_client_side
+    assert StopSpec(stop_strings=tuple(f"s{i}" for i in range(MAX_SERVER_STOP_STRINGS + 1))).needs_client_side
+    assert StopSpec(stop_on_fence=True).needs_client_side
+    assert StopSpec(line_pattern="x", max_lines=1).needs_client_side
+    assert StopSpec(end_pattern="x").needs_client_side
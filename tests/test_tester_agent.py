@@ -0,0 +1,47 @@
+import dataclasses
+
+from app.agents.base_agent import SPARConfig
+from app.agents import tester_agent
+
+CODE = "def solution(n):\n    return n * 2\n"
+TESTS = ["assert solution(1) == 2", "assert solution(2) == 4", "assert solution(3) == 7", "assert solution(4) == 8"]
+
+
+def agent(**config):
+    """A TesterAgent that runs tests in fresh sandbox processes, without loading a model"""
+    tester = object.__new__(tester_agent.TesterAgent)
+    tester.config = dataclasses.replace(SPARConfig(), sandbox_pool_size=-1, test_cache_size=0, **config)
+    return tester
+
+
+def previous_round(failed):
+    return {"detailed_test_results": [{"test": test, "status": "fail" if test in failed else "pass"} for test in TESTS]}
+
+
+def test_tests_that_failed_before_run_first():
+    order = []
+    result = agent(test_fail_fast=False).run_tests(
+        CODE, TESTS, on_result=lambda r: order.append(r["test"]), previous=previous_round({TESTS[1]})
+    )
+    assert order[0] == TESTS[1]
+    assert result["passed"] == 3 and result["skipped"] == 0
+    assert sorted(result["executed_tests"]) == sorted(TESTS)
+
+
+def test_a_retest_that_still_fails_skips_the_rest():
+    result = agent(test_fail_fast=False).run_tests(CODE, TESTS, previous=previous_round({TESTS[2]}))
+    assert result["executed_tests"] == [TESTS[2]]
+    assert result["skipped_tests"] == [TESTS[0], TESTS[1], TESTS[3]]
+    assert result["status"] == "fail" and result["error"] == "solution(3) returned 6, expected 7"
+
+
+def test_without_previous_every_test_runs():
+    result = agent(test_fail_fast=False).run_tests(CODE, TESTS)
+    assert result["passed"] == 3 and result["skipped"] == 0
+
+
+def test_rejected_code_is_never_run():
+    result = agent().run_tests("import os\ndef solution(n):\n    os.system('true')\n", TESTS)
+    assert result["skipped"] == len(TESTS)
+    assert result["detailed_test_results"][0]["error"] == tester_agent.REJECTED_BY_ANALYSIS
+    assert result["executed_tests"] == []